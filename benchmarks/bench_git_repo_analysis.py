@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+# Benchmark of the co-editing analysis of a git files log: a single file
+# edited by 20 authors in turn, with a growing number of commits.
+#
+# Usage:
+#   python benchmarks/bench_git_repo_analysis.py [TREE] [COMMITS ...]
+#
+# TREE is the checkout of platform_analysis to measure (default: this
+# one). The "before" numbers of the quadratic implementation come from a
+# checkout of the parent of its replacement, e.g.:
+#   git worktree add /tmp/before 983855d~1
+#   python benchmarks/bench_git_repo_analysis.py /tmp/before 100 400 1600
+#
+
+import os
+import sys
+import time
+import datetime
+
+import networkx as nx
+
+
+# The default number of commits of each run
+default_sizes = [100, 400, 1600, 6400, 25600]
+
+# The number of authors editing the file
+authors = 20
+
+
+def synthetic_files_log(commits):
+    """
+    Build a git files log of a single file with a commit per hour, each
+    one by the next of the authors.
+    """
+
+    first_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    history = []
+    for i in range(commits):
+        author = "author%d" % (i % authors)
+        date = first_date + datetime.timedelta(hours=i)
+        history.append({
+            "@node": "%040x" % i,
+            "author": {"#text": author, "@email": author + "@example.com"},
+            "date": date.strftime("%a, %d %b %Y %H:%M:%S %z"),
+            "msg": "commit %d" % i
+        })
+
+    return {"file": history}
+
+
+def benchmark(sizes):
+    """
+    Time git_repo_analysis on a synthetic files log of each size.
+    """
+
+    from platform_analysis import git
+
+    print("%8s %10s %10s" % ("commits", "seconds", "edges"))
+    for commits in sizes:
+        files_log = synthetic_files_log(commits)
+        start = time.perf_counter()
+        graph = git.git_repo_analysis(files_log, nx.MultiDiGraph())
+        elapsed = time.perf_counter() - start
+        print("%8d %10.2f %10d" % (commits, elapsed, graph.number_of_edges()))
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    tree = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    if len(arguments) > 0 and not arguments[0].isdigit():
+        tree = arguments.pop(0)
+    sys.path.insert(0, os.path.abspath(tree))
+    benchmark([int(i) for i in arguments] or default_sizes)
@@ -0,0 +1,89 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+# Benchmark of time_analysis on the time series of a synthetic graph of
+# 50 users and 3 types of interaction, with a growing number of rows.
+#
+# Usage:
+#   python benchmarks/bench_time_analysis.py [TREE] [ROWS ...]
+#
+# TREE is the checkout of platform_analysis to measure (default: this
+# one). The "before" numbers of the iterrows implementation come from a
+# checkout of the parent of its replacement, e.g.:
+#   git worktree add /tmp/before 4f2939f~1
+#   python benchmarks/bench_time_analysis.py /tmp/before 500 2000
+#
+
+import os
+import sys
+import time
+import random
+import inspect
+import datetime
+
+import networkx as nx
+
+
+# The default number of rows of each run
+default_sizes = [500, 2000, 50000, 500000]
+
+# The users and the types of their interactions
+users = ["user%d" % i for i in range(50)]
+interaction_types = ["commit", "issue comment", "fork"]
+
+
+def synthetic_graph(rows):
+    """
+    Build a graph of rows interactions between random users, one every
+    37 minutes.
+    """
+
+    random.seed(rows)
+    graph = nx.MultiDiGraph()
+    first_date = datetime.datetime(2020, 1, 1)
+    for i in range(rows):
+        graph.add_edge(
+            random.choice(users), random.choice(users),
+            type=random.choice(interaction_types),
+            start=first_date + datetime.timedelta(minutes=37 * i),
+            endopen=2026)
+
+    return graph
+
+
+def benchmark(sizes):
+    """
+    Time time_analysis of the users on a synthetic time series of each
+    size, by timestamp and, if available, by week.
+    """
+
+    from platform_analysis import sna
+
+    weekly = "freq" in inspect.signature(sna.time_analysis).parameters
+    print("%8s %10s %10s" % ("rows", "seconds", "weekly"))
+    for rows in sizes:
+        data = sna.graph_to_pandas_time_series(synthetic_graph(rows))
+        start = time.perf_counter()
+        sna.time_analysis(data, "user", 0, "combined")
+        elapsed = time.perf_counter() - start
+        if weekly:
+            start = time.perf_counter()
+            sna.time_analysis(data, "user", 0, "combined", freq="W")
+            print("%8d %10.3f %10.3f" % (
+                rows, elapsed, time.perf_counter() - start))
+        else:
+            print("%8d %10.3f %10s" % (rows, elapsed, "-"))
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    tree = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    if len(arguments) > 0 and not arguments[0].isdigit():
+        tree = arguments.pop(0)
+    sys.path.insert(0, os.path.abspath(tree))
+    benchmark([int(i) for i in arguments] or default_sizes)
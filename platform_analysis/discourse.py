@@ -11,19 +11,39 @@
 import re
 from pydiscourse import DiscourseClient
 import networkx as nx
+from . import utils
 import datetime
 from time import sleep
 
 
-def discourse_topic_discussion_analysis(discussion):
+def discourse_topic_discussion_analysis(discussion, aggregate=False,
+                                        timestamps=False, compact=False,
+                                        session=None):
     """
     Analyse the discussion of a single Discourse topic (thread of posts).
     Add edges to the graph and return a graph of the specified discussion.
+    With compact, the interactions are stored in an edge store (see
+    utils.compact_graph). With session, the edge keys are counted by the
+    session, so that the graphs of many topics can be merged.
     """
 
     # Local graph variable
     local_graph = nx.MultiDiGraph()
 
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(local_graph, timestamps=timestamps)
+
+    # Store the interactions as columns, if required
+    if compact:
+        utils.compact_graph(local_graph)
+
+    def next_key():
+        return session.next_key() if session is not None else None
+
+    # The same end year for all the edges of this analysis
+    endopen = datetime.datetime.now().year
+
     # Check all the posts in the topic
     for j, f in enumerate(discussion):
         # Add an edge when the reply was specific to a post
@@ -31,8 +51,10 @@ def discourse_topic_discussion_analysis(discussion):
             # Find the author of the post replid by post number
             for t in discussion:
                 if t["post_number"] == f["reply_to_post_number"]:
-                    local_graph.add_edge(
+                    utils.add_interaction(
+                        local_graph,
                         f["author"]["#text"], t["author"]["#text"],
+                        key=next_key(),
                         type="Direct reply to post in a Discourse topic",
                         slug=f["slug"],
                         title=f["title"],
@@ -42,7 +64,7 @@ def discourse_topic_discussion_analysis(discussion):
                         node=f["@node"],
                         msg=f["msg"],
                         start=f["date"],
-                        endopen=datetime.datetime.now().year)
+                        endopen=endopen)
 
         # Check if there are any username mentions in the body of each
         # comment, and add an edge if there are any
@@ -52,8 +74,10 @@ def discourse_topic_discussion_analysis(discussion):
             start_of_mention = message_body.find('">', m.end())+len('">')
             end_of_mention = message_body.find('<', start_of_mention)
             user_mentioned = message_body[start_of_mention:end_of_mention].replace("@","")
-            local_graph.add_edge(
+            utils.add_interaction(
+                local_graph,
                 f["author"]["#text"], user_mentioned,
+                key=next_key(),
                 type="Mention in a Discourse post",
                 slug=f["slug"],
                 title=f["title"],
@@ -62,12 +86,14 @@ def discourse_topic_discussion_analysis(discussion):
                 node=f["@node"],
                 start=f["date"],
                 msg=f["msg"],
-                endopen=datetime.datetime.now().year)
+                endopen=endopen)
 
         # Add an edge to all the previous participants in the discussion
         for k in discussion[:j]:
-            local_graph.add_edge(
+            utils.add_interaction(
+                local_graph,
                 f["author"]["#text"], k["author"]["#text"],
+                key=next_key(),
                 type="Joining the discussion with previous posts in a Discourse topic",
                 slug=f["slug"],
                 title=f["title"],
@@ -76,7 +102,7 @@ def discourse_topic_discussion_analysis(discussion):
                 node=f["@node"],
                 msg=f["msg"],
                 start=f["date"],
-                endopen=datetime.datetime.now().year)
+                endopen=endopen)
 
     return local_graph
 
@@ -118,9 +144,12 @@ def get_discourse_content(url, api_username, api_key):
     return paginated_content
 
 
-def discourse_analysis(url, api_username, api_key):
+def discourse_analysis(url, api_username, api_key, aggregate=False,
+                       timestamps=False, compact=False):
     """
     Analyse a Discourse instance.
+    With compact, the interactions are stored in an edge store (see
+    utils.compact_graph).
     """
 
     # Get data
@@ -128,6 +157,13 @@ def discourse_analysis(url, api_username, api_key):
 
     # Local graph variable
     local_graph = nx.MultiDiGraph()
+    if aggregate:
+        utils.aggregate_graph(local_graph, timestamps=timestamps)
+    if compact:
+        utils.compact_graph(local_graph)
+
+    # The edge keys of all the topics
+    session = utils.AnalysisSession(graph=local_graph)
 
     # Connect with the Discourse API
     client = DiscourseClient(url, api_username=api_username, api_key=api_key)
@@ -214,9 +250,13 @@ def discourse_analysis(url, api_username, api_key):
                             topic_posts_ordered[i['@node']].append(i)
 
                     # Analyse the posts
-                    new_graph = discourse_topic_discussion_analysis(topic_posts)
-                    # Join the graphs
-                    final_graph = nx.compose(new_graph, local_graph)
+                    new_graph = discourse_topic_discussion_analysis(
+                        topic_posts, aggregate=aggregate,
+                        timestamps=timestamps, compact=compact,
+                        session=session)
+                    # Join the graphs, keeping the edge store, if any
+                    utils.merge_graph(new_graph, local_graph)
+                    final_graph = local_graph
 
                     # Add missing user information
                     for username, data in final_graph.nodes(data=True):
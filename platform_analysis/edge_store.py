@@ -0,0 +1,419 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import os
+import json
+import array
+import datetime
+import numpy
+from dateutil.parser import parse
+
+
+# The start of the interactions is stored as microseconds since the epoch,
+# with two special values for a missing start and a start that is None
+missing_start = -2 ** 63
+none_start = -2 ** 63 + 1
+
+# The UTC offset of the start is stored as seconds, with a special value
+# for the naive starts
+naive_offset = -2 ** 31
+
+# The epoch of the timestamps
+epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# The attributes of the interactions that have their own column: all the
+# others are stored in extra columns, created when first used
+value_columns = ("type", "node", "msg", "endopen")
+
+
+class EdgeStore(object):
+    """
+    The interactions of a graph stored as columns of arrays instead of a
+    dict for each edge: the users, the types, the commits (node), the
+    messages and any other value are interned in a table of values, so that
+    each interaction stores only their ids and its start as an int64
+    number of microseconds, with its UTC offset as an int32 number of
+    seconds: the starts come back as datetimes with the same UTC offset
+    (as a fixed timezone), or naive if they were naive. Starts that are
+    date strings come back as datetimes, and numbers (timestamps) as UTC
+    datetimes.
+    The edges method reads the interactions like the edges of a NetworkX
+    MultiDiGraph, and to_graph copies them into one.
+    """
+
+    def __init__(self):
+        # The table of the interned values and their ids
+        self.values = []
+        self.value_ids = {}
+        # A column for each attribute of the interactions
+        self.sources = array.array("i")
+        self.targets = array.array("i")
+        self.keys = array.array("q")
+        self.starts = array.array("q")
+        self.offsets = array.array("i")
+        self.columns = {name: array.array("i") for name in value_columns}
+        self.extra = {}
+        # The keys that are not integers, by row
+        self.other_keys = {}
+
+    def intern(self, value):
+        """
+        Return the id of a value in the table of values, adding it if new.
+        """
+
+        # The type is part of the identity of the values that are not
+        # strings, since 1 == 1.0 == True
+        if type(value) is str:
+            identity = value
+        else:
+            identity = (type(value), value)
+        try:
+            value_id = self.value_ids.get(identity)
+        except TypeError:
+            # Values that cannot be hashed (like the timestamps of the
+            # weighted edges) are not shared
+            self.values.append(value)
+            return len(self.values) - 1
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(value)
+            self.value_ids[identity] = value_id
+
+        return value_id
+
+    def add(self, source, target, key=None, **attributes):
+        """
+        Add an interaction between two users. Without a key, its row is
+        its key (unlike NetworkX, which counts the edges between them).
+        """
+
+        # The columns of a loaded store are copied before the first change
+        if isinstance(self.sources, numpy.ndarray):
+            self.make_writable()
+
+        row = len(self.sources)
+        self.sources.append(self.intern(source))
+        self.targets.append(self.intern(target))
+
+        # Integer keys are stored in their column, any other key by row
+        if isinstance(key, int) and not isinstance(key, bool):
+            self.keys.append(key)
+        else:
+            self.keys.append(row)
+            if key is not None:
+                self.other_keys[row] = key
+
+        # The start as microseconds since the epoch
+        found = 0
+        if "start" not in attributes:
+            self.starts.append(missing_start)
+            self.offsets.append(0)
+        else:
+            found += 1
+            if attributes["start"] is None:
+                self.starts.append(none_start)
+                self.offsets.append(0)
+            else:
+                start = to_datetime(attributes["start"])
+                self.starts.append(to_microseconds(start))
+                self.offsets.append(utc_offset_of(start))
+
+        for name in value_columns:
+            if name in attributes:
+                found += 1
+                self.columns[name].append(self.intern(attributes[name]))
+            else:
+                self.columns[name].append(-1)
+
+        # Any other attribute, padding its column for the previous rows
+        if found < len(attributes):
+            for name, value in attributes.items():
+                if name == "start" or name in self.columns:
+                    continue
+                if name not in self.extra:
+                    self.extra[name] = array.array("i", [-1]) * row
+                self.extra[name].append(self.intern(value))
+        for name in self.extra:
+            if len(self.extra[name]) == row:
+                self.extra[name].append(-1)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def number_of_edges(self):
+        """
+        Return the number of interactions.
+        """
+
+        return len(self.sources)
+
+    def key_of(self, row):
+        """
+        Return the key of the interaction in a row.
+        """
+
+        if row in self.other_keys:
+            return self.other_keys[row]
+
+        return int(self.keys[row])
+
+    def data_of(self, row):
+        """
+        Return the attributes of the interaction in a row as a new dict.
+        """
+
+        data = {}
+        for name, column in self.columns.items():
+            if column[row] != -1:
+                data[name] = self.values[column[row]]
+        for name, column in self.extra.items():
+            if column[row] != -1:
+                data[name] = self.values[column[row]]
+        if self.starts[row] == none_start:
+            data["start"] = None
+        elif self.starts[row] != missing_start:
+            data["start"] = from_microseconds(
+                int(self.starts[row]), int(self.offsets[row]))
+
+        return data
+
+    def edges(self, keys=False, data=False, default=None):
+        """
+        Iterate over the interactions like the edges of a MultiDiGraph:
+        (source, target), with the key if keys, and with the dict of the
+        attributes if data is True, or the value of one of them if data is
+        its name.
+        """
+
+        for row in range(len(self.sources)):
+            edge = (self.values[self.sources[row]],
+                    self.values[self.targets[row]])
+            if keys:
+                edge += (self.key_of(row),)
+            if data is True:
+                edge += (self.data_of(row),)
+            elif data is not False:
+                edge += (self.data_of(row).get(data, default),)
+            yield edge
+
+    def to_graph(self, graph):
+        """
+        Add all the interactions to a NetworkX MultiDiGraph.
+        """
+
+        for source, target, key, data in self.edges(keys=True, data=True):
+            graph.add_edge(source, target, key=key, **data)
+
+        return graph
+
+    def nbytes(self):
+        """
+        Return the bytes used by the columns of the interactions.
+        """
+
+        columns = [self.sources, self.targets, self.keys, self.starts,
+                   self.offsets]
+        columns.extend(self.columns.values())
+        columns.extend(self.extra.values())
+
+        return sum(c.itemsize * len(c) for c in columns)
+
+    def named_columns(self):
+        """
+        Return a list of the names and the arrays of all the columns.
+        """
+
+        columns = [("sources", self.sources), ("targets", self.targets),
+                   ("keys", self.keys), ("starts", self.starts),
+                   ("offsets", self.offsets)]
+        columns.extend(sorted(self.columns.items()))
+        columns.extend(
+            ("extra_%d" % k, self.extra[name])
+            for k, name in enumerate(sorted(self.extra)))
+
+        return columns
+
+    def make_writable(self):
+        """
+        Copy the columns of a loaded store into arrays that can grow.
+        """
+
+        for name in ("sources", "targets", "keys", "starts", "offsets"):
+            column = getattr(self, name)
+            setattr(self, name, array.array(
+                column.dtype.char if column.dtype.char != "l" else "q",
+                column.tobytes()))
+        for columns in (self.columns, self.extra):
+            for name in columns:
+                columns[name] = array.array("i", columns[name].tobytes())
+
+    def save(self, path):
+        """
+        Save the store in the directory at path: a .npy file for each
+        column, and the table of values as JSON.
+        """
+
+        os.makedirs(path, exist_ok=True)
+        for name, column in self.named_columns():
+            numpy.save(os.path.join(path, name + ".npy"),
+                       numpy.asarray(column))
+
+        manifest = {
+            "extra": sorted(self.extra),
+            "other keys": [[row, encode_value(key)]
+                           for row, key in self.other_keys.items()]
+        }
+        with open(os.path.join(path, "store.json"), "w") as store_file:
+            json.dump(manifest, store_file)
+        with open(os.path.join(path, "values.json"), "w") as values_file:
+            json.dump([encode_value(v) for v in self.values], values_file)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a store saved with save. With mmap, the columns are memory
+        mapped from their files instead of being read, until the store
+        is changed.
+        """
+
+        with open(os.path.join(path, "store.json")) as store_file:
+            manifest = json.load(store_file)
+        with open(os.path.join(path, "values.json")) as values_file:
+            values = [decode_value(v) for v in json.load(values_file)]
+
+        store = cls()
+        store.values = values
+        for value_id, value in enumerate(values):
+            try:
+                if type(value) is str:
+                    store.value_ids[value] = value_id
+                else:
+                    store.value_ids[(type(value), value)] = value_id
+            except TypeError:
+                pass
+        store.extra = {name: None for name in manifest["extra"]}
+        store.other_keys = {
+            row: decode_value(key) for row, key in manifest["other keys"]}
+
+        mmap_mode = "r" if mmap else None
+        for name, column in store.named_columns():
+            column_path = os.path.join(path, name + ".npy")
+            # The stores saved without offsets have UTC starts
+            if name == "offsets" and not os.path.isfile(column_path):
+                store.offsets = numpy.zeros(len(store.sources), "i")
+                continue
+            column = numpy.load(column_path, mmap_mode=mmap_mode)
+            if name in ("sources", "targets", "keys", "starts", "offsets"):
+                setattr(store, name, column)
+            elif name in store.columns:
+                store.columns[name] = column
+            else:
+                extra_name = manifest["extra"][int(name.split("_")[1])]
+                store.extra[extra_name] = column
+
+        return store
+
+
+def encode_value(value):
+    """
+    Convert a value of an attribute to JSON, keeping its type for the
+    datetimes, the arrays and the tuples.
+    """
+
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, array.array):
+        return {"array": value.typecode, "items": value.tolist()}
+    if isinstance(value, tuple):
+        return {"tuple": [encode_value(v) for v in value]}
+    if isinstance(value, dict):
+        return {"dict": [[k, encode_value(v)] for k, v in value.items()]}
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+
+    return value
+
+
+def decode_value(value):
+    """
+    Convert a value encoded with encode_value back.
+    """
+
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "datetime" in value:
+        return datetime.datetime.fromisoformat(value["datetime"])
+    if "array" in value:
+        return array.array(value["array"], value["items"])
+    if "tuple" in value:
+        return tuple(decode_value(v) for v in value["tuple"])
+
+    return {k: decode_value(v) for k, v in value["dict"]}
+
+
+def to_datetime(date):
+    """
+    Convert the start of an interaction (a datetime, a date string or a
+    number) to a datetime. Numbers are timestamps, converted to UTC.
+    """
+
+    if isinstance(date, datetime.datetime):
+        return date
+    if isinstance(date, (int, float)):
+        return epoch + datetime.timedelta(microseconds=round(date * 1000000))
+
+    return parse(str(date))
+
+
+def to_microseconds(date):
+    """
+    Convert the start of an interaction (a datetime, a date string or a
+    number) to microseconds since the epoch.
+    Naive datetimes are considered UTC.
+    """
+
+    date = to_datetime(date)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+
+    return (date - epoch) // datetime.timedelta(microseconds=1)
+
+
+def utc_offset_of(date):
+    """
+    Return the UTC offset of a datetime in seconds, or naive_offset.
+    """
+
+    offset = date.utcoffset()
+    if offset is None:
+        return naive_offset
+
+    return int(offset.total_seconds())
+
+
+def from_microseconds(microseconds, offset=0):
+    """
+    Convert microseconds since the epoch to a datetime with a UTC offset
+    in seconds, or to a naive one with naive_offset.
+    """
+
+    date = epoch + datetime.timedelta(microseconds=microseconds)
+    if offset == naive_offset:
+        return date.replace(tzinfo=None)
+    if offset == 0:
+        return date
+
+    return date.astimezone(
+        datetime.timezone(datetime.timedelta(seconds=offset)))
+
+
+if __name__ == "__main__":
+    pass
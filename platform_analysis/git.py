@@ -7,39 +7,146 @@
 # License: LGPL v.3
 #
 
-import re
 import subprocess
 import os
 import shutil
-import json
-from splitstream import splitfile
-from io import BytesIO
-import unicodedata
+import fcntl
+import hashlib
+import tempfile
 from collections import OrderedDict
 from dateutil.parser import parse
 
 from . import github_analysis
+from . import utils
 
 import networkx as nx
-import datetime
 
 
 def convert_log_to_dict(input_text):
     """
     Convert the git log output to json.
+    The output can also be a stream, which is read incrementally: the logs
+    of this module are read with iter_commits_log instead, since the JSON
+    pretty format breaks on names and messages with quotes.
     """
 
-    items = []
-    #if type(input_text) != "str":
-    #    input_text = input_text.decode('utf-8')
-    f = BytesIO(input_text)
-    for jsonstr in splitfile(f, format="json"):
-        try:
-            items.append(json.loads(jsonstr))
-        except Exception as e:
-            return e
+    return utils.convert_log_to_dict(input_text)
+
+
+# The pretty format for a single commit record of the log: each record starts
+# with a record separator, and its fields are divided by unit separators
+log_record_format = "%x1e%H%x1f%aD%x1f%f%x1f%aN%x1f%aE%x1f%cN%x1f%cE%x1f"
+
+
+def read_log_records(stream, chunk_size=65536):
+    """
+    Read the records of a git log from a stream, one commit at a time.
+    Only the current record is kept in memory, however long the log is.
+    """
+
+    # The pieces of the current record, which can span many chunks
+    pending = []
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        # Split only the new chunk, and join the pieces of a record once
+        records = chunk.split(b"\x1e")
+        if len(records) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(records[0])
+        first_record = b"".join(pending)
+        if first_record != b"":
+            yield first_record
+        for record in records[1:-1]:
+            if record != b"":
+                yield record
+        # Keep the last (partial) record
+        pending = [records[-1]]
+
+    last_record = b"".join(pending)
+    if last_record != b"":
+        yield last_record
+
+
+def parse_log_record(record):
+    """
+    Convert a single git log record into a commit dict, with the list of
+    the files changed by the commit.
+    """
+
+    record = record.decode("utf-8", "replace")
+
+    # Split the commit fields from the --name-status -z output
+    header, separator, files_output = record.rpartition("\x1f")
+    fields = header.split("\x1f")
+
+    commit = {
+        "@node": fields[0],
+        "date": fields[1],
+        "msg": fields[2],
+        "author": {
+            "#text": fields[3],
+            "@email": fields[4]
+        },
+        "committer": {
+            "#text": fields[5],
+            "@email": fields[6]
+        },
+        "files": []
+    }
+
+    # Each file is an action followed by one path, or by two paths for
+    # renames and copies
+    tokens = files_output.lstrip("\n").split("\0")
+    position = 0
+    while position < len(tokens):
+        action = tokens[position]
+        if action == "":
+            position += 1
+            continue
+        if action[0] in ("R", "C"):
+            commit["files"].append({
+                "@action": action,
+                "#text": tokens[position + 2],
+                "@copyfrom-path": tokens[position + 1]
+            })
+            position += 3
+        else:
+            commit["files"].append({
+                "@action": action,
+                "#text": tokens[position + 1]
+            })
+            position += 2
+
+    return commit
+
+
+def iter_commits_log(path, extra_args=None):
+    """
+    Run git log once and yield each commit of a git repository, with the
+    files changed in it, while the log is still being read from the pipe.
+    """
+
+    command = ['git', 'log', '--name-status', '-z',
+               '--pretty=format:' + log_record_format]
+    if extra_args is not None:
+        command.extend(extra_args)
+    else:
+        # Report renames as a deletion and an addition, like diff-tree does
+        command.append('--no-renames')
+
+    process = subprocess.Popen(command, cwd=path, stdout=subprocess.PIPE)
+    try:
+        for record in read_log_records(process.stdout):
+            yield parse_log_record(record)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
 
-    return items
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
 
 
 def get_commits_log(path):
@@ -47,61 +154,21 @@ def get_commits_log(path):
     Get the history of the commits of a git repository into a dict.
     """
 
-    # The pretty format for all the information from the log
-    log_pretty_format = '''{%n
-    "@node": "%H",%n
-    "date": "%aD",%n
-    "msg": "%f",%n
-    "author": {%n
-    "#text": "%aN",%n
-    "@email": "%aE"%n
-    },%n
-    "committer": {%n
-    "#text": "%cN",%n
-    "@email": "%cE"%n
-    }%n},'''
-
-    # Get the verbose log in json
-    git_log = subprocess.check_output(
-        ['git', 'log', '--pretty=format:' + log_pretty_format], cwd=path)
-
-    # Convert to a dict
-    all_commits = convert_log_to_dict(git_log)
-
-    # Do a diff-tree for each commit
-    for i in all_commits:
-
-        # Load the current commit id
-        current_commit = unicodedata.normalize(
-            'NFKD', i["@node"]).encode('ascii', 'ignore')
-
-        # Create the command for diff-tree
-        current_command = 'git diff-tree --no-commit-id --name-status -r ' + \
-            current_commit
-
-        # Get the log of the files for the current commit
-        git_commit_files_log = subprocess.check_output(
-            [current_command], cwd=path, shell=True)
-
-        # Split the output in a list of files
-        current_files_list = [
-            line for line in git_commit_files_log.split('\n')
-            if line.strip() != ''
-        ]
-
-        # Create an empty dict for files for the current commit
-        i["paths"] = {}
-
-        # Cycle through each file changed in the current commit
-        for k, j in enumerate(current_files_list):
-            # Split action and filename, and save them as a dict
-            each_file_info = j.split('\t')
-
-            i["paths"][k] = {
-                "@action": each_file_info[0],
-                "#text": each_file_info[1]
+    all_commits = []
+
+    # Read the log and the files changed at each commit in a single pass
+    for commit in iter_commits_log(path):
+
+        # Create a dict for files for the current commit
+        commit["paths"] = {}
+        for k, each_file in enumerate(commit.pop("files")):
+            commit["paths"][k] = {
+                "@action": each_file["@action"],
+                "#text": each_file["#text"]
             }
 
+        all_commits.append(commit)
+
     # Format the log like hg and svn
     all_commits = {"log": {"logentry": all_commits}}
 
@@ -109,74 +176,34 @@ def get_commits_log(path):
     return all_commits
 
 
-def get_files_log(path):
+def build_files_history(commits, follow_renames=True, renamed_to=None):
+    """
+    Invert a stream of commits into the history of each file.
+    See utils.build_files_history.
+    """
+
+    return utils.build_files_history(
+        commits, follow_renames=follow_renames, renamed_to=renamed_to)
+
+
+def get_files_log(path, follow_renames=True, revisions=None):
     """
     Get the history of each edited file in a git repository into a dict.
+    With revisions (like "v1.0..v2.0"), only the commits of that revision
+    range are read.
     """
 
-    # The pretty format for the file log
-    log_pretty_format = '''{%n
-    "@node": "%H",%n
-    "date": "%aD",%n
-    "msg": "%f",%n
-    "author": {%n
-    "#text": "%aN",%n
-    "@email": "%aE"%n
-    },%n
-    "committer": {%n
-    "#text": "%cN",%n
-    "@email": "%cE"%n
-    }%n},'''
-
-    # Get the verbose log in json
-    git_log = subprocess.check_output(
-        ['git', 'log', '--pretty=format:' + log_pretty_format], cwd=path)
-
-    # Convert to a dict
-    all_commits = convert_log_to_dict(git_log)
-
-    # Create a list of edited files
-    edited_files = []
-
-    # Do a diff-tree for each commit
-    for i in all_commits:
-
-        # Load the current commit id
-        current_commit = unicodedata.normalize(
-            'NFKD', i["@node"]).encode('ascii', 'ignore')
-
-        # Create the command for diff-tree
-        current_command = 'git diff-tree --no-commit-id --name-status -r ' + \
-            current_commit.decode('utf-8')
-
-        # Get the log of the files for the current commit
-        git_commit_files_log = subprocess.check_output(
-            [current_command], cwd=path, shell=True)
-
-        # Split the output in a list of files
-        git_commit_files_log = git_commit_files_log.decode('utf-8')
-        current_files_list = [
-            line for line in git_commit_files_log.split('\n')
-            if line.strip() != ''
-        ]
-
-        # Cycle through each file changed in the current commit
-        for k, j in enumerate(current_files_list):
-            # Split action and filename, and save them as a dict
-            each_file_info = j.split('\t')
-            if each_file_info[1] not in edited_files:
-                edited_files.append(each_file_info[1])
-
-    # Get the verbose log for each file in the history in json
-    git_all_files_log = {}
-
-    for k, each_file in enumerate(edited_files):
-        current_file_log = subprocess.check_output(
-            ['git', 'log', '--pretty=format:' + log_pretty_format, '--follow',
-             '--', each_file],
-            cwd=path)
-        git_all_files_log[str(each_file)] = convert_log_to_dict(
-            current_file_log)
+    # Detect renames only when they need to be followed
+    if follow_renames:
+        extra_args = ['-M']
+    else:
+        extra_args = ['--no-renames']
+    if revisions is not None:
+        extra_args.append(revisions)
+
+    # Build the history of each file from a single pass on the log
+    git_all_files_log = build_files_history(
+        iter_commits_log(path, extra_args), follow_renames=follow_renames)
 
     # Format the log like hg and svn
     all_files = {"log": {"logentry": git_all_files_log}}
@@ -185,165 +212,352 @@ def get_files_log(path):
     return all_files
 
 
-def git_repo_analysis(git_files_log, graph):
+def iter_commits_oldest_first(path, revisions=None):
+    """
+    Yield each commit of a git repository (or of a revision range) from
+    the oldest to the newest one, with its renames detected. Commits come
+    in order of author date, but never before their parents.
+    """
+
+    extra_args = ['-M', '--reverse', '--author-date-order']
+    if revisions is not None:
+        extra_args.append(revisions)
+
+    return iter_commits_log(path, extra_args)
+
+
+def git_repo_analysis(git_files_log, graph, aggregate=False,
+                      timestamps=False, analysed=None, session=None):
     """
     The main function of SNA for a git repo.
+    With analysed (the ids of the commits already analysed), only the
+    interactions that the new commits add or change are added (see
+    utils.files_history_analysis).
+    The edge keys are counted by the session of the analysis.
     """
 
-    # For each file, check its history and connect committers based on
-    # commit order: connect each committer with the previous ones for the
-    # same file (path dependency)
-    for k, each_file in enumerate(git_files_log):
-        file_history = {}
-        for l, each_commit in enumerate(git_files_log[each_file]):
-            file_history[l] = {
-                "author": each_commit["author"]["#text"],
-                "email": each_commit["author"]["@email"],
-                "date": each_commit["date"],
-                "@node": each_commit["@node"],
-                "msg": re.sub(r'-', " ", each_commit["msg"])
-            }
+    # The state of the analysis
+    session = github_analysis.get_session(session)
 
-        # Sort the dict in order to be sure about the chronological order
-        # of the file history
-        sorted_file_history = OrderedDict(
-            sorted(
-                file_history.items(), key=lambda x: x[1]['date']))
-
-        # Add an edge from a committer to the previous ones
-        # since there are interactions on the same file
-        for j in sorted_file_history:
-
-            # Add the committers in case they are not in the graph
-            if sorted_file_history[j]["author"] not in graph:
-                graph.add_node(
-                    sorted_file_history[j]["author"], committer="Yes",
-                    email=sorted_file_history[j]["email"])
-            else:
-                graph.nodes[sorted_file_history[j]["author"]]["committer"] = "Yes"
-
-            # Look for the interactions
-            following_committers = {}
-            for m in range(j):
-                following_committers[m] = (sorted_file_history[m])
-            #following_committers[j] = sorted_file_history[j]["author"]
-            reversed_following_committers = OrderedDict(
-                sorted(
-                    following_committers.items(), reverse=True))
-
-            for t in following_committers:
-                if t < len(reversed_following_committers) - 1:
-                    first_actor = reversed_following_committers[t]["author"]
-                    second_actor = sorted_file_history[j]["author"]
-                    # Add the nodes of the edge
-                    graph.add_node(first_actor, Label=first_actor)
-                    graph.add_node(first_actor, Label=second_actor)
-                    # Add the edge
-                    github_analysis.edge_key += 1
-                    graph.add_edge(
-                        first_actor,
-                        second_actor,
-                        key=github_analysis.edge_key,
-                        node=sorted_file_history[j]["@node"], type="commit",
-                        msg=re.sub(r'-', " ", sorted_file_history[j]["msg"]),
-                        start=parse(reversed_following_committers[t]["date"]),
-                        endopen=datetime.datetime.now().year)
-                    # start=parse(sorted_file_history[j]["date"]),
+    # Connect the committers of each file
+    return utils.files_history_analysis(
+        git_files_log, graph, session, aggregate=aggregate,
+        timestamps=timestamps, analysed=analysed)
 
-    return graph
+
+def mirror_path(url, cache_path):
+    """
+    Return the path of the bare mirror of a remote git repository in the
+    clone cache.
+    """
+
+    url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    return os.path.join(cache_path, url_hash + ".git")
 
 
-def git_remote_repo_log(url, path, log_type):
+def update_mirror(url, cache_path):
     """
-    Clone, retrieve the log of (and then remove the local copy) a remote git repository.
+    Create the bare mirror of a remote git repository in the clone cache,
+    or fetch its new commits. The mirror is a partial clone without the
+    content of the files, which is not needed by the analysis.
     """
 
-    # If we are on Linux or Mac
-    if os.name == "posix":
-        tmp_dir = "git.py.tmp"
-        where = path + "/" + tmp_dir
+    where = mirror_path(url, cache_path)
 
-        # Remove the temporary directory if it exists
-        if os.path.isdir(where):
+    if os.path.isdir(where):
+        subprocess.check_output(
+            ["git", "fetch", "--prune", "--quiet", "origin"], cwd=where)
+    else:
+        # Clone to a temporary directory first, so that an interrupted
+        # clone is never found in the cache
+        tmp_dir = tempfile.mkdtemp(prefix="git.py.", dir=cache_path)
+        try:
+            subprocess.check_output(
+                ["git", "clone", "--mirror", "--filter=blob:none",
+                 "--quiet", url, os.path.join(tmp_dir, "mirror.git")])
+            os.rename(os.path.join(tmp_dir, "mirror.git"), where)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Mark the mirror as recently used
+    os.utime(where)
+
+    return where
+
+
+def directory_size(path):
+    """
+    Return the size in bytes of all the files in a directory.
+    """
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for each_file in files:
             try:
-                shutil.rmtree(where)
-            except subprocess.CalledProcessError as e:
-                return e.returncode
+                size += os.path.getsize(os.path.join(root, each_file))
+            except OSError:
+                pass
+
+    return size
+
+
+def lock_mirror(where, blocking=True):
+    """
+    Open the lock file of a mirror and lock it exclusively, waiting for it
+    if blocking, or return None if it is locked. The lock file is removed
+    with its mirror by evict_mirrors, so the lock is taken again if that
+    happened while waiting for it.
+    """
+
+    while True:
+        lock = open(where + ".lock", "a")
+        try:
+            if blocking:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            else:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        try:
+            if os.fstat(lock.fileno()).st_ino == \
+                    os.stat(where + ".lock").st_ino:
+                return lock
+        except FileNotFoundError:
+            pass
+        lock.close()
+        if not blocking:
+            return None
+
+
+def evict_mirrors(cache_path, max_size):
+    """
+    Remove the least recently used mirrors from the clone cache, until it
+    is smaller than max_size bytes. Mirrors in use are never removed.
+    """
+
+    mirrors = []
+    for name in os.listdir(cache_path):
+        where = os.path.join(cache_path, name)
+        if name.endswith(".git") and os.path.isdir(where):
+            mirrors.append(
+                (os.path.getmtime(where), directory_size(where), where))
+    total_size = sum(m[1] for m in mirrors)
+
+    for used, size, where in sorted(mirrors):
+        if total_size <= max_size:
+            break
+        lock = lock_mirror(where, blocking=False)
+        if lock is None:
+            continue
+        with lock:
+            shutil.rmtree(where, ignore_errors=True)
+            os.remove(where + ".lock")
+            total_size -= size
+
+
+def read_repo_log(where, log_type):
+    """
+    Read the log of the files or of the commits of a local git repository.
+    """
+
+    if log_type.lower() == "files" or log_type.lower() == "file":
+        return get_files_log(where)["log"]["logentry"]
+
+    return get_commits_log(where)["log"]["logentry"]
+
+
+def git_cached_repo_log(url, cache_path, log_type, max_size=None):
+    """
+    Retrieve the log of a remote git repository from its mirror in the
+    clone cache at cache_path, fetching only the new commits since the
+    previous analysis. With max_size, the least recently used mirrors are
+    removed when the cache is larger than max_size bytes.
+    """
+
+    if not os.path.isdir(cache_path):
+        os.makedirs(cache_path)
+    where = mirror_path(url, cache_path)
 
-        # Git clone to the temporary directory
+    # Only one process at a time clones or fetches the same mirror
+    with lock_mirror(where) as lock:
         try:
-            subprocess.check_output(["git", "clone", url, where], cwd=path)
+            update_mirror(url, cache_path)
         except subprocess.CalledProcessError as e:
             return e.returncode
 
-        # Load the log output
-        if log_type.lower() == "files" or log_type.lower() == "file":
-            git_log = get_files_log(where)["log"]["logentry"]
-        else:
-            git_log = get_commits_log(where)["log"]["logentry"]
+        # Many processes can read the same mirror at the same time
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        git_log = read_repo_log(where, log_type)
 
-        # Remove the temporary directory if it exists
-        if os.path.isdir(where):
-            try:
-                shutil.rmtree(where)
-            except subprocess.CalledProcessError as e:
-                return e.returncode
+    if max_size is not None:
+        evict_mirrors(cache_path, max_size)
 
     return git_log
 
 
-def git_remote_repo_analysis(url, path, graph):
+def git_remote_repo_log(url, path, log_type, cache_path=None, max_size=None):
     """
-    Clone, analyse (and then remove the local copy) a remote git repository.
+    Clone, retrieve the log of (and then remove the local copy) a remote git repository.
+    With cache_path, the bare mirror of the repository in the clone cache
+    is used and kept instead.
     """
 
+    # Use the clone cache, if required
+    if cache_path is not None:
+        return git_cached_repo_log(url, cache_path, log_type, max_size)
+
     # If we are on Linux or Mac
     if os.name == "posix":
-        tmp_dir = "git.py.tmp"
-        where = path + "/" + tmp_dir
+        # A new temporary directory for each run, so that concurrent runs
+        # in the same path do not clash
+        tmp_dir = tempfile.mkdtemp(prefix="git.py.", dir=path)
+        where = os.path.join(tmp_dir, "repository.git")
 
-        # Remove the temporary directory if it exists
-        if os.path.isdir(where):
-            try:
-                shutil.rmtree(where)
-            except subprocess.CalledProcessError as e:
-                return e.returncode
-
-        # Git clone to the temporary directory
+        # Git clone (the history only) to the temporary directory
         try:
-            subprocess.check_output(["git", "clone", url, where], cwd=path)
+            subprocess.check_output(
+                ["git", "clone", "--bare", "--filter=blob:none", "--quiet",
+                 url, where], cwd=path)
         except subprocess.CalledProcessError as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
             return e.returncode
 
+        # Load the log output
+        try:
+            git_log = read_repo_log(where, log_type)
+        finally:
+            # Remove the temporary directory
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return git_log
+
+
+def git_remote_repo_analysis(url, path, graph, aggregate=False,
+                             timestamps=False, session=None,
+                             cache_path=None, max_size=None):
+    """
+    Clone, analyse (and then remove the local copy) a remote git repository.
+    With cache_path, the bare mirror of the repository in the clone cache
+    is used and kept instead.
+    """
+
+    # If we are on Linux or Mac
+    if os.name == "posix":
+
         # Load the log output for each file
-        git_files_log = get_files_log(where)["log"]["logentry"]
+        git_files_log = git_remote_repo_log(
+            url, path, log_type="files", cache_path=cache_path,
+            max_size=max_size)
+        if not isinstance(git_files_log, dict):
+            return git_files_log
 
         # Analyse the repo
-        git_repo_analysis(git_files_log=git_files_log, graph=graph)
-
-        # Remove the temporary directory if it exists
-        if os.path.isdir(where):
-            try:
-                shutil.rmtree(where)
-            except subprocess.CalledProcessError as e:
-                return e.returncode
+        git_repo_analysis(
+            git_files_log=git_files_log, graph=graph, aggregate=aggregate,
+            timestamps=timestamps, session=session)
 
     return graph
 
 
-def git_local_repo_analysis(path, graph):
+def git_local_repo_analysis(path, graph, aggregate=False,
+                            timestamps=False, session=None, revisions=None):
     """
-    Analyse a local git repository.
+    Analyse a local git repository, while its log is read (see
+    utils.commits_analysis).
+    With revisions, only the commits of that revision range are analysed,
+    so that a long history can be analysed in bounded windows.
     """
 
+    # The state of the analysis
+    session = github_analysis.get_session(session)
+
     # If we are on Linux or Mac
     if os.name == "posix":
 
-        # Load the log output for each file
-        git_files_log = get_files_log(path)["log"]["logentry"]
+        # Analyse the commits while the log is read, from the oldest one
+        utils.commits_analysis(
+            iter_commits_oldest_first(path, revisions), graph, session,
+            aggregate=aggregate, timestamps=timestamps)
 
-        # Analyse the repo
-        git_repo_analysis(git_files_log=git_files_log, graph=graph)
+    return graph
+
+
+def committers_to_state(committers):
+    """
+    Convert the previous committers of each file to JSON, as lists of
+    authors and dates of their latest commits.
+    """
+
+    return {
+        each_file: [[author, date.isoformat()]
+                    for author, date in previous_committers.items()]
+        for each_file, previous_committers in committers.items()
+    }
+
+
+def committers_from_state(state):
+    """
+    Convert the previous committers of each file back from JSON.
+    """
+
+    return {
+        each_file: OrderedDict(
+            (author, parse(date)) for author, date in previous_committers)
+        for each_file, previous_committers in state.items()
+    }
+
+
+def git_incremental_analysis(path, filename, ref="HEAD", session=None):
+    """
+    Analyse a local git repository incrementally: the graph and the state
+    of the previous analysis are loaded from filename, only the commits of
+    ref since the last analysed one are read, and their interactions are
+    added to the graph, which is saved again.
+    If the history of ref has been rewritten (like by a force push), its
+    interactions are removed and it is analysed again from the start.
+    """
+
+    # The state of the analysis
+    session = github_analysis.get_session(session)
+
+    # Load the previous analysis, if any
+    graph, incremental = github_analysis.load_incremental_analysis(
+        filename, session)
+    session.graph = graph
+    refs = incremental.setdefault("git refs", {})
+
+    # The commit to analyse up to
+    head = subprocess.check_output(
+        ['git', 'rev-parse', '--verify', ref + '^{commit}'],
+        cwd=path).decode("utf-8").strip()
+
+    # The last analysed commit is not in the history anymore: rebuild
+    state = refs.get(ref)
+    if state is not None and subprocess.call(
+            ['git', 'merge-base', '--is-ancestor', state["head"], head],
+            cwd=path, stderr=subprocess.DEVNULL) != 0:
+        graph.remove_edges_from([
+            (u, v, key) for u, v, key, edge_ref in graph.edges(
+                keys=True, data="ref") if edge_ref == ref])
+        state = None
+
+    # Read only the new commits, continuing the histories of the files
+    if state is None:
+        revisions = head
+        committers = {}
+    else:
+        revisions = state["head"] + ".." + head
+        committers = committers_from_state(state["committers"])
+    if state is None or state["head"] != head:
+        utils.commits_analysis(
+            iter_commits_oldest_first(path, revisions), graph, session,
+            committers=committers, ref=ref)
+
+    # Save the graph and the state of ref for the next analysis
+    refs[ref] = {"head": head, "committers": committers_to_state(committers)}
+    github_analysis.save_incremental_analysis(graph, incremental, filename)
 
     return graph
 
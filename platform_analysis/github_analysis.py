@@ -8,25 +8,53 @@
 #
 
 import re
+import os
+import json
 import string
 
 from github import Github
 
 import networkx as nx
 from . import git
+from . import utils
+from . import github_collection
+from . import github_cache
+from . import github_graphql
+from . import github_users
 import datetime
-from time import sleep
+from dateutil.parser import parse
 
 from ratelimit import limits, sleep_and_retry
 
 
-# Global variables
-# Edge counting
-edge_key = 0
-# The main graph
-global_graph = nx.MultiDiGraph()
-# Log in to GitHub
-github_login = Github()
+class GitHubSession(utils.AnalysisSession):
+    """
+    The state of the analysis of GitHub repositories: the graph and the
+    edge counter, the GitHub client, the budget of requests to the GitHub
+    API and the directory of the users already found.
+    Sessions that use the same token in the same process can share the
+    budget and the directory.
+    """
+
+    def __init__(self, client=None, graph=None, budget=None, users=None):
+        utils.AnalysisSession.__init__(self, graph=graph)
+        self.client = client if client is not None else Github()
+        self.budget = budget if budget is not None \
+            else github_collection.RateBudget()
+        self.users = users if users is not None \
+            else github_users.UserDirectory()
+
+
+# The session of the functions called without one
+default_session = GitHubSession()
+
+
+def get_session(session):
+    """
+    Return the given session, or the default one.
+    """
+
+    return session if session is not None else default_session
 
 
 def check_none(value_to_check):
@@ -37,20 +65,22 @@ def check_none(value_to_check):
     return value_to_check if value_to_check is not None else "None"
 
 
-def github_login(username, token):
+def github_login(username, token, session=None,
+                 base_url="https://api.github.com"):
     """
     Login on GitHub in order to retrieve a dict of repositories
     for a given username. Get the GitHub token from https://github.com/settings/tokens
     """
 
     # Log in to GitHub
-    global github_login
-    github_login = Github(token)
+    session = get_session(session)
+    session.client = Github(token, base_url=base_url)
 
     results = {}
 
     # Load the repositories of the username
-    for k, repo in enumerate(github_login.get_user(username).get_repos()):
+    for k, repo in enumerate(
+            session.client.get_user(username).get_repos()):
         results[k] = {"name": repo.name, "data": repo}
 
     return results
@@ -107,182 +137,394 @@ def clean_graph(graph):
     return graph
 
 
-def github_analysis(repository, username, userlogin, token, path):
+def github_analysis(repository, username, userlogin, token, path,
+                    aggregate=False, timestamps=False, max_workers=None,
+                    base_url="https://api.github.com", cache_path=None,
+                    graphql=False, users_path=None, session=None,
+                    clone_cache_path=None):
     """
     Analyse a specific repository. Get the GitHub token from https://github.com/settings/tokens
+    Each analysis has a new session, unless one is given: its graph
+    is returned.
+    With max_workers, the resources of the repository are fetched in
+    parallel by a pool of threads before the analysis.
+    With graphql, the issues and the pull requests are fetched with their
+    comments and authors in batched GraphQL queries.
+    With users_path, the profiles of the users are kept in a SQLite
+    database and not requested again in the following analyses.
+    With cache_path, the responses of the GitHub API are cached in a
+    SQLite database and revalidated in the following analyses.
+    With clone_cache_path, the mirror of the repository is kept there and
+    only updated by the following analyses.
+    """
+
+    # Log in to GitHub
+    if session is None:
+        session = GitHubSession()
+    session.client = Github(userlogin, token, base_url=base_url)
+
+    # Cache the responses of the GitHub API to this client, if required
+    response_cache = None
+    if cache_path is not None:
+        response_cache = github_cache.install(cache_path, session.client)
+
+    try:
+        repository_object = session.client.get_user(username).get_repo(
+            repository)
+
+        # Keep the profiles of the users across the analyses, if required
+        if users_path is not None:
+            session.users = github_users.UserDirectory(path=users_path)
+
+        # Fetch issues and pull requests in batches with GraphQL, if
+        # required
+        if graphql:
+            repository_object = github_graphql.collect_repository(
+                repository_object, session.client, budget=session.budget)
+
+        # Fetch all the resources of the repository concurrently, if
+        # required
+        elif max_workers is not None:
+            repository_object = github_collection.collect_repository(
+                repository_object, session.client,
+                max_workers=max_workers, budget=session.budget)
+
+        # Graph creation
+        graph = session.graph
+        if aggregate:
+            utils.aggregate_graph(graph, timestamps=timestamps)
+        git_files_log = None
+        if clone_cache_path is not None:
+            git_files_log = git.git_remote_repo_log(
+                repository_object.clone_url, path, log_type="files",
+                cache_path=clone_cache_path)
+        repo_analysis(
+            repository=repository_object, path=path, graph=graph,
+            session=session, git_files_log=git_files_log)
+        fork_analysis(
+            repository=repository_object, graph=graph, session=session)
+        pull_requests_analysis(
+            repository=repository_object, graph=graph, session=session)
+        clean_graph(graph=graph)
+    finally:
+        if response_cache is not None:
+            github_cache.uninstall(session.client, response_cache)
+
+    return graph
+
+
+def get_watermark(incremental, resource):
+    """
+    Return the date of the latest item of a resource found by the previous
+    analyses, or None if the resource has to be fetched from the start.
+    """
+
+    if incremental is None or resource not in incremental["watermarks"]:
+        return None
+
+    return parse(incremental["watermarks"][resource])
+
+
+def set_watermark(incremental, resource, date):
+    """
+    Move the watermark of a resource forward to the date of a new item.
+    """
+
+    if incremental is None or not isinstance(date, datetime.datetime):
+        return
+
+    current = get_watermark(incremental, resource)
+    if current is None or utils.timestamp_of(date) > \
+            utils.timestamp_of(current):
+        incremental["watermarks"][resource] = date.isoformat()
+
+
+def save_incremental_analysis(graph, incremental, filename):
+    """
+    Save the graph of an incremental analysis as GraphML, and its state
+    (the watermarks, the authors of the commits and the commits already
+    analysed) as JSON next to it. The graph is not changed, and compact
+    graphs are saved with all their interactions.
+    """
+
+    # The interactions in the edge store of a compact graph, if any, are
+    # saved as edges too
+    saved_graph = utils.expand_graph(graph)
+    if saved_graph is graph:
+        saved_graph = graph.copy()
+
+    # GraphML stores only strings and numbers
+    for v in saved_graph.nodes():
+        for attrib in saved_graph.nodes[v]:
+            if saved_graph.nodes[v][attrib] is None:
+                saved_graph.nodes[v][attrib] = "None"
+    for u, v, key, data in saved_graph.edges(keys=True, data=True):
+        for attrib in data:
+            if isinstance(data[attrib], datetime.datetime):
+                data[attrib] = data[attrib].isoformat()
+            elif data[attrib] is None:
+                data[attrib] = "None"
+    nx.write_graphml(saved_graph, filename)
+
+    with open(filename + ".json", "w") as state_file:
+        json.dump(incremental, state_file)
+
+
+def load_incremental_analysis(filename, session=None):
+    """
+    Load the graph and the state of an incremental analysis saved with
+    save_incremental_analysis, or start a new one if they do not exist.
+    """
+
+    session = get_session(session)
+
+    if not os.path.isfile(filename) or \
+            not os.path.isfile(filename + ".json"):
+        return nx.MultiDiGraph(), {
+            "watermarks": {}, "commit authors": {}, "analysed commits": []}
+
+    graph = nx.read_graphml(filename, force_multigraph=True)
+
+    # Restore the dates of the interactions and the edge keys
+    loaded_graph = nx.MultiDiGraph()
+    loaded_graph.add_nodes_from(graph.nodes(data=True))
+    for u, v, key, data in graph.edges(keys=True, data=True):
+        for attrib in ("start", "date"):
+            if attrib in data and data[attrib] != "None":
+                data[attrib] = parse(data[attrib])
+        try:
+            key = int(key)
+        except ValueError:
+            pass
+        loaded_graph.add_edge(u, v, key=key, **data)
+
+    # Continue counting the edges after the loaded ones
+    for u, v, key in loaded_graph.edges(keys=True):
+        session.skip_keys(key)
+
+    with open(filename + ".json") as state_file:
+        incremental = json.load(state_file)
+
+    return loaded_graph, incremental
+
+
+def github_incremental_analysis(repository, username, userlogin, token, path,
+                                filename, base_url="https://api.github.com",
+                                cache_path=None, session=None,
+                                clone_cache_path=None):
+    """
+    Analyse a specific repository incrementally: the graph and the
+    watermarks of the previous analysis are loaded from filename, only the
+    issues, commits and pull requests since then are fetched from GitHub,
+    and their interactions are merged into the graph, which is saved again.
+    The commits are identified by their sha, so that the ones pushed after
+    the previous analysis are found even if they are older.
+    With clone_cache_path, the mirror of the repository is kept there and
+    only updated by the following analyses.
     """
 
     # Log in to GitHub
-    global github_login
-    github_login = Github(userlogin, token)
-    repository_object = github_login.get_user(username).get_repo(repository)
+    if session is None:
+        session = GitHubSession()
+    session.client = Github(userlogin, token, base_url=base_url)
 
-    # Graph creation
-    global global_graph
-    repo_analysis(repository=repository_object, path=path, graph=global_graph)
-    fork_analysis(repository=repository_object, graph=global_graph)
-    pull_requests_analysis(repository=repository_object, graph=global_graph)
-    clean_graph(graph=global_graph)
+    # Cache the responses of the GitHub API to this client, if required
+    response_cache = None
+    if cache_path is not None:
+        response_cache = github_cache.install(cache_path, session.client)
 
-    return global_graph
+    try:
+        repository_object = session.client.get_user(username).get_repo(
+            repository)
+
+        # Load the previous analysis, if any
+        graph, incremental = load_incremental_analysis(filename, session)
+        session.graph = graph
+
+        # Add the new interactions to the graph
+        git_files_log = None
+        if clone_cache_path is not None:
+            git_files_log = git.git_remote_repo_log(
+                repository_object.clone_url, path, log_type="files",
+                cache_path=clone_cache_path)
+        repo_analysis(
+            repository=repository_object, path=path, graph=graph,
+            incremental=incremental, session=session,
+            git_files_log=git_files_log)
+        fork_analysis(
+            repository=repository_object, graph=graph,
+            incremental=incremental, session=session)
+        pull_requests_analysis(
+            repository=repository_object, graph=graph,
+            incremental=incremental, session=session)
+        clean_graph(graph=graph)
+
+        # Save the graph and the new watermarks for the next analysis
+        save_incremental_analysis(graph, incremental, filename)
+    finally:
+        if response_cache is not None:
+            github_cache.uninstall(session.client, response_cache)
+
+    return graph
 
 
 @sleep_and_retry
 @limits(calls=4000, period=3600)
-def fork_analysis(repository, graph):
+def fork_analysis(repository, graph, aggregate=False, timestamps=False,
+                  incremental=None, session=None):
     """
     Analyse the forks of a repository.
+    With the state of an incremental analysis, only the new forks are added
+    to the graph.
     """
 
-    # Global variable
-    global edge_key
+    # The state of the analysis
+    session = get_session(session)
+
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(graph, timestamps=timestamps)
 
     # Local graph variable
-    local_graph = nx.MultiDiGraph()
+    local_graph = utils.empty_graph_like(graph)
+
+    # The same end year for all the edges of this analysis
+    endopen = datetime.datetime.now().year
 
     forks_found = repository.get_forks()
 
     for f, i in enumerate(forks_found):
         if i.owner is not None and repository.owner is not None:
             # Add edge from the forker to the owner
-            if i.owner.login not in graph.nodes():
-                get_users(
-                    element=i.owner.login, user_type="forker", graph=graph)
+            if i.owner.login not in local_graph.nodes():
                 get_users(
                     element=i.owner.login,
                     user_type="forker",
-                    graph=local_graph)
-            graph.add_edge(
-                i.owner.login,
-                repository.owner.login,
-                key=edge_key,
-                node=f,
-                msg=i.full_name,
-                type="fork",
-                start=i.created_at,
-                endopen=datetime.datetime.now().year)
-            local_graph.add_edge(
+                    graph=local_graph,
+                    session=session)
+            utils.add_interaction(
+                local_graph,
                 i.owner.login,
                 repository.owner.login,
-                key=edge_key,
+                key=session.edge_key,
                 node=f,
                 msg=i.full_name,
                 type="fork",
                 start=i.created_at,
-                endopen=datetime.datetime.now().year)
+                endopen=endopen)
+
+    # Add the interactions to the main graph
+    utils.merge_graph(
+        local_graph, graph, deduplicate=incremental is not None)
 
     return local_graph
 
 
 @sleep_and_retry
 @limits(calls=4000, period=3600)
-def pull_requests_analysis(repository, graph):
+def pull_requests_analysis(repository, graph, aggregate=False,
+                           timestamps=False, incremental=None, session=None):
     """
     Analyse the discussion of pull requests of a repository.
+    With the state of an incremental analysis, only the pull requests
+    updated since the last analysis are checked.
     """
 
-    # Global variable
-    global edge_key
+    # The state of the analysis
+    session = get_session(session)
+
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(graph, timestamps=timestamps)
 
     # Local graph variable
-    local_graph = nx.MultiDiGraph()
+    local_graph = utils.empty_graph_like(graph)
+
+    # The same end year for all the edges of this analysis
+    endopen = datetime.datetime.now().year
 
     # Check both open and closed pull requests
     # Open pull requests are not merged
     pull_request_states = ["closed", "open"]
 
+    # The pull requests updated since the last analysis, if any
+    watermark = get_watermark(incremental, "pulls")
+
     for state in pull_request_states:
-        pulls = repository.get_pulls(state=state)
+        if watermark is None:
+            pulls = repository.get_pulls(state=state)
+        else:
+            pulls = repository.get_pulls(
+                state=state, sort="updated", direction="desc")
         for f, i in enumerate(pulls):
+            # The rest of the pull requests have already been analysed
+            if watermark is not None and i.updated_at <= watermark:
+                break
+            set_watermark(incremental, "pulls", i.updated_at)
             if i.is_merged() is True:
             # if state == "closed":
                 # Add edge from who merged the pull request to who did it
                 if i.merged_by is not None and i.user is not None:
-                    if i.merged_by.login not in graph.nodes():
+                    if i.merged_by.login not in local_graph.nodes():
                         get_users(
                             element=i.merged_by,
                             user_type="forker",
-                            graph=graph)
-                        get_users(
-                            element=i.merged_by,
-                            user_type="forker",
-                            graph=local_graph)
-                    if i.user.login not in graph.nodes():
-                        get_users(
-                            element=i.user, user_type="forker", graph=graph)
+                            graph=local_graph,
+                            session=session)
+                    if i.user.login not in local_graph.nodes():
                         get_users(
                             element=i.user,
                             user_type="forker",
-                            graph=local_graph)
-                    graph.add_edge(
+                            graph=local_graph,
+                            session=session)
+                    utils.add_interaction(
+                        local_graph,
                         i.merged_by.login,
                         i.user.login,
-                        key=edge_key,
+                        key=session.edge_key,
                         node=i.merge_commit_sha,
                         msg=i.title,
                         type="merged pull request",
                         start=i.merged_at,
-                        endopen=datetime.datetime.now().year)
-                    local_graph.add_edge(
-                        i.merged_by.login,
-                        i.user.login,
-                        key=edge_key,
-                        node=i.merge_commit_sha,
-                        msg=i.title,
-                        type="merged pull request",
-                        start=i.merged_at,
-                        endopen=datetime.datetime.now().year)
+                        endopen=endopen)
 
             # Add edge from who did the pull requests to the repo owner
             if repository.owner is not None and i.user is not None:
-                if repository.owner.login not in graph.nodes():
-                    get_users(
-                        element=repository.owner,
-                        user_type="created a pull request",
-                        graph=graph)
+                if repository.owner.login not in local_graph.nodes():
                     get_users(
                         element=repository.owner,
                         user_type="created a pull request",
-                        graph=local_graph)
-                graph.add_edge(
-                    i.user.login,
-                    repository.owner.login,
-                    key=edge_key,
-                    node=i.id,
-                    msg=i.title,
-                    type="merged pull request",
-                    start=i.created_at,
-                    endopen=datetime.datetime.now().year)
-                local_graph.add_edge(
+                        graph=local_graph,
+                        session=session)
+                utils.add_interaction(
+                    local_graph,
                     i.user.login,
                     repository.owner.login,
-                    key=edge_key,
+                    key=session.edge_key,
                     node=i.id,
                     msg=i.title,
                     type="created a pull request",
                     start=i.created_at,
-                    endopen=datetime.datetime.now().year)
+                    endopen=endopen)
 
             # Add edge from owner to assignee
             if i.assignee is not None:
-                if i.assignee not in graph.nodes():
+                if i.assignee not in local_graph.nodes():
                     get_users(
                         element=i.assignee,
                         user_type="pull request assignee",
-                        graph=graph)
-                    get_users(
-                        element=i.assignee,
-                        user_type="pull request assignee",
-                        graph=local_graph)
-                graph.add_edge(
+                        graph=local_graph,
+                        session=session)
+                utils.add_interaction(
+                    local_graph,
                     repository.owner.login,
                     i.assignee,
-                    key=edge_key,
+                    key=session.edge_key,
                     node=i.id,
                     msg=i.title,
                     type="pull request assignee",
                     start=i.created_at,
-                    endopen=datetime.datetime.now().year)
+                    endopen=endopen)
 
             # Comments
             # for j in i.get_comments():
@@ -307,56 +549,59 @@ def pull_requests_analysis(repository, graph):
                 get_users(
                     element=j.user,
                     user_type="pull request commenter",
-                    graph=graph)
+                    graph=local_graph,
+                    session=session)
                 pull_request_comments.append(comment)
 
-            comments_analysis(
-                pull_request_comments,
-                graph,
-                comment_type="pull request comment")
             comments_analysis(
                 pull_request_comments,
                 local_graph,
-                comment_type="pull request comment")
+                comment_type="pull request comment",
+                session=session)
+
+    # Add the interactions to the main graph
+    utils.merge_graph(
+        local_graph, graph, deduplicate=incremental is not None)
 
     return local_graph
 
 
 @sleep_and_retry
 @limits(calls=4000, period=3600)
-def issue_analysis(issue, graph):
+def issue_analysis(issue, graph, aggregate=False, timestamps=False,
+                   session=None):
     """
     Analyse the discussion of a single issue.
     """
 
-    # Global variable
-    global edge_key
+    # The state of the analysis
+    session = get_session(session)
+
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(graph, timestamps=timestamps)
 
     # Local graph variable
-    local_graph = nx.MultiDiGraph()
+    local_graph = utils.empty_graph_like(graph)
 
     if issue.user is not None:
         # Issue creator
-        get_users(element=issue.user, user_type="issue creator", graph=graph)
+        get_users(
+            element=issue.user, user_type="issue creator", graph=local_graph,
+            session=session)
 
     # Issue assignee
     if issue.assignee is not None:
-        edge_key += 1
         get_users(
-            element=issue.assignee, user_type="issue assignee", graph=graph)
-        graph.add_edge(
-            issue.user.login,
-            issue.assignee.login,
-            key=edge_key,
-            node=issue.id,
-            msg=issue.title,
-            type="issue assignation",
-            start=issue.created_at,
-            endopen=datetime.datetime.now().year)
-        local_graph.add_edge(
+            element=issue.assignee,
+            user_type="issue assignee",
+            graph=local_graph,
+            session=session)
+        utils.add_interaction(
+            local_graph,
             issue.user.login,
             issue.assignee.login,
-            key=edge_key,
+            key=session.next_key(),
             node=issue.id,
             msg=issue.title,
             type="issue assignation",
@@ -368,7 +613,7 @@ def issue_analysis(issue, graph):
     first_issue_comment = {
         '@node': issue.id,
         'date': issue.created_at,
-        'msg': issue.title,  # Use f.body for the comment content
+        'msg': issue.title,  # Use f.body for the comment content
         'author': {'#text': issue.user.login,
                    '@email': issue.user.email,
                    'avatar_url': issue.user.avatar_url}}
@@ -377,53 +622,60 @@ def issue_analysis(issue, graph):
     for j, f in enumerate(icomments):
         comment = {'@node': f.id,
                    'date': f.created_at,
-                   'msg': issue.title,  # Use f.body for the comment content
+                   'msg': issue.title,  # Use f.body for the comment content
                    'author': {'#text': f.user.login,
                               '@email': f.user.email,
                               'avatar_url': f.user.avatar_url}}
-        get_users(element=f.user, user_type="issue commenter", graph=graph)
+        get_users(
+            element=f.user, user_type="issue commenter", graph=local_graph,
+            session=session)
         issues_comments.append(comment)
 
-    comments_analysis(
-        issues_comments,
-        graph,
-        comment_type="issue comment")
     comments_analysis(
         issues_comments,
         local_graph,
-        comment_type="issue comment")
+        comment_type="issue comment",
+        session=session)
+
+    # Add the interactions to the main graph
+    utils.merge_graph(local_graph, graph)
 
     return local_graph
 
 
 @sleep_and_retry
 @limits(calls=4000, period=3600)
-def comments_analysis(discussion, graph, comment_type):
+def comments_analysis(discussion, graph, comment_type, aggregate=False,
+                      timestamps=False, session=None):
     """
     Analyse the discussion of a GitHub discussion.
     Add edges to the graph and return a graph of the specified discussion.
     """
 
-    # Global variable
-    global edge_key
+    # The state of the analysis
+    session = get_session(session)
+
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(graph, timestamps=timestamps)
 
     # Local graph variable
-    local_graph = nx.MultiDiGraph()
+    local_graph = utils.empty_graph_like(graph)
+
+    # The same end year for all the edges of this analysis
+    endopen = datetime.datetime.now().year
 
     # Check all the comments in the commit
     for j, f in enumerate(discussion):
         # Add an edge to all the previous participants in the discussion
         for k in discussion[:j]:
-            edge_key += 1
-            graph.add_edge(
-                f["author"]["#text"], k["author"]["#text"], key=edge_key,
-                node=f["@node"], type=comment_type, msg=f["msg"],
-                start=f["date"], endopen=datetime.datetime.now().year)
-            local_graph.add_edge(
-                f["author"]["#text"], k["author"]["#text"], key=edge_key,
+            utils.add_interaction(
+                local_graph,
+                f["author"]["#text"], k["author"]["#text"],
+                key=session.next_key(),
                 type=comment_type, node=f["@node"], date=f["date"],
                 start=f["date"], msg=f["msg"],
-                endopen=datetime.datetime.now().year)
+                endopen=endopen)
             # removed msg=f["msg"],
 
             # Check if there are any username mentions in the body of each
@@ -447,26 +699,28 @@ def comments_analysis(discussion, graph, comment_type):
                             # Remove strange punctuation at the end, if any
                             if word[-1] in string.punctuation:
                                 word = word[:-1]
-                                edge_key += 1
-                                graph.add_edge(
-                                    f["author"]["#text"], word, key=edge_key,
+                                utils.add_interaction(
+                                    local_graph,
+                                    f["author"]["#text"], word,
+                                    key=session.next_key(),
                                     type="comment mention", start=f["date"],
-                                    endopen=datetime.datetime.now().year)
-                                local_graph.add_edge(
-                                    f["author"]["#text"], word, key=edge_key,
-                                    type="comment mention", start=f["date"],
-                                    endopen=datetime.datetime.now().year)
+                                    endopen=endopen)
+
+    # Add the interactions to the main graph
+    utils.merge_graph(local_graph, graph)
 
     return local_graph
 
 
-@sleep_and_retry
-@limits(calls=4000, period=3600)
-def get_users(element, user_type, graph):
+def get_users(element, user_type, graph, session=None):
     """
     Get users of a specific type from the GitHub repo.
+    The profile of each user is requested at most once, through the
+    user directory.
     """
 
+    session = get_session(session)
+
     try:
         if element is not None:
             if type(element) == str:
@@ -474,9 +728,11 @@ def get_users(element, user_type, graph):
                 element_email = "..."
                 element_avatar_url = "..."
             else:
-                element_name = str(element.login)
-                element_email = str(element.email)
-                element_avatar_url = str(element.avatar_url)
+                profile = session.users.resolve(
+                    element, session.client, session.budget)
+                element_name = str(profile["login"])
+                element_email = str(profile["email"])
+                element_avatar_url = str(profile["avatar_url"])
             if element_name not in graph:
                 graph.add_node(element_name)
                 # graph.nodes[str(element.login)]["Label"] = str(element.login)
@@ -486,98 +742,168 @@ def get_users(element, user_type, graph):
                     element_avatar_url )
             else:
                 graph.nodes[element_name][user_type] = "Yes"
-    except:
-        try:
-            if element is not None:
-                if type(element) == str:
-                    new_element_name = element
-                    new_element_email = "..."
-                    new_element_avatar_url = "..."
-                else:
-                    new_element = github_login.get_user(element.login)
-                    new_element_name = str(element.login)
-                    new_element_email = str(element.email)
-                    new_element_avatar_url = str(element.avatar_url)
-                if new_element_name not in graph:
-                    graph.add_node(new_element_name)
-                    # graph.nodes[str(new_element.login)]["Label"] = check_none(new_element.login)
-                    graph.nodes[new_element_name][user_type] = "Yes"
-                    graph.nodes[new_element_name]["email"] = check_none(new_element_email)
-                    graph.nodes[new_element_name]["avatar_url"] = check_none(new_element_avatar_url)
-                else:
-                    graph.nodes[new_element_name][user_type] = "Yes"
-        except Exception as e:
-            print("There was an error with", element, "which is of type",
-                  type(element), "with error", e)
+    except Exception as e:
+        print("There was an error with", element, "which is of type",
+              type(element), "with error", e)
+
+
+def get_all_users(elements, user_type, graph, session=None):
+    """
+    Get many users of a specific type from the GitHub repo, requesting
+    the unknown profiles in batches.
+    """
+
+    session = get_session(session)
+
+    elements = list(elements)
+    session.users.resolve_all(elements, session.client, session.budget)
+    for i in elements:
+        get_users(
+            element=i, user_type=user_type, graph=graph, session=session)
+
+
+def parse_date(date):
+    """
+    Return a date of a log as a datetime.
+    """
+
+    if isinstance(date, datetime.datetime):
+        return date
+
+    return parse(date)
+
+
+def utc_date(date):
+    """
+    Convert an aware datetime to UTC, as the GitHub API expects it.
+    """
+
+    if date.tzinfo is None:
+        return date
+
+    return date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def read_git_files_log(repository, path, git_files_log=None):
+    """
+    Return the log of the files of a GitHub repo: git_files_log, what it
+    returns if it is a function, or the log of a new clone at path.
+    """
+
+    if git_files_log is None:
+        return git.git_remote_repo_log(
+            repository.clone_url, path, log_type="files")
+    if callable(git_files_log):
+        return git_files_log()
+
+    return git_files_log
 
 
 @sleep_and_retry
 @limits(calls=4000, period=3600)
-def repo_analysis(repository, path, graph):
+def repo_analysis(repository, path, graph, aggregate=False,
+                  timestamps=False, incremental=None, session=None,
+                  git_files_log=None):
     """
     Analyse a specific GitHub repo.
+    With the state of an incremental analysis, only the issues and the
+    commits since the last analysis are fetched from GitHub.
+    With git_files_log (or a function returning it), the repo is not
+    cloned to get the log of its files.
     """
 
-    # Global variable
-    global edge_key
+    # The state of the analysis
+    session = get_session(session)
+
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(graph, timestamps=timestamps)
 
     # Local graph variable
-    local_graph = nx.MultiDiGraph()
+    local_graph = utils.empty_graph_like(graph)
 
     # Add the repo owner to the graph
-    get_users(element=repository.owner, user_type="owner", graph=graph)
-    get_users(element=repository.owner, user_type="owner", graph=local_graph)
+    get_users(
+        element=repository.owner, user_type="owner", graph=local_graph,
+        session=session)
 
     # Add an edge from the owner to the repo, to mark the creation of the repo
-    graph.add_edge(
+    utils.add_interaction(
+        local_graph,
         repository.owner.login,
         repository.full_name,
-        key=edge_key,
+        key=session.edge_key,
         type="repository creation",
         start=repository.created_at,
         endopen=datetime.datetime.now().year)
-    edge_key += 1
+    session.next_key()
 
     # Add the repo watchers to the graph
-    for i in repository.get_stargazers():
-        get_users(element=i, user_type="stargazer", graph=graph)
-        get_users(element=i, user_type="stargazer", graph=local_graph)
+    get_all_users(
+        repository.get_stargazers(), user_type="stargazer",
+        graph=local_graph, session=session)
 
     # Add the repo collaborators to the graph
-    for i in repository.get_collaborators():
-        get_users(element=i, user_type="collaborator", graph=graph)
-        get_users(element=i, user_type="collaborator", graph=local_graph)
+    get_all_users(
+        repository.get_collaborators(), user_type="collaborator",
+        graph=local_graph, session=session)
 
     # Add the repo contributors to the graph
-    for i in repository.get_contributors():
-        get_users(element=i, user_type="contributor", graph=graph)
-        get_users(element=i, user_type="contributor", graph=local_graph)
+    get_all_users(
+        repository.get_contributors(), user_type="contributor",
+        graph=local_graph, session=session)
 
     # Add the repo watchers to the graph
-    for i in repository.get_watchers():
-        get_users(element=i, user_type="watcher", graph=graph)
-        get_users(element=i, user_type="watcher", graph=local_graph)
+    get_all_users(
+        repository.get_watchers(), user_type="watcher",
+        graph=local_graph, session=session)
 
     # Add the repo subscribers to the graph
-    for i in repository.get_subscribers():
-        get_users(element=i, user_type="subscriber", graph=graph)
-        get_users(element=i, user_type="subscriber", graph=local_graph)
+    get_all_users(
+        repository.get_subscribers(), user_type="subscriber",
+        graph=local_graph, session=session)
 
     # Analyse issues of the repo
     if repository.has_issues is True:
-        prova_issues = repository.get_issues(state="all")
+        # Only the issues updated since the last analysis, if any
+        issues_watermark = get_watermark(incremental, "issues")
+        if issues_watermark is None:
+            prova_issues = repository.get_issues(state="all")
+        else:
+            prova_issues = repository.get_issues(
+                state="all", since=issues_watermark)
         for i in prova_issues:
-            issue_analysis(i, graph)
-            issue_analysis(i, local_graph)
+            issue_analysis(i, local_graph, session=session)
+            set_watermark(incremental, "issues", i.updated_at)
 
     # Analyse the commits of the repo
 
     # Get the log from GitHub, we want the GitHub username
     github_commits = []
-    commits = repository.get_commits()
+    # The commits of the previous analyses, if any, are identified by their
+    # sha: only the new ones of the git log are fetched from GitHub, since
+    # the date of the oldest one (even if it was pushed later)
+    git_commits = None
+    analysed_commits = None
+    if incremental is not None:
+        analysed_commits = set(incremental.get("analysed commits", []))
+    if not analysed_commits:
+        commits_found = repository.get_commits()
+    else:
+        git_commits = read_git_files_log(repository, path, git_files_log)
+        new_dates = [
+            parse_date(c["date"])
+            for each_file in git_commits for c in git_commits[each_file]
+            if c["@node"] not in analysed_commits]
+        if len(new_dates) == 0:
+            commits_found = []
+        else:
+            commits_found = repository.get_commits(
+                since=utc_date(min(new_dates, key=utils.timestamp_of)))
+    # Fetch the pages of commits as fast as the rate limit allows
+    commits = github_collection.fetch_all(
+        commits_found, session.client, session.budget)
     for i in commits:
-        # TODO Too many commits, slow down
-        sleep(10)
         if i is not None:
             commit = {
                 "@node": check_none(i.sha),
@@ -606,9 +932,10 @@ def repo_analysis(repository, path, graph):
     # And sometimes the same person uses different names on GitHub and git.
     # So we merge the GitHub log with the git log.
 
-    # Get the files log from cloning the repo
-    git_commits = git.git_remote_repo_log(
-        repository.clone_url, path, log_type="files")
+    # Get the files log from cloning the repo, unless it has already been
+    # extracted (or a function returns it when it is ready)
+    if git_commits is None:
+        git_commits = read_git_files_log(repository, path, git_files_log)
 
     # Add GitHub user details from the GitHub log to the git log of files
     # By checking the commit sha
@@ -617,26 +944,41 @@ def repo_analysis(repository, path, graph):
         # Collect the log of the files from git
         github_files_log[each_git_file] = git_commits[each_git_file]
 
+    # Index the log from GitHub by commit sha, with the authors of the
+    # commits found by the previous analyses
+    github_commits_index = {}
+    if incremental is not None:
+        for sha, author in incremental["commit authors"].items():
+            github_commits_index[sha] = {"@node": sha, "author": author}
+        for g in github_commits:
+            incremental["commit authors"][g["@node"]] = g["author"]
+    for g in github_commits:
+        github_commits_index[g["@node"]] = g
+
     # Check with the log from GitHub, and add username details from it
     for k in github_files_log:
-        for l, j in enumerate(github_files_log[k]):
-            current_sha = github_files_log[k][l]["@node"]
-            for g in github_commits:
-                if g["@node"] == current_sha:
-                    if g["author"]["#text"] != "None":
-                        github_files_log[k][l]["author"]["#text"] = g[
-                            "author"]["#text"]
-                    if g["author"]["@email"] != "None":
-                        github_files_log[k][l]["author"]["@email"] = g[
-                            "author"]["@email"]
-                    if g["author"]["avatar_url"] != "None":
-                        github_files_log[k][l]["author"]["avatar_url"] = g[
-                            "author"]["avatar_url"]
-                    github_files_log[k][l]["author"]["committer"] = "Yes"
-
-    # Update the main graph from the git + GitHub log
-    git.git_repo_analysis(github_files_log, graph)
-    git.git_repo_analysis(github_files_log, local_graph)
+        for j in github_files_log[k]:
+            g = github_commits_index.get(j["@node"])
+            if g is None:
+                continue
+            if g["author"]["#text"] != "None":
+                j["author"]["#text"] = g["author"]["#text"]
+            if g["author"]["@email"] != "None":
+                j["author"]["@email"] = g["author"]["@email"]
+            if g["author"]["avatar_url"] != "None":
+                j["author"]["avatar_url"] = g["author"]["avatar_url"]
+            j["author"]["committer"] = "Yes"
+
+    # Update the local graph from the git + GitHub log
+    git.git_repo_analysis(
+        github_files_log, local_graph, analysed=analysed_commits,
+        session=session)
+
+    # All the commits of the git log are now analysed
+    if incremental is not None:
+        incremental["analysed commits"] = sorted(set(
+            c["@node"] for each_file in github_files_log
+            for c in github_files_log[each_file]) | analysed_commits)
 
     # Get interactions from comments in commits on GitHub
     github_commits_comments = []
@@ -654,25 +996,22 @@ def repo_analysis(repository, path, graph):
         if i['@node'] not in github_commits_comments_ordered:
             github_commits_comments_ordered[i['@node']] = []
             # Add the commit to the comments, it is part of the discussion
-            commit_index = next((index
-                                 for index, d in enumerate(github_commits)
-                                 if d['@node'] == i['@node']))
-            github_commits_comments_ordered[i['@node']].append(github_commits[
-                commit_index])
-            github_commits_comments_ordered[i['@node']].append(i)
-        else:
-            github_commits_comments_ordered[i['@node']].append(i)
+            if i['@node'] in github_commits_index:
+                github_commits_comments_ordered[i['@node']].append(
+                    github_commits_index[i['@node']])
+        github_commits_comments_ordered[i['@node']].append(i)
 
     # Analyse each commit and its comments
     for each_commit in github_commits_comments_ordered:
-        comments_analysis(
-            github_commits_comments_ordered[each_commit],
-            graph,
-            comment_type="commit comment")
         comments_analysis(
             github_commits_comments_ordered[each_commit],
             local_graph,
-            comment_type="commit comment")
+            comment_type="commit comment",
+            session=session)
+
+    # Add the interactions to the main graph
+    utils.merge_graph(
+        local_graph, graph, deduplicate=incremental is not None)
 
     return local_graph
 
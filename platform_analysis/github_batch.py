@@ -0,0 +1,156 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from github import Github
+
+import networkx as nx
+from . import git
+from . import github_analysis
+from . import utils
+
+
+def extract_git_log(clone_url, path, clone_cache_path=None):
+    """
+    Clone a repository (or update its mirror in the clone cache) and return
+    the log of its files, with the seconds it took. It runs in a worker
+    process.
+    """
+
+    start = time.time()
+    git_log = git.git_remote_repo_log(
+        clone_url, path, log_type="files", cache_path=clone_cache_path)
+
+    # The clone failed
+    if not isinstance(git_log, dict):
+        git_log = {}
+
+    return git_log, time.time() - start
+
+
+def analyse_repository(repository, path, session, git_future, timing):
+    """
+    Analyse a single repository in its own session, with the log of its
+    files extracted by another process. It runs in a worker thread.
+    """
+
+    start = time.time()
+    name = repository.full_name
+
+    def wait_for_git_log():
+        git_log, seconds = git_future.result()
+        timing[name]["git"] = seconds
+        return git_log
+
+    graph = session.graph
+    github_analysis.repo_analysis(
+        repository=repository, path=path, graph=graph, session=session,
+        git_files_log=wait_for_git_log)
+    github_analysis.fork_analysis(
+        repository=repository, graph=graph, session=session)
+    github_analysis.pull_requests_analysis(
+        repository=repository, graph=graph, session=session)
+    github_analysis.clean_graph(graph=graph)
+
+    timing[name]["analysis"] = time.time() - start
+
+    return graph
+
+
+def merge_repository_graph(graph, target, repository, session):
+    """
+    Add the graph of a repository to the graph of all the repositories:
+    each interaction gets a new key from the session and the name of the
+    repository, and the roles of each user in any repository are kept.
+    """
+
+    for node, attributes in graph.nodes(data=True):
+        if node not in target:
+            target.add_node(node, **attributes)
+            continue
+        for attrib, value in attributes.items():
+            if target.nodes[node].get(attrib) in (None, "No", "None"):
+                target.nodes[node][attrib] = value
+
+    for source, destination, attributes in utils.graph_edges(
+            graph, data=True):
+        utils.add_edge(
+            target, source, destination, key=session.next_key(),
+            **dict(attributes, repository=repository))
+
+    return target
+
+
+def github_batch_analysis(username, userlogin, token, path,
+                          repositories=None, max_processes=None,
+                          max_threads=4,
+                          base_url="https://api.github.com",
+                          clone_cache_path=None):
+    """
+    Analyse many repositories of a GitHub user or organization (all of
+    them if no list of repository names is given), and merge them in a
+    single graph, where each interaction has the name of its repository.
+    The repositories are cloned and their logs are read by a pool of
+    max_processes processes, while their data are collected from GitHub
+    by a pool of max_threads threads, sharing the same rate budget.
+    With clone_cache_path, the mirrors of the repositories are kept there
+    and only updated by the following analyses.
+    Return a dict with the merged graph, the graph of each repository and
+    the seconds spent on each repository by git and by the analysis.
+    """
+
+    # Log in to GitHub and find the repositories
+    session = github_analysis.GitHubSession()
+    if repositories is None:
+        found = github_analysis.github_login(
+            username, token, session=session, base_url=base_url)
+        repository_objects = [found[k]["data"] for k in sorted(found)]
+    else:
+        session.client = Github(userlogin, token, base_url=base_url)
+        owner = session.client.get_user(username)
+        repository_objects = [owner.get_repo(r) for r in repositories]
+
+    timing = {}
+    graphs = {}
+    with ProcessPoolExecutor(max_workers=max_processes) as processes, \
+            ThreadPoolExecutor(max_workers=max_threads) as threads:
+
+        # Extract the git logs in parallel processes
+        git_futures = {}
+        for repository in repository_objects:
+            timing[repository.full_name] = {}
+            git_futures[repository.full_name] = processes.submit(
+                extract_git_log, repository.clone_url, path,
+                clone_cache_path)
+
+        # Analyse each repository in its own session, sharing the client,
+        # the rate budget and the directory of the users
+        futures = {}
+        for repository in repository_objects:
+            repository_session = github_analysis.GitHubSession(
+                client=session.client, budget=session.budget,
+                users=session.users)
+            futures[repository.full_name] = threads.submit(
+                analyse_repository, repository, path, repository_session,
+                git_futures[repository.full_name], timing)
+        for name in futures:
+            graphs[name] = futures[name].result()
+
+    # Merge the graphs of the repositories
+    merged_graph = nx.MultiDiGraph()
+    for name in graphs:
+        merge_repository_graph(graphs[name], merged_graph, name, session)
+
+    return {"graph": merged_graph, "graphs": graphs, "timing": timing}
+
+
+if __name__ == "__main__":
+    pass
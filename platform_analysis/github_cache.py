@@ -0,0 +1,302 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from . import github_collection
+
+
+class ResponseCache(object):
+    """
+    A persistent cache of the responses of the GitHub API, stored in a
+    SQLite database and keyed by host, endpoint with its parameters and
+    token. Cached responses are revalidated with their ETag, and GitHub
+    does not count the unchanged ones (304) against the rate limit.
+    The least recently used responses are evicted beyond max_entries,
+    and the ones older than max_age seconds (if given).
+    """
+
+    def __init__(self, path, max_entries=100000, max_age=None):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.database = sqlite3.connect(path, check_same_thread=False)
+        self.database.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "headers TEXT, body TEXT, stored REAL, used REAL)")
+        self.database.commit()
+        # Metrics of the cache
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evict()
+
+    def key(self, host, url, headers):
+        """
+        Return the key of a request: the token is hashed so that it is
+        never stored, while responses for different tokens are kept apart.
+        """
+
+        authorization = ""
+        for header in headers:
+            if header.lower() == "authorization":
+                authorization = headers[header]
+        token_hash = hashlib.sha1(authorization.encode("utf-8")).hexdigest()
+
+        return token_hash + " " + host + url
+
+    def get(self, key):
+        """
+        Return the cached response for a key as a dict, or None.
+        """
+
+        with self.lock:
+            row = self.database.execute(
+                "SELECT etag, last_modified, headers, body FROM responses "
+                "WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.database.execute(
+                "UPDATE responses SET used = ? WHERE key = ?",
+                (time.time(), key))
+            self.database.commit()
+
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "headers": json.loads(row[2]),
+            "body": row[3]
+        }
+
+    def store(self, key, headers, body):
+        """
+        Store a response with its ETag and Last-Modified headers
+        (with lowercase names).
+        """
+
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if etag is None and last_modified is None:
+            return
+
+        now = time.time()
+        with self.lock:
+            self.database.execute(
+                "INSERT OR REPLACE INTO responses "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, json.dumps(headers), body, now,
+                 now))
+            self.database.commit()
+            self.stores += 1
+            evict = self.stores % 1000 == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the responses older than max_age and the least recently
+        used ones beyond max_entries.
+        """
+
+        with self.lock:
+            if self.max_age is not None:
+                self.database.execute(
+                    "DELETE FROM responses WHERE stored < ?",
+                    (time.time() - self.max_age,))
+            self.database.execute(
+                "DELETE FROM responses WHERE key NOT IN ("
+                "SELECT key FROM responses ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,))
+            self.database.commit()
+
+    def metrics(self):
+        """
+        Return the number of revalidated (hits) and downloaded (misses)
+        responses.
+        """
+
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        """
+        Close the database of the cache.
+        """
+
+        with self.lock:
+            self.database.close()
+
+
+class CachedResponse(object):
+    """
+    A response of the GitHub API read from the cache, with the same
+    interface of the responses of PyGithub.
+    """
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.body
+
+
+def caching_connection_class(connection_class, cache):
+    """
+    Create a PyGithub connection class that sends conditional GET requests
+    for the responses in the cache, and stores the new ones.
+    """
+
+    class CachingConnection(object):
+        """
+        PyGithub shares one connection among the threads of a client, and
+        a request is sent by request() and then getresponse(): each thread
+        has its own wrapped connection and keeps the key and the cached
+        response of its pending request.
+        """
+
+        # The connection class that is wrapped
+        wrapped_class = connection_class
+
+        def __init__(self, *args, **kwargs):
+            self.arguments = (args, kwargs)
+            self.local = threading.local()
+            self.lock = threading.Lock()
+            self.connections = []
+            self.host = self.thread_state().connection.host
+
+        def thread_state(self):
+            """
+            Return the state of the current thread, with its connection.
+            """
+
+            state = self.local
+            if not hasattr(state, "connection"):
+                args, kwargs = self.arguments
+                state.connection = connection_class(*args, **kwargs)
+                state.key = None
+                state.cached = None
+                with self.lock:
+                    self.connections.append(state.connection)
+            return state
+
+        def __getattr__(self, name):
+            if name in ("arguments", "local", "lock", "connections"):
+                raise AttributeError(name)
+            return getattr(self.thread_state().connection, name)
+
+        def request(self, verb, url, input, headers, *args, **kwargs):
+            state = self.thread_state()
+            state.key = None
+            state.cached = None
+            if verb == "GET":
+                state.key = cache.key(self.host, url, headers)
+                state.cached = cache.get(state.key)
+                if state.cached is not None:
+                    headers = dict(headers)
+                    if state.cached["etag"] is not None:
+                        headers["If-None-Match"] = state.cached["etag"]
+                    if state.cached["last_modified"] is not None:
+                        headers["If-Modified-Since"] = \
+                            state.cached["last_modified"]
+            return state.connection.request(
+                verb, url, input, headers, *args, **kwargs)
+
+        def getresponse(self):
+            state = self.thread_state()
+            response = state.connection.getresponse()
+            if state.key is None:
+                return response
+
+            # Not modified: answer with the cached response, updated with
+            # the rate limit headers of the new one
+            if response.status == 304 and state.cached is not None:
+                headers = dict(state.cached["headers"])
+                for header, value in response.getheaders():
+                    headers[header.lower()] = value
+                with cache.lock:
+                    cache.hits += 1
+                return CachedResponse(200, headers, state.cached["body"])
+
+            if response.status == 200:
+                headers = {}
+                for header, value in response.getheaders():
+                    headers[header.lower()] = value
+                body = response.read()
+                cache.store(state.key, headers, body)
+                with cache.lock:
+                    cache.misses += 1
+                return CachedResponse(200, headers, body)
+
+            return response
+
+        def close(self):
+            with self.lock:
+                connections = self.connections
+                self.connections = []
+            for connection in connections:
+                connection.close()
+            self.local = threading.local()
+
+    return CachingConnection
+
+
+def reset_connection(requester):
+    """
+    Close the connection of a Requester, so that the next request opens a
+    new one with its current connection class.
+    """
+
+    connection = requester._Requester__connection
+    if connection is not None:
+        connection.close()
+    requester._Requester__connection = None
+
+
+def install(path, client, max_entries=100000, max_age=None):
+    """
+    Cache the requests of a PyGithub client in a SQLite database at path,
+    and return the cache. The other clients are not affected.
+    """
+
+    cache = ResponseCache(path, max_entries=max_entries, max_age=max_age)
+    requester = github_collection.requester_of(client)
+    requester._Requester__connectionClass = caching_connection_class(
+        requester._Requester__connectionClass, cache)
+    reset_connection(requester)
+
+    return cache
+
+
+def uninstall(client, cache=None):
+    """
+    Stop caching the requests of a PyGithub client, and close the cache if
+    given.
+    """
+
+    requester = github_collection.requester_of(client)
+    connection_class = requester._Requester__connectionClass
+    requester._Requester__connectionClass = getattr(
+        connection_class, "wrapped_class", connection_class)
+    reset_connection(requester)
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,325 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from github import GithubException
+
+
+class RateBudget(object):
+    """
+    A token bucket of GitHub API calls shared by all the workers that
+    collect data with the same token. Each request takes a token, and
+    tokens are refilled so that the remaining quota lasts until its reset,
+    as reported by GitHub in the X-RateLimit headers of the responses.
+    """
+
+    def __init__(self, calls=4000, period=3600):
+        self.lock = threading.Lock()
+        self.tokens = float(calls)
+        self.capacity = float(calls)
+        self.rate = float(calls) / period
+        self.updated = time.time()
+        # Metrics of the requests and of the time spent waiting
+        self.requests = 0
+        self.backoffs = 0
+        self.waited = 0.0
+
+    def refill(self):
+        """
+        Add the tokens accumulated since the last refill.
+        """
+
+        now = time.time()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take a token for a request, waiting for it if the budget is empty.
+        """
+
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Wait after a secondary rate limit error: as long as GitHub asks in
+        the Retry-After header, or exponentially longer at each attempt.
+        """
+
+        if retry_after is None:
+            retry_after = min(60 * 2 ** attempt, 900)
+        with self.lock:
+            self.backoffs += 1
+            self.waited += retry_after
+        time.sleep(retry_after)
+
+    def metrics(self):
+        """
+        Return the number of requests, of backoffs after secondary rate
+        limits and the seconds spent waiting.
+        """
+
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "backoffs": self.backoffs,
+                "waited": self.waited
+            }
+
+    def update(self, remaining, reset):
+        """
+        Align the budget with the remaining quota and its reset time
+        (a POSIX timestamp) reported by GitHub.
+        """
+
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, float(remaining))
+            seconds_to_reset = reset - time.time()
+            if seconds_to_reset > 0:
+                self.rate = max(float(remaining), 1.0) / seconds_to_reset
+
+    def update_from(self, client):
+        """
+        Align the budget with the quota of the last response of a
+        PyGithub client, as read from its X-RateLimit headers. Nothing is
+        updated if the last response had none of them, since asking the
+        client for its quota would request it from GitHub.
+        """
+
+        requester = requester_of(client)
+        remaining, limit = requester.rate_limiting
+        if remaining >= 0:
+            self.update(remaining, requester.rate_limiting_resettime)
+
+
+class PrefetchedObject(object):
+    """
+    Wrap a PyGithub object, returning the results of the calls that have
+    already been fetched and delegating everything else to the object.
+    """
+
+    def __init__(self, wrapped, calls):
+        self.wrapped = wrapped
+        self.calls = calls
+
+    def __getattr__(self, name):
+        value = getattr(self.wrapped, name)
+        if not callable(value):
+            return value
+
+        def prefetched_call(*args, **kwargs):
+            call = (name, args, tuple(sorted(kwargs.items())))
+            if call in self.calls:
+                return self.calls[call]
+            return value(*args, **kwargs)
+
+        return prefetched_call
+
+
+def requester_of(client):
+    """
+    Return the Requester of a PyGithub client, which sends the requests
+    and keeps the headers of the last response.
+    """
+
+    # Older versions of PyGithub keep it private
+    requester = getattr(client, "requester", None)
+    if requester is None:
+        requester = client._Github__requester
+
+    return requester
+
+
+def graphql_url(requester):
+    """
+    Return the url of the GraphQL API of the GitHub server of a Requester:
+    /api/graphql on GitHub Enterprise, /graphql on github.com.
+    """
+
+    url = getattr(requester, "graphql_url", None)
+    if url is not None:
+        return url
+
+    base_url = requester._Requester__base_url
+    if base_url.endswith("/api/v3"):
+        return base_url[:-len("/v3")] + "/graphql"
+
+    return base_url + "/graphql"
+
+
+def graphql_request(client, query, variables):
+    """
+    Send a GraphQL query with the Requester of a PyGithub client, and
+    return the headers and the whole response: its data and its errors,
+    if any, since a query may fail only for some of its fields.
+    """
+
+    requester = requester_of(client)
+
+    return requester.requestJsonAndCheck(
+        "POST", graphql_url(requester),
+        input={"query": query, "variables": variables})
+
+
+def is_rate_limited(error):
+    """
+    Check if an error of the GitHub API is due to a (secondary) rate limit.
+    """
+
+    return error.status in (403, 429) and \
+        "rate limit" in str(error.data).lower()
+
+
+def retry_after(error):
+    """
+    Return the seconds to wait after a rate limit error of the GitHub API,
+    or None if GitHub does not say it.
+    """
+
+    headers = error.headers or {}
+    for header in headers:
+        if header.lower() == "retry-after":
+            return float(headers[header])
+    for header in headers:
+        if header.lower() == "x-ratelimit-reset":
+            return max(float(headers[header]) - time.time(), 1.0)
+
+    return None
+
+
+def fetch_call(call, client, budget, retries=5):
+    """
+    Fetch the result of a single call of the GitHub API, taking a token
+    from the budget, and backing off if GitHub reports a rate limit.
+    """
+
+    for attempt in count():
+        budget.acquire()
+        try:
+            result = call()
+        except GithubException as e:
+            if not is_rate_limited(e) or attempt >= retries:
+                raise
+            budget.backoff(attempt, retry_after(e))
+            continue
+        budget.update_from(client)
+        return result
+
+
+def fetch_all(paginated_list, client, budget):
+    """
+    Fetch all the pages of a paginated list of the GitHub API, taking a
+    token from the budget for each page.
+    """
+
+    # Lists that have already been fetched
+    if isinstance(paginated_list, list):
+        return paginated_list
+
+    items = []
+    for page in count():
+        current_page = fetch_call(
+            lambda: paginated_list.get_page(page), client, budget)
+        if len(current_page) == 0:
+            break
+        items.extend(current_page)
+
+    return items
+
+
+def collect_repository(repository, client, max_workers=8, budget=None):
+    """
+    Fetch in parallel all the resources of a repository used by the
+    analysis, through a pool of max_workers threads sharing the same
+    rate budget. Return the repository wrapped so that the analysis reads
+    the fetched resources instead of requesting them one after another.
+    """
+
+    if budget is None:
+        budget = RateBudget()
+
+    # The independent streams of resources of the repository
+    streams = {
+        ("get_stargazers", (), ()): repository.get_stargazers,
+        ("get_collaborators", (), ()): repository.get_collaborators,
+        ("get_contributors", (), ()): repository.get_contributors,
+        ("get_watchers", (), ()): repository.get_watchers,
+        ("get_subscribers", (), ()): repository.get_subscribers,
+        ("get_commits", (), ()): repository.get_commits,
+        ("get_comments", (), ()): repository.get_comments,
+        ("get_forks", (), ()): repository.get_forks,
+        ("get_pulls", (), (("state", "closed"),)):
+            lambda: repository.get_pulls(state="closed"),
+        ("get_pulls", (), (("state", "open"),)):
+            lambda: repository.get_pulls(state="open"),
+    }
+    if repository.has_issues is True:
+        streams[("get_issues", (), (("state", "all"),))] = \
+            lambda: repository.get_issues(state="all")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        # Fetch all the streams of the repository
+        futures = {}
+        for call, stream in streams.items():
+            futures[call] = executor.submit(
+                fetch_all, stream(), client, budget)
+        calls = {}
+        for call in futures:
+            calls[call] = futures[call].result()
+
+        # Fetch the comments of each issue, and the comments and the merge
+        # status of each pull request
+        details = []
+        for call in calls:
+            if call[0] not in ("get_issues", "get_pulls"):
+                continue
+            for i in calls[call]:
+                details.append((
+                    i, ("get_comments", (), ()),
+                    executor.submit(fetch_all, i.get_comments(), client,
+                                    budget)))
+                if call[0] == "get_pulls":
+                    details.append((
+                        i, ("is_merged", (), ()),
+                        executor.submit(fetch_call, i.is_merged, client,
+                                        budget)))
+        element_calls = {}
+        for element, call, future in details:
+            if id(element) not in element_calls:
+                element_calls[id(element)] = {}
+            element_calls[id(element)][call] = future.result()
+
+    # Replace issues and pull requests with their prefetched version
+    for call in calls:
+        if call[0] in ("get_issues", "get_pulls"):
+            calls[call] = [
+                PrefetchedObject(i, element_calls[id(i)])
+                for i in calls[call]]
+
+    return PrefetchedObject(repository, calls)
+
+
+if __name__ == "__main__":
+    pass
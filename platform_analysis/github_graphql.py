@@ -0,0 +1,340 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+from dateutil.parser import parse
+from github import GithubException
+
+from . import github_collection
+
+
+# The fields of the author of an issue, pull request or comment
+actor_fields = """
+    login
+    avatarUrl
+    ... on User { email }
+"""
+
+# The fields of a comment
+comment_fields = """
+    databaseId
+    createdAt
+    body
+    author { %s }
+""" % actor_fields
+
+# The fields shared by issues and pull requests
+element_fields = """
+    id
+    databaseId
+    title
+    createdAt
+    updatedAt
+    author { %s }
+    assignees(first: 1) { nodes { %s } }
+    comments(first: 100) {
+        pageInfo { hasNextPage endCursor }
+        nodes { %s }
+    }
+""" % (actor_fields, actor_fields, comment_fields)
+
+# The issues of a repository, with their comments
+issues_query = """
+query($owner: String!, $name: String!, $first: Int!, $after: String) {
+    repository(owner: $owner, name: $name) {
+        issues(first: $first, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            nodes { %s }
+        }
+    }
+}
+""" % element_fields
+
+# The review threads of a pull request, with their review comments
+review_threads_fields = """
+    pageInfo { hasNextPage endCursor }
+    nodes {
+        id
+        comments(first: 50) {
+            pageInfo { hasNextPage endCursor }
+            nodes { %s }
+        }
+    }
+""" % comment_fields
+
+# The pull requests of a repository, with their merge status, their
+# comments and their review comments
+pulls_query = """
+query($owner: String!, $name: String!, $first: Int!, $after: String,
+      $states: [PullRequestState!]) {
+    repository(owner: $owner, name: $name) {
+        pullRequests(first: $first, after: $after, states: $states) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+                %s
+                merged
+                mergedAt
+                mergedBy { %s }
+                mergeCommit { oid }
+                reviewThreads(first: 50) { %s }
+            }
+        }
+    }
+}
+""" % (element_fields, actor_fields, review_threads_fields)
+
+# The following pages of the comments of an issue or a pull request
+comments_query = """
+query($id: ID!, $after: String) {
+    node(id: $id) {
+        ... on Issue {
+            comments(first: 100, after: $after) {
+                pageInfo { hasNextPage endCursor }
+                nodes { %s }
+            }
+        }
+        ... on PullRequest {
+            comments(first: 100, after: $after) {
+                pageInfo { hasNextPage endCursor }
+                nodes { %s }
+            }
+        }
+    }
+}
+""" % (comment_fields, comment_fields)
+
+# The following pages of the review threads of a pull request
+review_threads_query = """
+query($id: ID!, $after: String) {
+    node(id: $id) {
+        ... on PullRequest {
+            reviewThreads(first: 50, after: $after) { %s }
+        }
+    }
+}
+""" % review_threads_fields
+
+# The following pages of the comments of a review thread
+thread_comments_query = """
+query($id: ID!, $after: String) {
+    node(id: $id) {
+        ... on PullRequestReviewThread {
+            comments(first: 100, after: $after) {
+                pageInfo { hasNextPage endCursor }
+                nodes { %s }
+            }
+        }
+    }
+}
+""" % comment_fields
+
+
+class GraphQLObject(object):
+    """
+    A GitHub object read from a GraphQL response, with the attributes and
+    the methods of the PyGithub objects used by the analysis.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def to_user(actor):
+    """
+    Convert the author of a GraphQL node into a user object. Deleted users
+    are the ghost user, like in the REST API.
+    """
+
+    if actor is None:
+        actor = {"login": "ghost", "avatarUrl": None}
+
+    return GraphQLObject(
+        login=actor["login"],
+        email=actor.get("email") or None,
+        avatar_url=actor["avatarUrl"])
+
+
+def to_comment(node):
+    """
+    Convert a GraphQL comment node into a comment object.
+    """
+
+    return GraphQLObject(
+        id=node["databaseId"],
+        created_at=parse(node["createdAt"]),
+        body=node["body"],
+        user=to_user(node["author"]))
+
+
+def to_element(node, comments, **attributes):
+    """
+    Convert a GraphQL issue or pull request node into an object, with all
+    its comments already fetched.
+    """
+
+    assignees = node["assignees"]["nodes"]
+
+    return GraphQLObject(
+        id=node["databaseId"],
+        title=node["title"],
+        created_at=parse(node["createdAt"]),
+        updated_at=parse(node["updatedAt"]),
+        user=to_user(node["author"]),
+        assignee=to_user(assignees[0]) if len(assignees) > 0 else None,
+        get_comments=lambda: comments,
+        **attributes)
+
+
+def run_query(query, variables, client, budget):
+    """
+    Run a GraphQL query, taking a token from the budget, and return its
+    data. Any error of the query is raised as a GithubException.
+    """
+
+    headers, response = github_collection.fetch_call(
+        lambda: github_collection.graphql_request(client, query, variables),
+        client, budget)
+    if response.get("errors"):
+        raise GithubException(200, response, headers)
+
+    return response["data"]
+
+
+def fetch_connection(query, variables, path, client, budget, page_size):
+    """
+    Fetch all the nodes of a paginated GraphQL connection, found at path
+    in the data of the query.
+    """
+
+    nodes = []
+    after = None
+    while True:
+        page_variables = dict(variables, first=page_size, after=after)
+        connection = run_query(query, page_variables, client, budget)
+        for step in path:
+            connection = connection[step]
+        nodes.extend(connection["nodes"])
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = connection["pageInfo"]["endCursor"]
+
+    return nodes
+
+
+def fetch_pages(connection, query, node_id, field, client, budget):
+    """
+    Return all the nodes of a connection of a GraphQL node, fetching the
+    pages beyond the first one with query, from the field of the node.
+    """
+
+    nodes = connection["nodes"]
+    page_info = connection["pageInfo"]
+    while page_info["hasNextPage"]:
+        data = run_query(
+            query, {"id": node_id, "after": page_info["endCursor"]},
+            client, budget)
+        connection = data["node"][field]
+        nodes = nodes + connection["nodes"]
+        page_info = connection["pageInfo"]
+
+    return nodes
+
+
+def fetch_comments(node, client, budget):
+    """
+    Return all the comments of an issue or a pull request, fetching the
+    ones beyond the first page of the node.
+    """
+
+    return fetch_pages(
+        node["comments"], comments_query, node["id"], "comments", client,
+        budget)
+
+
+def fetch_review_comments(node, client, budget):
+    """
+    Return all the review comments of a pull request, fetching the review
+    threads and the comments beyond the first page of each one.
+    """
+
+    threads = fetch_pages(
+        node["reviewThreads"], review_threads_query, node["id"],
+        "reviewThreads", client, budget)
+    comments = []
+    for thread in threads:
+        comments.extend(fetch_pages(
+            thread["comments"], thread_comments_query, thread["id"],
+            "comments", client, budget))
+
+    return comments
+
+
+def collect_repository(repository, client, budget=None, page_size=100):
+    """
+    Fetch the issues and the pull requests of a repository, with their
+    merge status, comments and authors, in paginated GraphQL queries of
+    page_size nodes. Return the repository wrapped so that the analysis
+    reads them instead of requesting each one through the REST API.
+    """
+
+    if budget is None:
+        budget = github_collection.RateBudget()
+
+    variables = {
+        "owner": repository.owner.login,
+        "name": repository.name
+    }
+    calls = {}
+
+    # The REST API lists the pull requests among the issues, and each of
+    # them is analysed also as an issue
+    all_issues = []
+
+    # Pull requests, with their merge status and review comments
+    for state, states in (("closed", ["CLOSED", "MERGED"]),
+                          ("open", ["OPEN"])):
+        pulls = []
+        pull_nodes = fetch_connection(
+            pulls_query, dict(variables, states=states),
+            ["repository", "pullRequests"], client, budget,
+            max(page_size // 2, 1))
+        for node in pull_nodes:
+            issue_comments = [
+                to_comment(c) for c in fetch_comments(node, client, budget)]
+            review_comments = [
+                to_comment(c)
+                for c in fetch_review_comments(node, client, budget)]
+            pulls.append(to_element(
+                node, review_comments,
+                is_merged=lambda merged=node["merged"]: merged,
+                merged_at=parse(node["mergedAt"])
+                if node["mergedAt"] is not None else None,
+                merged_by=to_user(node["mergedBy"])
+                if node["merged"] is True else None,
+                merge_commit_sha=node["mergeCommit"]["oid"]
+                if node["mergeCommit"] is not None else None))
+            all_issues.append(to_element(node, issue_comments))
+        calls[("get_pulls", (), (("state", state),))] = pulls
+
+    # Issues, with their comments
+    if repository.has_issues is True:
+        issue_nodes = fetch_connection(
+            issues_query, variables, ["repository", "issues"], client,
+            budget, page_size)
+        for node in issue_nodes:
+            comments = [
+                to_comment(c) for c in fetch_comments(node, client, budget)]
+            all_issues.append(to_element(node, comments))
+        all_issues.sort(key=lambda x: x.created_at, reverse=True)
+        calls[("get_issues", (), (("state", "all"),))] = all_issues
+
+    return github_collection.PrefetchedObject(repository, calls)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,228 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from github import GithubException
+
+from . import github_collection
+
+
+# The fields of the profile of each user in a batch
+user_fields = "login email avatarUrl"
+
+
+class UserDirectory(object):
+    """
+    A memo of the profiles (login, email and avatar url) of the GitHub
+    users, so that each user is requested at most once. The most recently
+    used max_entries profiles are kept in memory, and all of them in a
+    SQLite database at path (if given) across the analyses.
+    Missing profiles are requested in batches of GraphQL queries.
+    """
+
+    def __init__(self, max_entries=10000, path=None, batch_size=100):
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.profiles = OrderedDict()
+        self.database = None
+        if path is not None:
+            self.database = sqlite3.connect(path, check_same_thread=False)
+            self.database.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "login TEXT PRIMARY KEY, email TEXT, avatar_url TEXT)")
+            self.database.commit()
+        # Metrics of the directory
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, login):
+        """
+        Return the profile of a user as a dict, or None if it is unknown.
+        """
+
+        with self.lock:
+            if login in self.profiles:
+                self.profiles.move_to_end(login)
+                self.hits += 1
+                return self.profiles[login]
+            if self.database is not None:
+                row = self.database.execute(
+                    "SELECT login, email, avatar_url FROM users "
+                    "WHERE login = ?", (login,)).fetchone()
+                if row is not None:
+                    self.hits += 1
+                    profile = {
+                        "login": row[0],
+                        "email": row[1],
+                        "avatar_url": row[2]
+                    }
+                    self.remember(profile)
+                    return profile
+
+        return None
+
+    def put(self, profile):
+        """
+        Store the profile of a user.
+        """
+
+        with self.lock:
+            self.misses += 1
+            self.remember(profile)
+            if self.database is not None:
+                self.database.execute(
+                    "INSERT OR REPLACE INTO users VALUES (?, ?, ?)",
+                    (profile["login"], profile["email"],
+                     profile["avatar_url"]))
+                self.database.commit()
+
+    def remember(self, profile):
+        """
+        Keep a profile in memory, forgetting the least recently used one
+        beyond max_entries.
+        """
+
+        self.profiles[profile["login"]] = profile
+        self.profiles.move_to_end(profile["login"])
+        while len(self.profiles) > self.max_entries:
+            self.profiles.popitem(last=False)
+
+    def resolve(self, element, client, budget):
+        """
+        Return the profile of a PyGithub user.
+        """
+
+        return self.resolve_all([element], client, budget)[element.login]
+
+    def resolve_all(self, elements, client, budget):
+        """
+        Return a dict of the profiles of many PyGithub users by login,
+        requesting the unknown ones in batches.
+        """
+
+        profiles = {}
+        missing = []
+        for element in elements:
+            if element is None or element.login in profiles:
+                continue
+            profile = self.get(element.login)
+            if profile is not None:
+                profiles[element.login] = profile
+                continue
+            # The profile is already in the data of the user, if it was
+            # fully loaded (or read from GraphQL): use it without requesting
+            # it again
+            raw_data = getattr(element, "_rawData", None)
+            if raw_data is None:
+                raw_data = getattr(element, "__dict__", {})
+            if "email" in raw_data:
+                profile = {
+                    "login": element.login,
+                    "email": raw_data["email"],
+                    "avatar_url": raw_data.get("avatar_url")
+                }
+                self.put(profile)
+                profiles[element.login] = profile
+            else:
+                missing.append(element.login)
+                profiles[element.login] = None
+
+        # Request the unknown users in batches
+        missing = list(OrderedDict.fromkeys(missing))
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            for profile in self.fetch_batch(batch, client, budget):
+                self.put(profile)
+                profiles[profile["login"]] = profile
+
+        return profiles
+
+    def fetch_batch(self, logins, client, budget):
+        """
+        Request the profiles of a batch of users with a single GraphQL
+        query. Users that GitHub does not find are returned without email
+        and avatar, and the ones that the query fails to return for any
+        other reason (or all of them, if GraphQL is not available) are
+        requested one by one through the REST API.
+        """
+
+        query = "query {\n"
+        for k, login in enumerate(logins):
+            query += "u%d: user(login: %s) { %s }\n" % (
+                k, json.dumps(login), user_fields)
+        query += "}"
+
+        # The data is kept even if the query has errors, which are only
+        # for the users that it could not return
+        try:
+            headers, response = github_collection.fetch_call(
+                lambda: github_collection.graphql_request(client, query, {}),
+                client, budget)
+            data = response.get("data") or {}
+            not_found = set(
+                error["path"][0] for error in response.get("errors", [])
+                if error.get("type") == "NOT_FOUND" and error.get("path"))
+        except GithubException:
+            data = {}
+            not_found = set()
+
+        profiles = []
+        for k, login in enumerate(logins):
+            user = data.get("u%d" % k)
+            if user is not None:
+                profiles.append({
+                    "login": login,
+                    "email": user["email"] or None,
+                    "avatar_url": user["avatarUrl"]
+                })
+            elif "u%d" % k in not_found:
+                profiles.append(
+                    {"login": login, "email": None, "avatar_url": None})
+            else:
+                try:
+                    user = github_collection.fetch_call(
+                        lambda: client.get_user(login).raw_data, client,
+                        budget)
+                except GithubException:
+                    user = {}
+                profiles.append({
+                    "login": login,
+                    "email": user.get("email"),
+                    "avatar_url": user.get("avatar_url")
+                })
+
+        return profiles
+
+    def metrics(self):
+        """
+        Return the number of profiles found in the directory (hits) and
+        requested to GitHub (misses).
+        """
+
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        """
+        Close the database of the directory, if any.
+        """
+
+        with self.lock:
+            if self.database is not None:
+                self.database.close()
+                self.database = None
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,237 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import re
+import gzip
+import array
+import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from . import utils
+
+
+# The characters that are not allowed in XML 1.0
+invalid_xml_characters = re.compile(
+    "[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+# The types of the attributes in GraphML (the same in GEXF)
+graphml_types = {
+    bool: "boolean", int: "long", float: "double", str: "string"}
+
+
+def open_output(filename):
+    """
+    Open a file for writing text, compressed with gzip if its name ends
+    with .gz.
+    """
+
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "wt", encoding="utf-8")
+
+    return open(filename, "w", encoding="utf-8")
+
+
+def export_value(value):
+    """
+    Return the type (for GraphML) and the text of the value of an
+    attribute. Dates, arrays and any other value are exported as text.
+    """
+
+    if type(value) in graphml_types:
+        value_type = graphml_types[type(value)]
+    else:
+        value_type = "string"
+    if isinstance(value, datetime.datetime):
+        text = value.isoformat()
+    elif isinstance(value, array.array):
+        text = " ".join(repr(i) for i in value)
+    elif isinstance(value, bool):
+        text = str(value).lower()
+    else:
+        text = str(value)
+
+    return value_type, invalid_xml_characters.sub("", text)
+
+
+def merge_type(current_type, value_type):
+    """
+    Return the type of an attribute with values of two types.
+    """
+
+    if current_type is None or current_type == value_type:
+        return value_type
+    if {current_type, value_type} == {"long", "double"}:
+        return "double"
+
+    return "string"
+
+
+def iter_export_edges(graph, self_loops=True, edge_attributes=None):
+    """
+    Iterate over the edges of a graph (and of its edge store, if any) to
+    export, skipping the self loops if not self_loops. Each dict of
+    attributes is passed through edge_attributes, if given, which returns
+    the attributes to export without changing the graph.
+    """
+
+    for u, v, key, attr in utils.graph_edges(graph, keys=True, data=True):
+        if self_loops is False and u == v:
+            continue
+        if edge_attributes is not None:
+            attr = edge_attributes(attr)
+        yield u, v, key, attr
+
+
+def attribute_types(items):
+    """
+    Return the name and the type of all the attributes of the dicts in
+    items, in order of appearance.
+    """
+
+    types = {}
+    for attr in items:
+        for name, value in attr.items():
+            types[name] = merge_type(types.get(name), export_value(value)[0])
+
+    return types
+
+
+def write_graphml(graph, filename, self_loops=True, edge_attributes=None):
+    """
+    Write a graph as GraphML one node and one edge at a time, so that the
+    whole XML document is never in memory (as it is with
+    nx.write_graphml). The attribute keys are found with a first pass on
+    the graph, and declared before the nodes and the edges.
+    The file is compressed with gzip if its name ends with .gz.
+    """
+
+    # The attributes of the graph, of the nodes and of the edges
+    graph_types = attribute_types(
+        [{k: v for k, v in graph.graph.items() if k != "edge_store"}])
+    node_types = attribute_types(attr for n, attr in graph.nodes(data=True))
+    edge_types = attribute_types(
+        attr for u, v, key, attr in iter_export_edges(
+            graph, self_loops, edge_attributes))
+
+    # The id of each key
+    key_ids = {}
+    with open_output(filename) as output:
+        output.write(
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            "<graphml xmlns=\"http://graphml.graphdrawing.org/xmlns\" "
+            "xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" "
+            "xsi:schemaLocation=\"http://graphml.graphdrawing.org/xmlns "
+            "http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd\">\n")
+        for domain, types in (("graph", graph_types), ("node", node_types),
+                              ("edge", edge_types)):
+            for name, value_type in types.items():
+                key_ids[domain, name] = "d%d" % len(key_ids)
+                output.write(
+                    "  <key id=%s for=%s attr.name=%s attr.type=%s />\n" % (
+                        quoteattr(key_ids[domain, name]), quoteattr(domain),
+                        quoteattr(str(name)), quoteattr(value_type)))
+
+        def data(domain, attr):
+            return "".join(
+                "<data key=%s>%s</data>" % (
+                    quoteattr(key_ids[domain, name]),
+                    escape(export_value(value)[1]))
+                for name, value in attr.items())
+
+        output.write("  <graph edgedefault=\"directed\">%s\n" % data(
+            "graph",
+            {k: v for k, v in graph.graph.items() if k != "edge_store"}))
+        for n, attr in graph.nodes(data=True):
+            output.write("    <node id=%s>%s</node>\n" % (
+                quoteattr(export_value(n)[1]), data("node", attr)))
+        for u, v, key, attr in iter_export_edges(
+                graph, self_loops, edge_attributes):
+            output.write(
+                "    <edge id=%s source=%s target=%s>%s</edge>\n" % (
+                quoteattr(export_value(key)[1]),
+                quoteattr(export_value(u)[1]), quoteattr(export_value(v)[1]),
+                data("edge", attr)))
+        output.write("  </graph>\n</graphml>\n")
+
+    return
+
+
+def write_gexf(graph, filename, self_loops=True, edge_attributes=None):
+    """
+    Write a graph as GEXF (the format of Gephi) one node and one edge at a
+    time, like write_graphml. The Label of the users is their label, and
+    the weight of the weighted edges of aggregated graphs their weight.
+    The file is compressed with gzip if its name ends with .gz.
+    """
+
+    # The attributes of the nodes and of the edges
+    node_types = attribute_types(
+        {k: v for k, v in attr.items() if k != "Label"}
+        for n, attr in graph.nodes(data=True))
+    edge_types = attribute_types(
+        {k: v for k, v in attr.items() if k != "weight"}
+        for u, v, key, attr in iter_export_edges(
+            graph, self_loops, edge_attributes))
+
+    # The id of each attribute
+    attribute_ids = {}
+    with open_output(filename) as output:
+        output.write(
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            "<gexf xmlns=\"http://www.gexf.net/1.2draft\" version=\"1.2\">\n"
+            "  <graph defaultedgetype=\"directed\" mode=\"static\">\n")
+        for domain, types in (("node", node_types), ("edge", edge_types)):
+            output.write("    <attributes class=%s>\n" % quoteattr(domain))
+            for name, value_type in types.items():
+                attribute_ids[domain, name] = str(len(attribute_ids))
+                output.write(
+                    "      <attribute id=%s title=%s type=%s />\n" % (
+                        quoteattr(attribute_ids[domain, name]),
+                        quoteattr(str(name)),
+                        quoteattr(value_type)))
+            output.write("    </attributes>\n")
+
+        def attvalues(domain, attr):
+            values = "".join(
+                "<attvalue for=%s value=%s />" % (
+                    quoteattr(attribute_ids[domain, name]),
+                    quoteattr(export_value(value)[1]))
+                for name, value in attr.items()
+                if (domain, name) in attribute_ids)
+            if values == "":
+                return ""
+            return "<attvalues>%s</attvalues>" % values
+
+        output.write("    <nodes>\n")
+        for n, attr in graph.nodes(data=True):
+            output.write("      <node id=%s label=%s>%s</node>\n" % (
+                quoteattr(export_value(n)[1]),
+                quoteattr(export_value(attr.get("Label", n))[1]),
+                attvalues("node", attr)))
+        output.write("    </nodes>\n    <edges>\n")
+
+        # The edges of GEXF need a unique id
+        for edge_id, (u, v, key, attr) in enumerate(iter_export_edges(
+                graph, self_loops, edge_attributes)):
+            weight = ""
+            if "weight" in attr:
+                weight = " weight=%s" % quoteattr(
+                    export_value(attr["weight"])[1])
+            output.write(
+                "      <edge id=\"%d\" source=%s target=%s%s>%s</edge>\n" % (
+                    edge_id, quoteattr(export_value(u)[1]),
+                    quoteattr(export_value(v)[1]), weight,
+                    attvalues("edge", attr)))
+        output.write("    </edges>\n  </graph>\n</gexf>\n")
+
+    return
+
+
+if __name__ == "__main__":
+    pass
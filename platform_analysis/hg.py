@@ -10,21 +10,154 @@
 import subprocess
 import xmltodict
 
+from . import github_analysis
+from . import utils
+
 
 # Get the information of an hg repository into a dict
 def get_log(projectpath):
 
-    # Get the verbose log in xml
-    hglog = subprocess.check_output(
-        ['hg log --verbose --style=xml'],
-        cwd=projectpath, shell=True)
+    # Get the verbose log in xml, reading it from the pipe
+    command = ['hg', 'log', '--verbose', '--style=xml']
+    process = subprocess.Popen(command, cwd=projectpath,
+                               stdout=subprocess.PIPE)
 
     # Convert to a dict
-    all_commits = xmltodict.parse(hglog)
+    try:
+        all_commits = xmltodict.parse(process.stdout)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
 
     # Return the full log with files changed at each commit
     return all_commits
 
 
+def parse_log_entry(element):
+    """
+    Convert a logentry element of the hg xml log into a commit dict, with
+    the list of the files changed by the commit, like the git log records.
+    """
+
+    author = element.find("author")
+    commit = {
+        "@node": element.get("node"),
+        "@revision": element.get("revision"),
+        "date": element.findtext("date"),
+        "msg": element.findtext("msg", ""),
+        "author": {
+            "#text": author.text if author is not None else "",
+            "@email": author.get("email", "") if author is not None else ""
+        },
+        "files": []
+    }
+
+    # The source of each copied file
+    copies = {}
+    for copy in element.iter("copy"):
+        copies[copy.text] = copy.get("source")
+
+    # Removed files are R in hg: use the git actions, where copies from a
+    # removed file are renames
+    removed = set()
+    for path in element.iter("path"):
+        if path.get("action") == "R":
+            removed.add(path.text)
+    for path in element.iter("path"):
+        action = path.get("action")
+        each_file = {"@action": action, "#text": path.text}
+        if action == "R":
+            if path.text in copies.values():
+                continue
+            each_file["@action"] = "D"
+        elif path.text in copies:
+            each_file["@copyfrom-path"] = copies[path.text]
+            if copies[path.text] in removed:
+                each_file["@action"] = "R"
+            else:
+                each_file["@action"] = "C"
+        commit["files"].append(each_file)
+
+    return commit
+
+
+def iter_log(projectpath, revisions=None):
+    """
+    Run hg log once and yield each commit of an hg repository, with the
+    files changed in it, while the log is still being read from the pipe.
+    With revisions, only the commits of that revision range are read.
+    """
+
+    command = ['hg', 'log', '--verbose', '--style=xml']
+    if revisions is not None:
+        command.extend(['--rev', revisions])
+
+    return utils.iter_xml_log(command, projectpath, parse_log_entry)
+
+
+def get_files_log(projectpath, follow_renames=True, revisions=None):
+    """
+    Get the history of each edited file in an hg repository into a dict.
+    With revisions (like "1000:tip"), only the commits of that revision
+    range are read.
+    """
+
+    # Read the commits from the newest to the oldest one, as git does
+    if revisions is None:
+        revisions = "reverse(all())"
+    else:
+        revisions = "sort(%s, -rev)" % revisions
+
+    # Build the history of each file from a single pass on the log
+    hg_all_files_log = utils.build_files_history(
+        iter_log(projectpath, revisions), follow_renames=follow_renames)
+
+    # Return the full log with the history of each file
+    return {"log": {"logentry": hg_all_files_log}}
+
+
+def hg_repo_analysis(hg_files_log, graph, aggregate=False,
+                     timestamps=False, analysed=None, session=None):
+    """
+    The main function of SNA for an hg repo, like git.git_repo_analysis.
+    """
+
+    # The state of the analysis
+    session = github_analysis.get_session(session)
+
+    # Connect the committers of each file
+    return utils.files_history_analysis(
+        hg_files_log, graph, session, aggregate=aggregate,
+        timestamps=timestamps, analysed=analysed)
+
+
+def hg_local_repo_analysis(projectpath, graph, aggregate=False,
+                           timestamps=False, session=None, revisions=None):
+    """
+    Analyse a local hg repository, while its log is read (see
+    utils.commits_analysis).
+    With revisions, only the commits of that revision range are analysed,
+    so that a long history can be analysed in bounded windows.
+    """
+
+    # The state of the analysis
+    session = github_analysis.get_session(session)
+
+    # Read the commits from the oldest to the newest one
+    if revisions is None:
+        revisions = "all()"
+    else:
+        revisions = "sort(%s, rev)" % revisions
+
+    # Analyse the commits while the log is read
+    utils.commits_analysis(
+        iter_log(projectpath, revisions), graph, session,
+        aggregate=aggregate, timestamps=timestamps)
+
+    return graph
+
+
 if __name__ == "__main__":
     pass
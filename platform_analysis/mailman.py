@@ -18,10 +18,12 @@ import sys
 import urllib
 import os
 import uuid
+from . import utils
 
 # TODO Update with https://networkx.org/documentation/stable/auto_examples/drawing/plot_unix_email.html?highlight=mbox
 
-def mailman_analysis(url, list_name, username, password):
+def mailman_analysis(url, list_name, username, password, aggregate=False,
+                     timestamps=False):
     """
     Analyse the discussion of a Mailman discussion list. Download and parse an .mbox from a Mailman archive with:
 
@@ -60,6 +62,13 @@ def mailman_analysis(url, list_name, username, password):
 
     G = nx.MultiDiGraph()  # create empty graph
 
+    # Collapse parallel messages into weighted edges, if required
+    if aggregate:
+        utils.aggregate_graph(G, timestamps=timestamps)
+
+    # The same end year for all the edges of this analysis
+    endopen = datetime.datetime.now().year
+
     # parse each messages and build graph
     for msg in mbox:  # msg is python email.Message.Message object
         (source_name, source_addr) = parseaddr(msg['From'])  # sender
@@ -78,7 +87,9 @@ def mailman_analysis(url, list_name, username, password):
 
         # now add the edges for this mail message
         for (target_name, target_addr) in all_recipients:
-            G.add_edge(source_addr, target_addr, message=msg)
+            utils.add_interaction(
+                G, source_addr, target_addr, message=msg, type="email",
+                start=date, endopen=endopen)
 
     # Delete file
     os.remove(filename)
@@ -8,145 +8,254 @@
 #
 
 
+import os
+import json
 import networkx as nx
 import datetime
+import bisect
+import itertools
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from . import edge_store
+from . import graph_export
+from . import utils
+
+
+def graphml_edge_attributes(attr):
+    """
+    Return a copy of the attributes of an edge with its dates as strings,
+    as saved by save_graph.
+    """
+
+    attr = dict(attr)
+    if type(attr["start"]) is datetime.datetime:
+        attr["start"] = attr["start"].strftime('%Y/%m/%d-%H:%M:%S')
+    attr["endopen"] = str(attr["endopen"])
+    # Attributes of the weighted edges of aggregated graphs
+    if type(attr.get("last")) is datetime.datetime:
+        attr["last"] = attr["last"].strftime('%Y/%m/%d-%H:%M:%S')
+    if "timestamps" in attr and type(attr["timestamps"]) is not str:
+        attr["timestamps"] = " ".join(
+            repr(i) for i in attr["timestamps"])
+
+    return attr
 
 
 def save_graph(graph, filename, self_loops):
     """
-    Transform date on a graph to string and save as a graphml file
+    Transform date on a graph to string and save as a graphml file.
+    The graph is written one edge at a time and is not changed (see
+    graph_export.write_graphml); a filename ending with .gz is compressed.
     """
 
-    for u, v, key, attr in graph.edges(data=True, keys=True):
-        if type(attr["start"]) is datetime.datetime:
-            attr["start"] = attr["start"].strftime('%Y/%m/%d-%H:%M:%S')
-        attr["endopen"] = str(attr["endopen"])
+    graph_export.write_graphml(
+        graph, filename, self_loops=self_loops,
+        edge_attributes=graphml_edge_attributes)
 
-    if self_loops is False:
-        self_loops_edges = nx.selfloop_edges(graph, keys=True, data=True)
-        graph.remove_edges_from(list(self_loops_edges))
-    else:
-        pass
+    return
+
+
+def save_graph_columns(graph, path):
+    """
+    Save a graph as a directory of binary columns: the edges as an edge
+    store (see edge_store), with a .npy file for each column, and the
+    nodes as JSON. Much faster to write and read than GraphML, and the
+    starts of the interactions are kept as timestamps, with their UTC
+    offsets.
+    The graph itself is not changed.
+    """
 
-    nx.write_graphml(graph, filename)
+    # The edges that are not in an edge store yet
+    store = graph.graph.get("edge_store")
+    if store is None or graph.number_of_edges() > 0:
+        store = edge_store.EdgeStore()
+        for u, v, key, attr in utils.graph_edges(
+                graph, keys=True, data=True):
+            store.add(u, v, key=key, **attr)
+    store.save(path)
+
+    nodes = {
+        "graph": [[k, edge_store.encode_value(v)]
+                  for k, v in graph.graph.items() if k != "edge_store"],
+        "nodes": [[edge_store.encode_value(n),
+                   [[k, edge_store.encode_value(v)] for k, v in attr.items()]]
+                  for n, attr in graph.nodes(data=True)]
+    }
+    with open(os.path.join(path, "nodes.json"), "w") as nodes_file:
+        json.dump(nodes, nodes_file)
 
     return
 
 
-def graph_to_pandas_time_series(graph):
+def load_graph_columns(path, mmap=True):
     """
-    Transform a graph into a pandas time series DataFrame.
+    Load a graph saved with save_graph_columns, with its edges in an edge
+    store (see utils.compact_graph). With mmap, the columns of the edges
+    are memory mapped from their files instead of being read.
+    The weighted edges of aggregated graphs are loaded in the edge store
+    too: expand the graph (see utils.expand_graph) to add interactions.
     """
 
-    # List of rows
-    rows_list = []
-
-    # Empty DataFrame of interactions
-    time_dataframe = pd.DataFrame(columns=[
-        '0',
-        '1',
-        'node',
-        'msg',
-        'type',
-        'endopen',
-        'start',
-        'value'
-        ])
-
-    # Iterate over edges to create a DataFrame of interactions
-    for u, v, d in graph.edges(data=True):
-        if "node" in d:
-            node = d["node"]
-        else:
-            node = "None"
-        if "msg" in d:
-            msg = d["msg"]
+    with open(os.path.join(path, "nodes.json")) as nodes_file:
+        nodes = json.load(nodes_file)
+
+    graph = nx.MultiDiGraph()
+    for k, v in nodes["graph"]:
+        graph.graph[k] = edge_store.decode_value(v)
+    for n, attr in nodes["nodes"]:
+        graph.add_node(
+            edge_store.decode_value(n),
+            **{k: edge_store.decode_value(v) for k, v in attr})
+    graph.graph["edge_store"] = edge_store.EdgeStore.load(path, mmap=mmap)
+
+    return graph
+
+
+# The columns of the time series DataFrame of interactions
+time_series_columns = [
+    '0',
+    '1',
+    'node',
+    'msg',
+    'type',
+    'endopen',
+    'start',
+    'value'
+    ]
+
+
+def edges_to_columns(edges):
+    """
+    Convert the edges of a graph into a dict with a list for each column
+    of the time series DataFrame of interactions.
+    """
+
+    columns = {column: [] for column in time_series_columns}
+
+    # Iterate over edges once, appending to each column
+    for u, v, d in edges:
+        node = d["node"] if "node" in d else "None"
+        msg = d["msg"] if "msg" in d else "None"
+
+        # Weighted edges of aggregated graphs are a row for each of their
+        # timestamps, or a single row with their weight as value
+        if "timestamps" in d:
+            starts = [
+                datetime.datetime.fromtimestamp(i, datetime.timezone.utc)
+                for i in d["timestamps"]]
+            values = [1] * len(starts)
+        elif "weight" in d:
+            starts = [d["start"]]
+            values = [d["weight"]]
         else:
-            msg = "None"
-        # Create a new row
-        new_row = [
-            u,
-            v,
-            node,
-            msg,
-            d["type"],
-            d["endopen"],
-            d["start"],
-            1
-            ]
-        # Add the new row to the DataFrame of interactions
-        #time_dataframe.loc[len(time_dataframe)] = new_row
-        row_df = pd.DataFrame([new_row])
-        rows_list.append(row_df)
-
-    # Convert list to full dataframe
-    time_dataframe = pd.concat(rows_list, axis=0)
-    time_dataframe.rename(columns={0: "0", 1: "1", 2: 'node', 3: 'msg',
-                      4: 'type', 5: 'endopen', 6: 'start',
-                      7: 'value'}, inplace=True)
-
-    # Convert column strings to datetimes
-    time_dataframe['start'] = pd.to_datetime(time_dataframe['start'])
-    time_dataframe['endopen'] = pd.to_datetime(time_dataframe['endopen'])
+            starts = [d["start"]]
+            values = [1]
+
+        rows = len(starts)
+        columns['0'].extend([u] * rows)
+        columns['1'].extend([v] * rows)
+        columns['node'].extend([node] * rows)
+        columns['msg'].extend([msg] * rows)
+        columns['type'].extend([d["type"]] * rows)
+        columns['endopen'].extend([d["endopen"]] * rows)
+        columns['start'].extend(starts)
+        columns['value'].extend(values)
+
+    return columns
+
+
+def columns_to_time_series(columns):
+    """
+    Build the time series DataFrame of interactions from its columns.
+    """
+
+    time_dataframe = pd.DataFrame(columns, columns=time_series_columns)
+
+    # Users and types of interaction repeat a lot: store them as categories
+    for column in ['0', '1', 'type']:
+        time_dataframe[column] = time_dataframe[column].astype("category")
+
+    # Convert column strings to UTC datetimes, since the dates of the
+    # interactions may have different UTC offsets
+    for column in ['start', 'endopen']:
+        time_dataframe[column] = pd.to_datetime(
+            time_dataframe[column], utc=True)
 
     return time_dataframe
 
 
-def time_analysis(data, focus, interaction, structure):
+def graph_to_pandas_time_series(graph):
+    """
+    Transform a graph into a pandas time series DataFrame.
+    """
+
+    return columns_to_time_series(
+        edges_to_columns(utils.graph_edges(graph, data=True)))
+
+
+def iter_graph_to_pandas_time_series(graph, chunk_size=100000):
+    """
+    Transform a graph into a sequence of pandas time series DataFrames,
+    each one with the interactions of at most chunk_size edges.
+    """
+
+    edges = utils.graph_edges(graph, data=True)
+    while True:
+        chunk = list(itertools.islice(edges, chunk_size))
+        if len(chunk) == 0:
+            break
+        yield columns_to_time_series(edges_to_columns(chunk))
+
+
+def time_analysis(data, focus, interaction, structure, freq=None):
     """
     Analyse a pandas time series DataFrame.
     Returns a time-series DataFrame. If structure == "combined".
     Returns a Series with all the interactions merged.
+    With freq (a pandas frequency like "D", "W" or "MS"), the interactions
+    are counted for each period instead of each timestamp.
     """
 
-    # Define the DataFrame index as time-based
-    data.index = data['start']
     # List of types of interaction
     interaction_types = data["type"].value_counts()
 
-    # Users stats
-    # Empty dictionary of DataFrames (one for each user)
-    users_stats = {}
-
     # Users maybe starting (0) or receiving (1) the interaction
-    # Create a list of users
-    if interaction == 0:
-        users = data["0"].value_counts()
-    elif interaction == 1:
-        users = data["1"].value_counts()
+    if interaction == 1:
+        users_column = "1"
+    else:
+        users_column = "0"
+
+    # The interactions of each user, with a time-based column
+    interactions = pd.DataFrame({
+        "users": data[users_column].values,
+        "time": pd.to_datetime(data["start"], utc=True).values,
+        "type": data["type"].values,
+        "value": data["value"].values if "value" in data else 1
+        })
+
+    # Group by the exact time or by each period
+    if freq is None:
+        time_key = "time"
     else:
-        users = data["0"].value_counts()
-
-    # Add empty DataFrame for each active user
-    for i in users.index:
-        users_stats[i] = pd.DataFrame(columns=list(interaction_types.index))
-    # Fill each Dataframe of active users with zeroes, as the default value
-    for i in data.iterrows():
-        users_stats[i[1]["0"]].loc[i[1]["start"]] = [0] * len(list(interaction_types.index))
-    # Add a 1 to each timed interaction
-    for i in data.iterrows():
-        users_stats[i[1]["0"]].loc[i[1]["start"], i[1]["type"]] = 1
+        time_key = pd.Grouper(key="time", freq=freq)
+
+    # Users stats
+    # Count the interactions of each type for each user and time
+    users_stats = interactions.groupby(
+        ["users", time_key, "type"], observed=True, sort=True)["value"].sum()
+    users_stats = users_stats.unstack("type", fill_value=0).reindex(
+        columns=list(interaction_types.index), fill_value=0)
+    users_stats.columns.name = None
+    users_stats.index.names = ['users', 'time']
 
     # Global stats
-    data_list = []
-    index_list = []
-    for i in users_stats:
-        users_stats[i].index = pd.to_datetime(users_stats[i].index)
-        data_list.append(users_stats[i])
-        index_list.append(i)
-    global_stats = pd.concat(data_list)
-    global_stats.index = pd.to_datetime(global_stats.index)
+    global_stats = users_stats.groupby(level="time").sum()
 
     # Merge interactions if required by the user
     if structure.lower() == "combined":
         global_stats = global_stats.sum(axis=1)
-        for i in users_stats:
-            users_stats[i] = users_stats[i].sum(axis=1)
-
-    # Transform users_stats into a multi index DataFrame
-    users_stats = pd.concat(data_list, keys=index_list)
-    users_stats.index.names = ['users', 'time']
+        users_stats = users_stats.sum(axis=1)
 
     # Final output
     if focus.lower() == "global":
@@ -173,5 +282,194 @@ def type_stats(data, focus):
         return data.sum(axis=0)
 
 
+# The metrics of the network snapshots, by name
+snapshot_metrics = {
+    "nodes": lambda graph: graph.number_of_nodes(),
+    "edges": lambda graph: graph.number_of_edges(),
+    "interactions": lambda graph: int(graph.size(weight="weight")),
+    "density": nx.density,
+    "degree": lambda graph: dict(graph.degree(weight="weight")),
+    "betweenness": nx.betweenness_centrality,
+    "clustering": nx.clustering,
+    "communities": lambda graph: snapshot_communities(graph)
+}
+
+
+def snapshot_communities(graph):
+    """
+    Return the communities (Louvain) of the users of a snapshot, with the
+    weights of both directions of each edge summed. The users are sorted
+    first, so that the communities do not depend on the order in which
+    the interactions entered the snapshot.
+    """
+
+    undirected = nx.Graph()
+    undirected.add_nodes_from(sorted(graph))
+    for u, v, weight in sorted(graph.edges(data="weight")):
+        if undirected.has_edge(u, v):
+            undirected[u][v]["weight"] += weight
+        else:
+            undirected.add_edge(u, v, weight=weight)
+
+    return sorted(sorted(c) for c in nx.community.louvain_communities(
+        undirected, weight="weight", seed=0))
+
+
+def graph_interactions(graph):
+    """
+    Return the timestamps, the sources and the targets of all the
+    interactions of a graph with a start, sorted by their start.
+    The weighted edges of aggregated graphs are an interaction for each
+    of their timestamps: aggregated graphs built without timestamps (see
+    utils.aggregate_graph) raise a ValueError, since their weighted edges
+    keep only the first and the last start of their interactions.
+    """
+
+    interactions = []
+    store = graph.graph.get("edge_store")
+    if store is not None and "timestamps" not in store.extra and \
+            "weight" not in store.extra:
+        # Read the columns of the edge store, without a dict for each edge
+        for row in range(len(store)):
+            if store.starts[row] > edge_store.none_start:
+                interactions.append((
+                    int(store.starts[row]) / 1000000.0,
+                    store.values[store.sources[row]],
+                    store.values[store.targets[row]]))
+        edges = graph.edges(data=True)
+    else:
+        edges = utils.graph_edges(graph, data=True)
+
+    for u, v, d in edges:
+        if "timestamps" in d:
+            interactions.extend((t, u, v) for t in d["timestamps"])
+        elif "weight" in d:
+            raise ValueError(
+                "The weighted edge from %r to %r has no timestamps: the "
+                "starts of its %s interactions are unknown. Aggregate the "
+                "graph with timestamps=True." % (u, v, d["weight"]))
+        elif d.get("start") is not None:
+            interactions.append((utils.timestamp_of(d["start"]), u, v))
+
+    interactions.sort(key=lambda x: x[0])
+
+    return ([i[0] for i in interactions], [i[1] for i in interactions],
+            [i[2] for i in interactions])
+
+
+def snapshot_windows(times, sources, targets, windows, metrics):
+    """
+    Compute the metrics of the network of each window (start and end
+    timestamps) of a sequence sliding forward, keeping a single graph
+    updated: the interactions entering each window are added to it, and
+    the ones leaving it are removed. Each edge of the graph has the number
+    of its interactions in the window as weight.
+    """
+
+    graph = nx.DiGraph()
+
+    def add_interaction(source, target):
+        if graph.has_edge(source, target):
+            graph[source][target]["weight"] += 1
+        else:
+            graph.add_edge(source, target, weight=1)
+
+    def remove_interaction(source, target):
+        graph[source][target]["weight"] -= 1
+        if graph[source][target]["weight"] == 0:
+            graph.remove_edge(source, target)
+            # Users without interactions leave the network
+            for user in (source, target):
+                if user in graph and graph.degree(user) == 0:
+                    graph.remove_node(user)
+
+    results = []
+    entering = leaving = bisect.bisect_left(times, windows[0][0])
+    for window_start, window_end in windows:
+        while entering < len(times) and times[entering] < window_end:
+            add_interaction(sources[entering], targets[entering])
+            entering += 1
+        while leaving < entering and times[leaving] < window_start:
+            remove_interaction(sources[leaving], targets[leaving])
+            leaving += 1
+
+        result = {}
+        for metric in metrics:
+            if callable(metric):
+                result[metric.__name__] = metric(graph)
+            else:
+                result[metric] = snapshot_metrics[metric](graph)
+        results.append(result)
+
+    return results
+
+
+def network_snapshots(graph, freq="MS", periods=1,
+                      metrics=("nodes", "edges", "degree"),
+                      max_workers=None):
+    """
+    Compute network metrics of a graph over time, from the start of its
+    interactions: a snapshot for each period of frequency freq (a pandas
+    frequency like "D", "W" or "MS"), with the interactions of the last
+    periods periods (one for separate windows, more for sliding ones).
+    metrics are names of snapshot_metrics, or functions of a weighted
+    DiGraph. With max_workers, consecutive windows are split into chunks
+    computed by a pool of processes.
+    Aggregated graphs need the timestamps of their interactions (see
+    graph_interactions).
+    Return a list with a dict for each snapshot, with its start, its end
+    and its metrics.
+    """
+
+    times, sources, targets = graph_interactions(graph)
+    if len(times) == 0:
+        return []
+
+    # The bounds of the periods, from the one of the first interaction to
+    # the one after the last interaction
+    offset = pd.tseries.frequencies.to_offset(freq)
+    first = pd.Timestamp(times[0], unit="s", tz="UTC")
+    last = pd.Timestamp(times[-1], unit="s", tz="UTC")
+    bounds = pd.date_range(
+        start=offset.rollback(first.normalize()), end=last + offset,
+        freq=offset)
+    windows = [
+        (bounds[max(0, i + 1 - periods)], bounds[i + 1])
+        for i in range(len(bounds) - 1)]
+    window_times = [(s.timestamp(), e.timestamp()) for s, e in windows]
+
+    # Split the windows in chunks, each one with its interactions
+    if max_workers is None:
+        chunk_size = len(windows)
+    else:
+        chunk_size = max(1, -(-len(windows) // (4 * max_workers)))
+    chunks = []
+    for k in range(0, len(windows), chunk_size):
+        chunk = window_times[k:k + chunk_size]
+        first_row = bisect.bisect_left(times, chunk[0][0])
+        last_row = bisect.bisect_left(times, chunk[-1][1])
+        chunks.append((
+            times[first_row:last_row], sources[first_row:last_row],
+            targets[first_row:last_row], chunk, metrics))
+
+    if max_workers is None:
+        results = [snapshot_windows(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as processes:
+            futures = [
+                processes.submit(snapshot_windows, *chunk)
+                for chunk in chunks]
+            results = [future.result() for future in futures]
+
+    snapshots = []
+    for (window_start, window_end), result in zip(
+            windows, itertools.chain.from_iterable(results)):
+        snapshot = {"start": window_start, "end": window_end}
+        snapshot.update(result)
+        snapshots.append(snapshot)
+
+    return snapshots
+
+
 if __name__ == "__main__":
     pass
@@ -10,21 +10,164 @@
 import subprocess
 import xmltodict
 
+from . import github_analysis
+from . import utils
+
 
 # Get the information of a svn repository into a dict
 def get_log(projectpath):
 
-    # Get the verbose log in xml
-    svnlog = subprocess.check_output(
-        ['svn log --xml -v'],
-        cwd=projectpath, shell=True)
+    # Get the verbose log in xml, reading it from the pipe
+    command = ['svn', 'log', '--xml', '-v']
+    process = subprocess.Popen(command, cwd=projectpath,
+                               stdout=subprocess.PIPE)
 
     # Convert to a dict
-    all_commits = xmltodict.parse(svnlog)
+    try:
+        all_commits = xmltodict.parse(process.stdout)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
 
     # Return the full log with files changed at each commit
     return all_commits
 
 
+def parse_log_entry(element):
+    """
+    Convert a logentry element of the svn xml log into a commit dict, with
+    the list of the files changed by the commit, like the git log records.
+    """
+
+    commit = {
+        "@node": element.get("revision"),
+        "@revision": element.get("revision"),
+        "date": element.findtext("date"),
+        "msg": element.findtext("msg", ""),
+        "author": {
+            # svn has no emails, and anonymous commits have no author
+            "#text": element.findtext("author", ""),
+            "@email": ""
+        },
+        "files": []
+    }
+
+    # Copies from a path deleted in the same revision are renames
+    deleted = set()
+    copied_from = set()
+    for path in element.iter("path"):
+        if path.get("action") == "D":
+            deleted.add(path.text)
+        if path.get("copyfrom-path") is not None:
+            copied_from.add(path.get("copyfrom-path"))
+    for path in element.iter("path"):
+        action = path.get("action")
+        each_file = {"@action": action, "#text": path.text}
+        if action == "D" and path.text in copied_from:
+            continue
+        if path.get("copyfrom-path") is not None:
+            each_file["@copyfrom-path"] = path.get("copyfrom-path")
+            if path.get("copyfrom-path") in deleted:
+                each_file["@action"] = "R"
+            elif action == "A":
+                each_file["@action"] = "C"
+            else:
+                each_file["@action"] = "M"
+        elif action == "R":
+            # A replaced path is a modification for the analysis
+            each_file["@action"] = "M"
+        commit["files"].append(each_file)
+
+    return commit
+
+
+def iter_log(projectpath, revisions=None):
+    """
+    Run svn log once and yield each commit of a svn repository, with the
+    files changed in it, while the log is still being read from the pipe.
+    With revisions (like "1000:HEAD"), only the commits of that revision
+    range are read.
+    """
+
+    command = ['svn', 'log', '--xml', '-v']
+    if revisions is not None:
+        command.extend(['-r', revisions])
+
+    return utils.iter_xml_log(command, projectpath, parse_log_entry)
+
+
+def iter_log_in_order(projectpath, revisions=None, reverse=False):
+    """
+    Yield each commit of a svn repository from the oldest to the newest
+    one, or the other way if reverse. The whole log is read in that order
+    while it is streamed. A revision range (like "1000:HEAD" or
+    "{2020-01-01}:{2021-01-01}") is read as given and then sorted, since
+    the order of its ends is not known before reading it.
+    """
+
+    if revisions is None:
+        if reverse:
+            return iter_log(projectpath, "HEAD:1")
+        return iter_log(projectpath, "1:HEAD")
+
+    return iter(sorted(
+        iter_log(projectpath, revisions),
+        key=lambda commit: int(commit["@revision"]), reverse=reverse))
+
+
+def get_files_log(projectpath, follow_renames=True, revisions=None):
+    """
+    Get the history of each edited file in a svn repository into a dict.
+    With revisions (like "1000:HEAD"), only the commits of that revision
+    range are read.
+    """
+
+    # Build the history of each file from a single pass on the log, from
+    # the newest to the oldest commit, as git does
+    svn_all_files_log = utils.build_files_history(
+        iter_log_in_order(projectpath, revisions, reverse=True),
+        follow_renames=follow_renames)
+
+    # Return the full log with the history of each file
+    return {"log": {"logentry": svn_all_files_log}}
+
+
+def svn_repo_analysis(svn_files_log, graph, aggregate=False,
+                      timestamps=False, analysed=None, session=None):
+    """
+    The main function of SNA for a svn repo, like git.git_repo_analysis.
+    """
+
+    # The state of the analysis
+    session = github_analysis.get_session(session)
+
+    # Connect the committers of each file
+    return utils.files_history_analysis(
+        svn_files_log, graph, session, aggregate=aggregate,
+        timestamps=timestamps, analysed=analysed)
+
+
+def svn_local_repo_analysis(projectpath, graph, aggregate=False,
+                            timestamps=False, session=None, revisions=None):
+    """
+    Analyse a svn working copy (or repository URL), while its log is read
+    (see utils.commits_analysis).
+    With revisions, only the commits of that revision range are analysed,
+    so that a long history can be analysed in bounded windows.
+    """
+
+    # The state of the analysis
+    session = github_analysis.get_session(session)
+
+    # Analyse the commits from the oldest to the newest one
+    utils.commits_analysis(
+        iter_log_in_order(projectpath, revisions), graph, session,
+        aggregate=aggregate, timestamps=timestamps)
+
+    return graph
+
+
 if __name__ == "__main__":
     pass
@@ -18,25 +18,41 @@ import pandas as pd
 import json
 from ratelimit import limits, sleep_and_retry
 
-# Global variables
-errors = 0
-protected_accounts = 0
-t = "" # Twitter connection
+from . import utils
+
+class TwitterSession(utils.AnalysisSession):
+    """
+    The state of the analysis of Twitter accounts: the graph, the Twitter
+    connection and the counters of errors and protected accounts.
+    """
+
+    def __init__(self, connection=None, graph=None):
+        utils.AnalysisSession.__init__(
+            self, graph=graph if graph is not None else nx.DiGraph())
+        self.connection = connection
+        self.errors = 0
+        self.protected_accounts = 0
+
+
+# The session of the functions called without one
+default_session = TwitterSession()
+
 
 @sleep_and_retry
 @limits(calls=900, period=900)
-def twitter_accounts_connections(accounts_list, option):
+def twitter_accounts_connections(accounts_list, option, session=None):
     """
     Get followers or friends of a list of Twitter accounts.
 
     :param accounts_list: List of Twitter accounts to be looked up
     :param option: Either "followers" or "friends", chooses which kind of interaction to analyze
+    :param session: The session of the analysis, or None for the default one
     :return: returns a dict of connections for each Twitter account
     """
 
-    global errors
-    global protected_accounts
-    global t
+    if session is None:
+        session = default_session
+    t = session.connection
     connections = {}
 
     for p in accounts_list:
@@ -69,7 +85,7 @@ def twitter_accounts_connections(accounts_list, option):
                                 user_id=p, count=5000, cursor=cursor)
                         except:
                             cursor = "0"
-                            errors += 1
+                            session.errors += 1
                             notworking = True
                     else:
                         try:
@@ -77,7 +93,7 @@ def twitter_accounts_connections(accounts_list, option):
                                 user_id=p, count=5000, cursor=cursor)
                         except:
                             cursor = "0"
-                            errors += 1
+                            session.errors += 1
                             notworking = True
 
                     if notworking is False:
@@ -87,19 +103,19 @@ def twitter_accounts_connections(accounts_list, option):
                 elif "Not authorized" in str(e):
                     # Unauthorized account
                     cursor = "0"
-                    errors += 1
-                    protected_accounts += 1
+                    session.errors += 1
+                    session.protected_accounts += 1
                 else:
                     # Some generic errors 
                     cursor = "0"
-                    errors += 1
+                    session.errors += 1
 
     return connections
 
 
 @sleep_and_retry
 @limits(calls=900, period=900)
-def twitter_accounts_graph(ACCESS_TOKEN, ACCESS_TOKEN_SECRET, API_KEY, API_KEY_SECRET, first_perspective_accounts, second_perspective_accounts, keywords):
+def twitter_accounts_graph(ACCESS_TOKEN, ACCESS_TOKEN_SECRET, API_KEY, API_KEY_SECRET, first_perspective_accounts, second_perspective_accounts, keywords, session=None):
     """
     Create a graph of connections among Twitter accounts focusing on first-person, second-person, third-person perspective in the social network. Get the Twitter API credentials from https://developer.twitter.com/.
 
@@ -110,16 +126,19 @@ def twitter_accounts_graph(ACCESS_TOKEN, ACCESS_TOKEN_SECRET, API_KEY, API_KEY_S
     :param first_perspective_accounts: List of Twitter accounts of first person perspective
     :param second_perspective_accounts: List of Twitter accounts of second person perspective
     :param keywords: List of keywords for searching for Twitter accounts - this is the third person perspective
+    :param session: The session of the analysis, or None for a new one
     :return: returns a dict with a graph of connections among Twitter accounts and overall statics of the results of the search
     """
 
-    global t
-    graph = nx.DiGraph()
+    if session is None:
+        session = TwitterSession()
+    graph = session.graph
 
     # Log in
     # TODO Move to API v2 when they will port user search
     t = twitter.Twitter(auth=twitter.OAuth(ACCESS_TOKEN, ACCESS_TOKEN_SECRET,
                       API_KEY, API_KEY_SECRET), api_version="1.1")
+    session.connection = t
     # Result variables
     search_results = []
     search_results_stats = {}
@@ -183,8 +202,8 @@ def twitter_accounts_graph(ACCESS_TOKEN, ACCESS_TOKEN_SECRET, API_KEY, API_KEY_S
 
     # Load connections of account
     for k, l in enumerate(accounts):
-        followers = twitter_accounts_connections([l], "followers")
-        friends = twitter_accounts_connections([l], "friends")
+        followers = twitter_accounts_connections([l], "followers", session)
+        friends = twitter_accounts_connections([l], "friends", session)
         # Add edges...
         for f in followers:
             for k in followers[f]:
@@ -247,8 +266,10 @@ def twitter_accounts_graph(ACCESS_TOKEN, ACCESS_TOKEN_SECRET, API_KEY, API_KEY_S
 
     # TODO Save full stats for each keyword
 
-    returning_results = {"stats": search_results_stats, "errors": errors,
-                         "protected_accounts": protected_accounts, "graph": graph}
+    returning_results = {"stats": search_results_stats,
+                         "errors": session.errors,
+                         "protected_accounts": session.protected_accounts,
+                         "graph": graph}
 
     return returning_results
 
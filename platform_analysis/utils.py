@@ -8,26 +8,563 @@
 #
 
 
+import re
 import json
+import array
+import datetime
+import threading
+import subprocess
+import itertools
+from collections import OrderedDict
+from xml.etree import ElementTree
 from splitstream import splitfile
-from io import StringIO
+from io import BytesIO
+from dateutil.parser import parse
+
+import networkx as nx
+from . import edge_store
+
+
+def iter_json_records(stream):
+    """
+    Read a stream of concatenated JSON objects (like a log with a JSON
+    pretty format), and yield each one as soon as it has been read.
+    """
+
+    for jsonstr in splitfile(stream, format="json"):
+        yield json.loads(jsonstr)
 
 
 def convert_log_to_dict(input_text):
     """
     Convert the git log output to json.
+    The output can also be a stream, like the stdout pipe of git log,
+    which is read incrementally.
     """
 
+    if isinstance(input_text, str):
+        input_text = input_text.encode("utf-8")
+    if isinstance(input_text, bytes):
+        input_text = BytesIO(input_text)
+
     items = []
-    f = StringIO.StringIO(input_text)
-    for jsonstr in splitfile(f, format="json"):
-        try:
-            items.append(json.loads(jsonstr))
-        except Exception as e:
-            return e
+    try:
+        for item in iter_json_records(input_text):
+            items.append(item)
+    except Exception as e:
+        return e
 
     return items
 
 
+def iter_xml_elements(stream, tag):
+    """
+    Read an XML document from a stream, and yield each element with the
+    given tag as soon as it has been read. The elements already read are
+    then removed from the document, so that memory stays constant.
+    """
+
+    root = None
+    for event, element in ElementTree.iterparse(
+            stream, events=("start", "end")):
+        if root is None:
+            root = element
+        if event == "end" and element.tag == tag:
+            yield element
+            root.clear()
+
+
+def iter_xml_log(command, path, convert):
+    """
+    Run a command writing an XML log (like svn or hg) in path, and yield
+    each of its logentry elements converted by convert, while the log is
+    still being read from the pipe.
+    """
+
+    process = subprocess.Popen(command, cwd=path, stdout=subprocess.PIPE)
+    try:
+        for element in iter_xml_elements(process.stdout, "logentry"):
+            yield convert(element)
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+def build_files_history(commits, follow_renames=True, renamed_to=None):
+    """
+    Invert a stream of commits (each with its changed files) into the
+    history of each file, in the same order of the commits. The commits
+    come from the log of any VCS, newest first, with their files changed
+    as git actions (see git.parse_log_record).
+    With follow_renames, the commits of a file before a rename are also
+    added to the history of its new name, like git log --follow does.
+    The latest name of each renamed file is added to renamed_to, if given.
+    """
+
+    # The history of each file, in order of appearance in the log
+    files_history = OrderedDict()
+
+    # The latest name of each file that has been renamed
+    if renamed_to is None:
+        renamed_to = {}
+
+    # Commits come from the newest to the oldest one
+    for commit in commits:
+
+        # The same entry is shared by the history of every file in the commit
+        entry = {k: v for k, v in commit.items() if k != "files"}
+
+        touched_files = []
+        for each_file in commit["files"]:
+            current_path = each_file["#text"]
+            touched_files.append(current_path)
+            if follow_renames:
+                touched_files.append(renamed_to.get(current_path, current_path))
+                # Older commits on the previous name belong to the new name
+                if each_file["@action"][0] == "R":
+                    previous_path = each_file["@copyfrom-path"]
+                    renamed_to[previous_path] = renamed_to.get(
+                        current_path, current_path)
+                    touched_files.append(previous_path)
+
+        # Add the commit once to the history of each touched file
+        for each_path in OrderedDict.fromkeys(touched_files):
+            if each_path not in files_history:
+                files_history[each_path] = []
+            files_history[each_path].append(entry)
+
+    return files_history
+
+
+def merge_committers(committers, previous_path, current_path):
+    """
+    Add the previous committers of a renamed file to the ones of its new
+    name, keeping the latest commit of each of them, from the oldest to
+    the newest one.
+    """
+
+    if previous_path not in committers:
+        return committers
+
+    merged = dict(committers.get(current_path, {}))
+    for author, date in committers[previous_path].items():
+        if author not in merged or timestamp_of(date) > \
+                timestamp_of(merged[author]):
+            merged[author] = date
+    committers[current_path] = OrderedDict(sorted(
+        merged.items(), key=lambda x: timestamp_of(x[1])))
+
+    return committers
+
+
+def commits_analysis(commits, graph, session, aggregate=False,
+                     timestamps=False, analysed=None, committers=None,
+                     follow_renames=True, **attributes):
+    """
+    Connect the committers of a repository of any VCS (git, hg or svn)
+    from a stream of its commits, from the oldest to the newest one, each
+    with its changed files as git actions (see git.parse_log_record):
+    each committer of a file is connected to its previous committers.
+    Each commit adds one interaction from each distinct previous committer
+    of the file (the author of the commit just before it and the current
+    committer included), starting at the date of their latest commit on
+    the file: the interactions grow with the commits times the committers
+    of a file, not with the square of its commits.
+    Only the previous committers of each file are kept while the commits
+    are read, so that memory is bounded by the files, not by the history.
+    With follow_renames, the previous committers of a renamed file are
+    also the previous committers of its new name.
+    With analysed (the ids of the commits already analysed), the
+    interactions of the analysed commits of each file are not added again,
+    until a new commit (even an older one, pushed later) changes the
+    previous committers of the file: the interactions of all the commits
+    after it are added, and the ones already in the graph can be skipped
+    with merge_graph.
+    The edge keys are counted by the session of the analysis.
+    With committers (a dict of the previous committers of each file, with
+    the date of their latest commit, from the oldest to the newest one),
+    the histories continue the ones of a previous analysis, and the
+    committers are updated for the next one.
+    The attributes are added to each interaction.
+    """
+
+    # Collapse parallel interactions into weighted edges, if required
+    if aggregate:
+        aggregate_graph(graph, timestamps=timestamps)
+
+    # The same end year for all the edges of this analysis
+    endopen = datetime.datetime.now().year
+
+    if committers is None:
+        committers = {}
+
+    # The files with a new commit: the following commits are replayed
+    replayed = set()
+
+    for commit in commits:
+        commit_date = commit["date"]
+        if not isinstance(commit_date, datetime.datetime):
+            commit_date = parse(commit_date)
+        second_actor = commit["author"]["#text"]
+        msg = re.sub(r'-', " ", commit["msg"] or "")
+        new_commit = analysed is None or commit["@node"] not in analysed
+
+        # The files changed by the commit, under their new name
+        touched_files = []
+        for each_file in commit["files"]:
+            if follow_renames and each_file["@action"][0] == "R":
+                merge_committers(
+                    committers, each_file["@copyfrom-path"],
+                    each_file["#text"])
+            touched_files.append(each_file["#text"])
+        if len(touched_files) == 0:
+            continue
+
+        # Add the committer in case it is not in the graph
+        if second_actor not in graph:
+            graph.add_node(
+                second_actor, committer="Yes",
+                email=commit["author"]["@email"], Label=second_actor)
+        else:
+            graph.nodes[second_actor]["committer"] = "Yes"
+
+        # Add an edge from the previous committers of each file to the
+        # current one, since there are interactions on the same file
+        for each_file in OrderedDict.fromkeys(touched_files):
+            previous_committers = committers.setdefault(
+                each_file, OrderedDict())
+
+            # Skip the interactions of the commits already analysed
+            if new_commit:
+                replayed.add(each_file)
+            if analysed is None or each_file in replayed:
+                for first_actor, previous_date in \
+                        previous_committers.items():
+                    add_interaction(
+                        graph,
+                        first_actor,
+                        second_actor,
+                        key=session.next_key(),
+                        node=commit["@node"], type="commit",
+                        msg=msg,
+                        start=previous_date,
+                        endopen=endopen,
+                        **attributes)
+
+            # The current committer is now one of the previous ones,
+            # with this commit as the latest one
+            previous_committers.pop(second_actor, None)
+            previous_committers[second_actor] = commit_date
+
+    return graph
+
+
+def iter_files_history_commits(files_log):
+    """
+    Yield the commits of the history of each file (see
+    build_files_history) from the oldest to the newest one, file after
+    file, each with that file only as its changed file.
+    """
+
+    # The same commit appears in the history of many files:
+    # parse its date only once
+    commit_dates = {}
+
+    for each_file in files_log:
+        file_history = []
+        for each_commit in files_log[each_file]:
+            if each_commit["@node"] not in commit_dates:
+                commit_date = each_commit["date"]
+                if not isinstance(commit_date, datetime.datetime):
+                    commit_date = parse(commit_date)
+                commit_dates[each_commit["@node"]] = commit_date
+            file_history.append({
+                "@node": each_commit["@node"],
+                "date": commit_dates[each_commit["@node"]],
+                "msg": each_commit["msg"],
+                "author": each_commit["author"],
+                "files": [{"@action": "M", "#text": each_file}]
+            })
+
+        # Sort the history once in order to be sure about the chronological
+        # order of the file history
+        file_history.sort(key=lambda x: x["date"])
+        for each_commit in file_history:
+            yield each_commit
+
+
+def files_history_analysis(files_log, graph, session, aggregate=False,
+                           timestamps=False, analysed=None, committers=None,
+                           **attributes):
+    """
+    Connect the committers of a repository of any VCS (git, hg or svn)
+    from the history of each of its files (see build_files_history), like
+    commits_analysis does from its commits. The commits of each file are
+    sorted by date, and the renamed files already have the history of
+    their previous names.
+    Use commits_analysis on the log instead, when the histories of the
+    files are not needed, to keep them out of memory.
+    """
+
+    return commits_analysis(
+        iter_files_history_commits(files_log), graph, session,
+        aggregate=aggregate, timestamps=timestamps, analysed=analysed,
+        committers=committers, follow_renames=False, **attributes)
+
+
+class AnalysisSession(object):
+    """
+    The state of a single analysis: the graph being built and the counter
+    of its edge keys. Each analysis owns its session, so that many of them
+    can run at the same time in threads or processes without sharing state.
+    """
+
+    def __init__(self, graph=None):
+        self.lock = threading.Lock()
+        self.graph = graph if graph is not None else nx.MultiDiGraph()
+        self.edge_key = 0
+
+    def next_key(self):
+        """
+        Increase the counter of the edge keys and return it.
+        """
+
+        with self.lock:
+            self.edge_key += 1
+            return self.edge_key
+
+    def skip_keys(self, key):
+        """
+        Continue counting the edge keys after an existing one.
+        """
+
+        with self.lock:
+            if isinstance(key, int) and key >= self.edge_key:
+                self.edge_key = key + 1
+
+
+def aggregate_graph(graph, timestamps=False):
+    """
+    Set a graph to collapse parallel interactions into weighted edges,
+    one for each source, target and type of interaction.
+    With timestamps, each weighted edge keeps also an array of the
+    timestamps of all its interactions.
+    """
+
+    graph.graph["aggregate"] = True
+    graph.graph["timestamps"] = timestamps
+
+    return graph
+
+
+def empty_graph_like(graph):
+    """
+    Create an empty graph with the same aggregation mode of a graph.
+    """
+
+    local_graph = nx.MultiDiGraph()
+    if graph.graph.get("aggregate", False):
+        aggregate_graph(
+            local_graph, timestamps=graph.graph.get("timestamps", False))
+    if "edge_store" in graph.graph:
+        compact_graph(local_graph)
+
+    return local_graph
+
+
+def compact_graph(graph):
+    """
+    Set a graph to store its interactions in an EdgeStore (see edge_store),
+    as columns of interned values instead of a dict for each edge.
+    The users are still the nodes of the graph, and the weighted edges of
+    aggregated graphs are still its edges.
+    The interactions in the store are not edges of the NetworkX graph:
+    graph.edges() and graph.number_of_edges() do not count them, and the
+    NetworkX functions (like nx.compose) ignore them. Read them with
+    graph_edges, merge graphs with merge_graph, or copy the graph with
+    expand_graph for the functions of NetworkX.
+    """
+
+    if "edge_store" not in graph.graph:
+        graph.graph["edge_store"] = edge_store.EdgeStore()
+
+    return graph
+
+
+def graph_edges(graph, keys=False, data=False, default=None):
+    """
+    Iterate over the edges of a graph like graph.edges does, including the
+    interactions in its edge store, if any.
+    """
+
+    edges = graph.edges(keys=keys, data=data, default=default)
+    if "edge_store" not in graph.graph:
+        return iter(edges)
+
+    return itertools.chain(edges, graph.graph["edge_store"].edges(
+        keys=keys, data=data, default=default))
+
+
+def add_edge(graph, source, target, key=None, **attributes):
+    """
+    Add an edge to a graph, or to its edge store if it has one.
+    """
+
+    if "edge_store" not in graph.graph:
+        graph.add_edge(source, target, key=key, **attributes)
+        return
+
+    for user in (source, target):
+        if user not in graph:
+            graph.add_node(user)
+    graph.graph["edge_store"].add(source, target, key=key, **attributes)
+
+
+def expand_graph(graph):
+    """
+    Copy a graph with an edge store into a plain MultiDiGraph, with a dict
+    for each edge.
+    """
+
+    if "edge_store" not in graph.graph:
+        return graph
+
+    expanded_graph = nx.MultiDiGraph()
+    expanded_graph.graph.update(
+        (k, v) for k, v in graph.graph.items() if k != "edge_store")
+    expanded_graph.add_nodes_from(graph.nodes(data=True))
+    expanded_graph.add_edges_from(graph.edges(keys=True, data=True))
+    graph.graph["edge_store"].to_graph(expanded_graph)
+
+    return expanded_graph
+
+
+def timestamp_of(date):
+    """
+    Convert the start of an interaction (a datetime, a date string or
+    a number) to a POSIX timestamp. Naive datetimes are considered UTC.
+    """
+
+    if date is None:
+        return None
+    if isinstance(date, (int, float)):
+        return float(date)
+    if not isinstance(date, datetime.datetime):
+        date = parse(str(date))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+
+    return date.timestamp()
+
+
+def add_interaction(graph, source, target, key=None, **attributes):
+    """
+    Add an interaction between two users as an edge of the graph.
+    If the graph is aggregated (see aggregate_graph), the interaction is
+    added to the weighted edge for its source, target and type instead,
+    which keeps the count, the first start and the last one.
+    """
+
+    # One edge for each interaction
+    if not graph.graph.get("aggregate", False):
+        add_edge(graph, source, target, key=key, **attributes)
+        return
+
+    # One weighted edge for each type of interaction, keyed by the type
+    edge_type = attributes.get("type", "None")
+    start = attributes.get("start")
+    start_timestamp = timestamp_of(start)
+
+    if not graph.has_edge(source, target, key=edge_type):
+        graph.add_edge(
+            source, target, key=edge_type, type=edge_type, weight=0,
+            start=start, last=start,
+            endopen=attributes.get("endopen", datetime.datetime.now().year))
+        if graph.graph.get("timestamps", False):
+            graph[source][target][edge_type]["timestamps"] = array.array("d")
+    edge = graph[source][target][edge_type]
+
+    edge["weight"] += 1
+    if start_timestamp is not None:
+        if edge["start"] is None or \
+                start_timestamp < timestamp_of(edge["start"]):
+            edge["start"] = start
+        if edge["last"] is None or \
+                start_timestamp > timestamp_of(edge["last"]):
+            edge["last"] = start
+        if "timestamps" in edge:
+            edge["timestamps"].append(start_timestamp)
+
+    return
+
+
+def interaction_identity(source, target, attributes):
+    """
+    Return what identifies an interaction regardless of its edge key:
+    its users, type, start and message.
+    """
+
+    return (source, target, attributes.get("type"),
+            timestamp_of(attributes.get("start")), attributes.get("msg"))
+
+
+def merge_graph(graph, target, deduplicate=False):
+    """
+    Add the users and the interactions of a graph to a target graph.
+    Weighted edges of aggregated graphs are summed to the ones of the
+    target with the same source, target and type.
+    With deduplicate, the interactions already in the target are skipped.
+    """
+
+    # The interactions already in the target
+    existing = set()
+    if deduplicate:
+        for source, destination, attributes in graph_edges(
+                target, data=True):
+            existing.add(
+                interaction_identity(source, destination, attributes))
+
+    # Add the users, updating their attributes if already present
+    for node, attributes in graph.nodes(data=True):
+        if node not in target:
+            target.add_node(node, **attributes)
+        else:
+            target.nodes[node].update(attributes)
+
+    # Add the interactions
+    for source, destination, key, attributes in graph_edges(
+            graph, keys=True, data=True):
+        if deduplicate and interaction_identity(
+                source, destination, attributes) in existing:
+            continue
+        if "weight" not in attributes or \
+                not target.graph.get("aggregate", False):
+            add_edge(target, source, destination, key=key, **attributes)
+            continue
+        if not target.has_edge(source, destination, key=key):
+            target.add_edge(source, destination, key=key, **attributes)
+            edge = target[source][destination][key]
+            if "timestamps" in edge:
+                edge["timestamps"] = array.array("d", edge["timestamps"])
+            continue
+        edge = target[source][destination][key]
+        edge["weight"] += attributes["weight"]
+        if attributes["start"] is not None and (
+                edge["start"] is None or timestamp_of(attributes["start"]) <
+                timestamp_of(edge["start"])):
+            edge["start"] = attributes["start"]
+        if attributes["last"] is not None and (
+                edge["last"] is None or timestamp_of(attributes["last"]) >
+                timestamp_of(edge["last"])):
+            edge["last"] = attributes["last"]
+        if "timestamps" in edge and "timestamps" in attributes:
+            edge["timestamps"].extend(attributes["timestamps"])
+
+    return target
+
+
 if __name__ == "__main__":
     pass
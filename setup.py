@@ -6,7 +6,6 @@ from pathlib import Path
 this_directory = Path(__file__).parent
 long_description = (this_directory / "README.md").read_text()
 
-from distutils.core import setup
 setup(
     name='platform_analysis',
     packages=['platform_analysis'],
@@ -26,6 +25,10 @@ setup(
         "twitter",
         "pathlib"
     ],
+    # The hg command line tool, for the analysis of hg repositories
+    extras_require={
+        "hg": ["mercurial"]
+    },
     version='0.31',
     description='A Python library for Social Network Analysis of online collaboration platforms and tools like Twitter, YouTube and Git, Hg, SVN, GitHub, GitLab, BitBucket repositories',
     author='Massimo Menichinelli',
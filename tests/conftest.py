@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import json
+import hashlib
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answer the requests of PyGithub like the GitHub API would, with the
+    responses set in the routes of the server.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        page = int(parse_qs(url.query).get("page", ["1"])[0])
+        self.server.requests.append(("GET", url.path))
+        self.server.queries.append((url.path, parse_qs(url.query)))
+        if url.path not in self.server.routes:
+            self.respond(404, {"message": "Not Found"})
+            return
+
+        # Lists have a single page
+        body = self.server.routes[url.path]
+        if callable(body):
+            body = body()
+        if isinstance(body, list) and page > 1:
+            body = []
+
+        # Unchanged responses are not sent again, if they have an ETag
+        if self.server.etags:
+            etag = '"%s"' % hashlib.sha1(
+                json.dumps(body).encode("utf-8")).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.server.not_modified += 1
+                self.respond(304, None, etag)
+                return
+            self.respond(200, body, etag)
+            return
+        self.respond(200, body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers["Content-Length"])
+        request = json.loads(self.rfile.read(length))
+        self.server.requests.append(("POST", url.path))
+        self.respond(200, self.server.graphql(request))
+
+    def respond(self, status, body, etag=None):
+        data = json.dumps(body).encode("utf-8") if status != 304 else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if self.server.rate_headers:
+            self.send_header("X-RateLimit-Limit", "5000")
+            self.send_header("X-RateLimit-Remaining", "4999")
+            self.send_header(
+                "X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def github_server():
+    """
+    A local stand-in for the GitHub API: set its routes (path: JSON body)
+    and its graphql function (request: JSON body), and read the requests
+    it received (and the queries of the GET ones). With etags, the
+    responses have an ETag, and the unchanged ones are not modified (304).
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.routes = {}
+    server.graphql = lambda request: {"data": None}
+    server.requests = []
+    server.queries = []
+    server.rate_headers = True
+    server.etags = False
+    server.not_modified = 0
+    server.url = "http://127.0.0.1:%d" % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
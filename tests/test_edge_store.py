@@ -0,0 +1,113 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import array
+import datetime
+
+import networkx as nx
+
+from platform_analysis import utils
+from platform_analysis.edge_store import EdgeStore
+
+from test_utils import random_interactions
+
+
+# Interactions with the values that the store keeps apart: a start that is
+# None or missing, keys that are not integers, values of different types
+# that are equal, extra attributes and the arrays of weighted edges
+special_interactions = [
+    ("a", "b", "fork", {"type": "fork", "start": None, "endopen": 2026}),
+    ("b", "a", "star", {"type": "star", "msg": "None"}),
+    ("a", "c", 1000, {"type": "commit", "node": 1, "msg": 1.0,
+                   "repository": "o/r", "endopen": 2026}),
+    ("c", "a", 1001, {"type": "commit", "node": True, "weight": 2,
+                   "timestamps": array.array("d", [1.5, 2.5]),
+                   "start": datetime.datetime(
+                       2020, 1, 1, tzinfo=datetime.timezone.utc)})]
+
+
+def ordered(edges):
+    """
+    Return the edges of a graph ordered by source, target and key, since
+    the store reads them in the order they were added.
+    """
+
+    return sorted(edges, key=lambda edge: tuple(str(i) for i in edge[:3]))
+
+
+def all_interactions():
+    """
+    Return random interactions, each with its key, and the special ones.
+    """
+
+    interactions = [(u, v, key, attributes) for key, (u, v, attributes)
+                    in enumerate(random_interactions(200))]
+
+    return interactions + special_interactions
+
+
+def test_edges_like_networkx():
+    graph = nx.MultiDiGraph()
+    store = EdgeStore()
+    for u, v, key, attributes in all_interactions():
+        graph.add_edge(u, v, key=key, **attributes)
+        store.add(u, v, key=key, **attributes)
+
+    # The store reads its interactions like the edges of the graph
+    assert store.number_of_edges() == graph.number_of_edges()
+    assert ordered(store.edges(keys=True, data=True)) == \
+        ordered(graph.edges(keys=True, data=True))
+    assert sorted(store.edges(data="msg", default="-"), key=str) == \
+        sorted(graph.edges(data="msg", default="-"), key=str)
+    assert sorted(store.edges()) == sorted(graph.edges())
+    assert nx.utils.edges_equal(
+        store.to_graph(nx.MultiDiGraph()).edges(keys=True, data=True),
+        graph.edges(keys=True, data=True))
+
+
+def test_save_and_load(tmp_path):
+    interactions = all_interactions()
+    store = EdgeStore()
+    for u, v, key, attributes in interactions[:100]:
+        store.add(u, v, key=key, **attributes)
+    store.save(str(tmp_path / "store"))
+
+    # The loaded store has the same interactions, and grows like the
+    # original one
+    loaded = EdgeStore.load(str(tmp_path / "store"))
+    assert list(loaded.edges(keys=True, data=True)) == \
+        list(store.edges(keys=True, data=True))
+    for u, v, key, attributes in interactions[100:]:
+        store.add(u, v, key=key, **attributes)
+        loaded.add(u, v, key=key, **attributes)
+    assert list(loaded.edges(keys=True, data=True)) == \
+        list(store.edges(keys=True, data=True))
+
+
+def test_compact_graph_like_plain_graph():
+    plain = nx.MultiDiGraph()
+    compact = utils.compact_graph(nx.MultiDiGraph())
+    for u, v, key, attributes in all_interactions():
+        utils.add_interaction(plain, u, v, key=key, **attributes)
+        utils.add_interaction(compact, u, v, key=key, **attributes)
+
+    # The interactions are in the store, not in the edges of the graph
+    assert compact.number_of_edges() == 0
+    assert ordered(utils.graph_edges(compact, keys=True, data=True)) == \
+        ordered(plain.edges(keys=True, data=True))
+    assert ordered(utils.expand_graph(compact).edges(keys=True, data=True)) \
+        == ordered(plain.edges(keys=True, data=True))
+
+    # And they are merged like the edges of the graph
+    merged = utils.merge_graph(compact, nx.MultiDiGraph())
+    assert ordered(merged.edges(keys=True, data=True)) == \
+        ordered(plain.edges(keys=True, data=True))
+    merged = utils.merge_graph(plain, utils.compact_graph(nx.MultiDiGraph()))
+    assert ordered(utils.graph_edges(merged, keys=True, data=True)) == \
+        ordered(plain.edges(keys=True, data=True))
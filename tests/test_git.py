@@ -0,0 +1,152 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import os
+import subprocess
+from collections import Counter
+
+import networkx as nx
+
+from platform_analysis import git
+from platform_analysis import github_analysis
+
+
+def commit(repository, author, date, files):
+    """
+    Commit a line to each of the files of a repository, as author at date.
+    """
+
+    for each_file in files:
+        with open(os.path.join(repository, each_file), "a") as f:
+            f.write(author + "\n")
+    environment = dict(
+        os.environ, GIT_AUTHOR_NAME=author, GIT_AUTHOR_EMAIL=author + "@x",
+        GIT_COMMITTER_NAME=author, GIT_COMMITTER_EMAIL=author + "@x",
+        GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    subprocess.check_output(["git", "add"] + files, cwd=repository)
+    subprocess.check_output(
+        ["git", "commit", "--quiet", "-m", author + " " + " ".join(files)],
+        cwd=repository, env=environment)
+
+
+def make_repository(path):
+    """
+    Create a git repository with a few authors sharing a few files.
+    """
+
+    os.makedirs(path)
+    subprocess.check_output(["git", "init", "--quiet"], cwd=path)
+    commit(path, "alice", "2020-01-01T10:00:00+00:00", ["a", "b"])
+    commit(path, "bob", "2020-01-02T10:00:00+02:00", ["a"])
+    commit(path, "carol", "2020-01-03T10:00:00-05:00", ["b", "c"])
+    commit(path, "alice", "2020-01-04T10:00:00+00:00", ["c"])
+
+    return path
+
+
+def test_cached_repo_log(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+    cache_path = str(tmp_path / "cache")
+    url = "file://" + source
+
+    # The log of the mirror is the log of the repository
+    log = git.git_remote_repo_log(
+        url, str(tmp_path), "files", cache_path=cache_path)
+    assert log == git.get_files_log(source)["log"]["logentry"]
+    assert os.path.isdir(git.mirror_path(url, cache_path))
+
+    # The mirror fetches the new commits
+    commit(source, "dave", "2020-01-05T10:00:00+00:00", ["a", "d"])
+    log = git.git_remote_repo_log(
+        url, str(tmp_path), "files", cache_path=cache_path)
+    assert log == git.get_files_log(source)["log"]["logentry"]
+    assert [c["author"]["#text"] for c in log["d"]] == ["dave"]
+
+    # Evicted mirrors leave nothing behind
+    git.evict_mirrors(cache_path, 0)
+    assert os.listdir(cache_path) == []
+
+
+def interactions(graph):
+    """
+    Return the interactions of a graph regardless of their edge keys.
+    """
+
+    return Counter(
+        (u, v, data["node"], data["start"])
+        for u, v, data in graph.edges(data=True))
+
+
+def test_local_analysis_like_files_history(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+
+    # The commits analysed while the log is read connect the same
+    # committers as the history of each file
+    streamed = git.git_local_repo_analysis(
+        source, nx.MultiDiGraph(), session=github_analysis.GitHubSession())
+    files_log = git.get_files_log(source)["log"]["logentry"]
+    history = git.git_repo_analysis(
+        files_log, nx.MultiDiGraph(),
+        session=github_analysis.GitHubSession())
+    assert interactions(streamed) == interactions(history)
+    assert sorted(set((u, v) for u, v in streamed.edges())) == [
+        ("alice", "bob"), ("alice", "carol"), ("carol", "alice")]
+
+
+def test_local_analysis_follows_renames(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+    subprocess.check_output(["git", "mv", "a", "e"], cwd=source)
+    commit(source, "dave", "2020-01-05T10:00:00+00:00", ["e"])
+
+    # The committers of a are the previous committers of e, once each
+    graph = git.git_local_repo_analysis(
+        source, nx.MultiDiGraph(), session=github_analysis.GitHubSession())
+    dave_commits = Counter(
+        u for u, v in graph.in_edges("dave") if u != "dave")
+    assert dave_commits == Counter({"alice": 1, "bob": 1})
+
+
+def test_incremental_analysis(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+    filename = str(tmp_path / "graph.graphml")
+
+    git.git_incremental_analysis(
+        source, filename, session=github_analysis.GitHubSession())
+    commit(source, "dave", "2020-01-05T10:00:00+00:00", ["a", "c"])
+    incremental = git.git_incremental_analysis(
+        source, filename, session=github_analysis.GitHubSession())
+
+    # The new commits continue the histories of the previous analysis
+    full = git.git_local_repo_analysis(
+        source, nx.MultiDiGraph(), session=github_analysis.GitHubSession())
+    assert Counter((u, v, data["node"])
+                   for u, v, data in incremental.edges(data=True)) == \
+        Counter((u, v, data["node"]) for u, v, data in full.edges(data=True))
+
+
+def test_repo_analysis_edges():
+    # A file changed by a, b, a, c and a in turn
+    authors = ["a", "b", "a", "c", "a"]
+    files_log = {"f": [
+        {"@node": "n%d" % i, "author": {"#text": author, "@email": "x"},
+         "date": "Wed, %02d Jan 2020 10:00:00 +0000" % i, "msg": "m"}
+        for i, author in enumerate(authors, 1)]}
+
+    # Each commit is connected once to each previous committer of the
+    # file, with the date of their latest commit on it
+    graph = git.git_repo_analysis(
+        files_log, nx.MultiDiGraph(), session=github_analysis.GitHubSession())
+    edges = sorted(
+        (data["node"], u, v, data["start"].day)
+        for u, v, data in graph.edges(data=True))
+    assert edges == [
+        ("n2", "a", "b", 1),
+        ("n3", "a", "a", 1), ("n3", "b", "a", 2),
+        ("n4", "a", "c", 3), ("n4", "b", "c", 2),
+        ("n5", "a", "a", 3), ("n5", "b", "a", 2), ("n5", "c", "a", 4)]
@@ -0,0 +1,106 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import datetime
+
+import networkx as nx
+from github import Github
+
+from platform_analysis import git
+from platform_analysis import github_analysis
+from platform_analysis import utils
+
+from test_git import commit, make_repository
+from test_github_collection import set_repository
+
+
+def commits_since(server):
+    """
+    Return the since parameter of each request of the commits of o/r.
+    """
+
+    return [query.get("since", [None])[0] for path, query in server.queries
+            if path == "/repos/o/r/commits" and "page" not in query]
+
+
+def commit_edges(graph):
+    """
+    Return the commit interactions of a graph, once each.
+    """
+
+    return set(
+        (u, v, data["node"]) for u, v, data in graph.edges(data=True)
+        if data["type"] == "commit")
+
+
+def test_incremental_repo_analysis(github_server, tmp_path):
+    set_repository(github_server)
+    github_server.routes["/repos/o/r"]["created_at"] = "2019-01-01T00:00:00Z"
+    github_server.routes["/repos/o/r/issues"] = []
+    source = make_repository(str(tmp_path / "source"))
+    client = Github(base_url=github_server.url)
+    repository = client.get_repo("o/r")
+    graph, incremental = github_analysis.load_incremental_analysis(
+        str(tmp_path / "graph.graphml"))
+
+    # The first analysis fetches all the commits
+    session = github_analysis.GitHubSession(client=client)
+    github_analysis.repo_analysis(
+        repository, str(tmp_path), graph, incremental=incremental,
+        session=session,
+        git_files_log=lambda: git.get_files_log(source)["log"]["logentry"])
+    log = git.get_files_log(source)["log"]["logentry"]
+    shas = sorted(set(c["@node"] for f in log for c in log[f]))
+    assert incremental["analysed commits"] == shas
+    assert commits_since(github_server) == [None]
+
+    # The next one only the ones since its oldest new commit, even if it
+    # is older than the analysed ones
+    commit(source, "dave", "2019-12-31T23:00:00+01:00", ["a", "d"])
+    github_analysis.repo_analysis(
+        repository, str(tmp_path), graph, incremental=incremental,
+        session=session,
+        git_files_log=lambda: git.get_files_log(source)["log"]["logentry"])
+    assert commits_since(github_server)[1].startswith("2019-12-31T22:00:00")
+    assert len(incremental["analysed commits"]) == len(shas) + 1
+
+    # The commits connect the same committers as a full analysis
+    log = git.get_files_log(source)["log"]["logentry"]
+    full = git.git_repo_analysis(
+        log, nx.MultiDiGraph(), session=github_analysis.GitHubSession())
+    assert commit_edges(graph) == commit_edges(full)
+    assert ("dave", "alice") in set(
+        (u, v) for u, v, node in commit_edges(graph))
+
+
+def test_rate_limit_of_repo_analysis():
+    # The API calls are throttled, not the parsing of the log dates
+    assert hasattr(github_analysis.repo_analysis, "__wrapped__")
+    assert not hasattr(github_analysis.parse_date, "__wrapped__")
+    assert not hasattr(github_analysis.utc_date, "__wrapped__")
+
+
+def test_save_compact_incremental_analysis(tmp_path):
+    filename = str(tmp_path / "graph.graphml")
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    graph = utils.compact_graph(nx.MultiDiGraph())
+    for key, (u, v) in enumerate([("a", "b"), ("b", "a"), ("a", "b")]):
+        utils.add_interaction(
+            graph, u, v, key=key, type="commit", node="n%d" % key,
+            start=start + datetime.timedelta(days=key), endopen=2026)
+
+    # The interactions in the edge store are saved and loaded as edges
+    github_analysis.save_incremental_analysis(
+        graph, {"watermarks": {}}, filename)
+    loaded, incremental = github_analysis.load_incremental_analysis(
+        filename, github_analysis.GitHubSession())
+    assert sorted(loaded.edges(keys=True, data="node")) == [
+        ("a", "b", 0, "n0"), ("a", "b", 2, "n2"), ("b", "a", 1, "n1")]
+    assert loaded["a"]["b"][2]["start"] == start + datetime.timedelta(days=2)
+    assert graph.number_of_edges() == 0
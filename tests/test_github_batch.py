@@ -0,0 +1,90 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import networkx as nx
+from github import Github
+
+from platform_analysis import git
+from platform_analysis import github_analysis
+from platform_analysis import github_batch
+
+from test_git import commit, make_repository
+from test_github_collection import user
+
+
+def set_repository(server, name, source):
+    """
+    Add a repository of o, with its git repository at source, to the
+    routes of the stand-in GitHub API.
+    """
+
+    path = "/repos/o/" + name
+    server.routes[path] = {
+        "name": name, "full_name": "o/" + name, "has_issues": True,
+        "owner": user(server, "o"), "url": server.url + path,
+        "clone_url": "file://" + source,
+        "created_at": "2019-01-01T00:00:00Z"}
+    for resource in ("stargazers", "contributors"):
+        server.routes[path + "/" + resource] = [user(server, name + "-fan")]
+    for resource in ("collaborators", "watchers", "subscribers", "commits",
+                     "comments", "forks", "issues", "pulls"):
+        server.routes[path + "/" + resource] = []
+
+
+def interactions(graph, repository=None):
+    """
+    Return the interactions of a graph, with the repository of each one.
+    """
+
+    return sorted(
+        (u, v, data["type"], str(data.get("node")),
+         data.get("repository", repository))
+        for u, v, data in graph.edges(data=True))
+
+
+def test_batch_like_sequential(github_server, tmp_path):
+    sources = {
+        "r1": make_repository(str(tmp_path / "r1")),
+        "r2": make_repository(str(tmp_path / "r2"))}
+    commit(sources["r2"], "dave", "2020-01-05T10:00:00+00:00", ["a", "d"])
+    github_server.routes["/users/o"] = user(github_server, "o")
+    for name in sources:
+        set_repository(github_server, name, sources[name])
+
+    # Each repository analysed in turn, in a single thread
+    client = Github(base_url=github_server.url)
+    expected = []
+    for name in sorted(sources):
+        repository = client.get_repo("o/" + name)
+        session = github_analysis.GitHubSession(client=client)
+        graph = nx.MultiDiGraph()
+        github_analysis.repo_analysis(
+            repository, str(tmp_path), graph, session=session,
+            git_files_log=git.get_files_log(sources[name])["log"]["logentry"])
+        github_analysis.fork_analysis(repository, graph, session=session)
+        github_analysis.pull_requests_analysis(
+            repository, graph, session=session)
+        github_analysis.clean_graph(graph)
+        expected.extend(interactions(graph, "o/" + name))
+
+    # The same interactions from the pools of processes and threads
+    work_path = tmp_path / "work"
+    work_path.mkdir()
+    result = github_batch.github_batch_analysis(
+        "o", "x", "y", str(work_path), repositories=sorted(sources),
+        max_processes=2, max_threads=2, base_url=github_server.url,
+        clone_cache_path=str(tmp_path / "cache"))
+    assert interactions(result["graph"]) == sorted(expected)
+    assert sorted(result["graphs"]) == ["o/r1", "o/r2"]
+    assert set(result["timing"]["o/r2"]) == {"git", "analysis"}
+    assert result["graph"].nodes["r1-fan"]["stargazer"] == "Yes"
+    assert "dave" in result["graphs"]["o/r2"]
+    assert "dave" not in result["graphs"]["o/r1"]
+    assert ("alice", "bob", "commit", "o/r1") in set(
+        (u, v, t, r) for u, v, t, n, r in expected)
@@ -0,0 +1,49 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+from concurrent.futures import ThreadPoolExecutor
+
+from github import Github
+
+from platform_analysis import github_cache
+
+
+def set_repositories(server, repositories):
+    for i in range(repositories):
+        server.routes["/repos/o/r%d" % i] = {
+            "name": "r%d" % i, "full_name": "o/r%d" % i,
+            "url": server.url + "/repos/o/r%d" % i}
+
+
+def test_revalidate_concurrently(github_server, tmp_path):
+    set_repositories(github_server, 40)
+    github_server.etags = True
+    client = Github(base_url=github_server.url)
+    cache = github_cache.install(str(tmp_path / "cache.sqlite"), client)
+    names = ["o/r%d" % i for i in range(40)]
+
+    def full_names():
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return list(executor.map(
+                lambda name: client.get_repo(name).full_name, names))
+
+    try:
+        # The first requests store the responses, the next ones revalidate
+        # them: each thread reads the cached response of its own request
+        assert full_names() == names
+        assert cache.metrics() == {"hits": 0, "misses": 40}
+        assert full_names() == names
+        assert cache.metrics() == {"hits": 40, "misses": 40}
+        assert github_server.not_modified == 40
+    finally:
+        github_cache.uninstall(client, cache)
+
+    # Without the cache, the responses are downloaded again
+    assert client.get_repo("o/r0").full_name == "o/r0"
+    assert github_server.not_modified == 40
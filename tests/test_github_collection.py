@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+from github import Github
+
+from platform_analysis import github_collection
+
+
+def user(server, login):
+    return {"login": login, "id": len(login), "type": "User",
+            "url": server.url + "/users/" + login}
+
+
+def element(server, kind, number):
+    path = "/repos/o/r/%s/%d" % (kind, number)
+    return {"number": number, "id": number, "title": "t",
+            "user": user(server, "u%d" % number), "url": server.url + path,
+            "comments_url": server.url + "/repos/o/r/issues/%d/comments" %
+            number,
+            "created_at": "2021-01-01T00:00:00Z"}
+
+
+def set_repository(server):
+    server.routes["/repos/o/r"] = {
+        "name": "r", "full_name": "o/r", "has_issues": True,
+        "owner": user(server, "o"), "url": server.url + "/repos/o/r"}
+    for resource in ("stargazers", "collaborators", "contributors",
+                     "watchers", "subscribers"):
+        server.routes["/repos/o/r/" + resource] = [
+            user(server, resource + "1"), user(server, resource + "2")]
+    for resource in ("commits", "comments", "forks"):
+        server.routes["/repos/o/r/" + resource] = []
+    server.routes["/repos/o/r/pulls"] = [
+        element(server, "pulls", 1), element(server, "pulls", 2)]
+    server.routes["/repos/o/r/issues"] = [element(server, "issues", 3)]
+    comment = {"id": 1, "body": "hi", "user": user(server, "c"),
+               "created_at": "2021-01-01T00:00:00Z"}
+    for number in (1, 2):
+        server.routes["/repos/o/r/pulls/%d/merge" % number] = {}
+        server.routes["/repos/o/r/pulls/%d/comments" % number] = [comment]
+    server.routes["/repos/o/r/issues/3/comments"] = [comment]
+
+
+def test_collect_repository(github_server):
+    set_repository(github_server)
+    client = Github(base_url=github_server.url)
+    repository = client.get_repo("o/r")
+
+    budget = github_collection.RateBudget()
+    collected = github_collection.collect_repository(
+        repository, client, max_workers=4, budget=budget)
+
+    # The analysis reads the prefetched resources without new requests
+    requests = len(github_server.requests)
+    assert [u.login for u in collected.get_stargazers()] == \
+        ["stargazers1", "stargazers2"]
+    assert [i.number for i in collected.get_pulls(state="closed")] == [1, 2]
+    assert [i.number for i in collected.get_issues(state="all")] == [3]
+    for issue in collected.get_issues(state="all"):
+        assert [c.body for c in issue.get_comments()] == ["hi"]
+    assert collected.full_name == "o/r"
+    assert len(github_server.requests) == requests
+    assert budget.metrics()["requests"] > 0
+
+
+def test_budget_without_rate_headers(github_server):
+    set_repository(github_server)
+    github_server.rate_headers = False
+    client = Github(base_url=github_server.url)
+
+    # The budget is not updated, and the quota is never requested
+    budget = github_collection.RateBudget(calls=10, period=10)
+    github_collection.fetch_call(
+        lambda: client.get_repo("o/r"), client, budget)
+    assert ("GET", "/rate_limit") not in github_server.requests
+    assert budget.rate == 1.0
@@ -0,0 +1,68 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import os
+import json
+
+from github import Github
+
+from platform_analysis import github_graphql
+
+
+# The responses of the GraphQL API for a repository with a pull request,
+# whose review threads and their comments span two pages, and an issue
+recorded_path = os.path.join(
+    os.path.dirname(__file__), "fixtures", "github_graphql_pulls.json")
+
+
+def recorded_graphql(recorded):
+    """
+    Answer each GraphQL query with its recorded response.
+    """
+
+    def graphql(request):
+        variables = request["variables"]
+        if "states" in variables:
+            return recorded["pullRequests " + variables["states"][0]]
+        if "id" in variables:
+            return recorded[variables["id"] + " " + variables["after"]]
+        return recorded["issues"]
+
+    return graphql
+
+
+def test_collect_repository(github_server):
+    with open(recorded_path) as recorded_file:
+        github_server.graphql = recorded_graphql(json.load(recorded_file))
+    github_server.routes["/repos/o/r"] = {
+        "name": "r", "full_name": "o/r", "has_issues": True,
+        "owner": {"login": "o", "url": github_server.url + "/users/o"},
+        "url": github_server.url + "/repos/o/r"}
+    client = Github(base_url=github_server.url)
+    repository = client.get_repo("o/r")
+
+    collected = github_graphql.collect_repository(repository, client)
+
+    # Review comments from both the pages of the threads and of their
+    # comments
+    pulls = collected.get_pulls(state="closed")
+    assert len(pulls) == 1
+    assert [c.body for c in pulls[0].get_comments()] == \
+        ["Rename this?", "Done.", "Fixed the typo."]
+    assert pulls[0].is_merged() is True
+    assert pulls[0].merged_by.login == "bob"
+    assert collected.get_pulls(state="open") == []
+
+    # Pull requests are also issues, and deleted users are ghosts
+    issues = collected.get_issues(state="all")
+    assert [i.id for i in issues] == [101, 102]
+    assert [c.body for c in issues[0].get_comments()] == \
+        ["Looks good to me."]
+    assert issues[1].user.login == "ghost"
+    assert github_server.requests.count(("POST", "/graphql")) == 5
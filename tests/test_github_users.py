@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+from github import Github
+
+from platform_analysis import github_collection
+from platform_analysis.github_users import UserDirectory
+
+
+def test_fetch_batch_with_missing_users(github_server):
+    # GitHub does not find ghost, and fails to return carol
+    github_server.graphql = lambda request: {
+        "data": {
+            "u0": {"login": "alice", "email": "alice@example.com",
+                   "avatarUrl": "https://example.com/alice"},
+            "u1": None,
+            "u2": None
+        },
+        "errors": [{
+            "type": "NOT_FOUND", "path": ["u1"],
+            "message": "Could not resolve to a User with the login of "
+                       "'ghost'."
+        }]
+    }
+    github_server.routes["/users/carol"] = {
+        "login": "carol", "email": "carol@example.com",
+        "avatar_url": "https://example.com/carol",
+        "url": github_server.url + "/users/carol"}
+    client = Github(base_url=github_server.url)
+
+    directory = UserDirectory()
+    profiles = directory.fetch_batch(
+        ["alice", "ghost", "carol"], client, github_collection.RateBudget())
+
+    assert profiles == [
+        {"login": "alice", "email": "alice@example.com",
+         "avatar_url": "https://example.com/alice"},
+        {"login": "ghost", "email": None, "avatar_url": None},
+        {"login": "carol", "email": "carol@example.com",
+         "avatar_url": "https://example.com/carol"}]
+    assert github_server.requests == [
+        ("POST", "/graphql"), ("GET", "/users/carol")]
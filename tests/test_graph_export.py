@@ -0,0 +1,133 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import datetime
+
+import networkx as nx
+import pytest
+
+from platform_analysis import graph_export
+from platform_analysis import sna
+from platform_analysis import utils
+
+from test_utils import add_interactions, random_interactions
+
+
+def sample_graph():
+    """
+    Return a graph with attributes of each type, and text to escape.
+    """
+
+    graph = nx.MultiDiGraph(name="sample", year=2026)
+    graph.add_node("alice", committer="Yes", Label="Alice <a&b>", score=1.5)
+    graph.add_node("bob \"b\"", committer="No", Label="Bob", score=2.0)
+    graph.add_node(3, committer="No", Label="3", score=0.5)
+    start = datetime.datetime(2020, 1, 1, 10, 0, tzinfo=datetime.timezone.utc)
+    graph.add_edge("alice", "bob \"b\"", key=0, type="commit", node="n0",
+                   msg="fix <b> & 'c'\x01", start=start, endopen=2026,
+                   merged=True, weight=2)
+    graph.add_edge("bob \"b\"", "alice", key=1, type="star", node="n1",
+                   msg="", start=start, endopen=2026, merged=False, weight=1)
+    graph.add_edge("alice", "alice", key=2, type="commit", node="n2",
+                   msg="self", start=start, endopen=2026, merged=False,
+                   weight=1)
+    graph.add_edge(3, "alice", key=3, type="fork", node="n3", msg="x",
+                   start=start, endopen=2026, merged=True, weight=1)
+
+    return graph
+
+
+def exported_copy(graph, self_loops=True):
+    """
+    Copy a graph with the values that the writers export as text (the
+    dates and the invalid characters), for the writers of NetworkX.
+    """
+
+    copy = nx.MultiDiGraph()
+    copy.graph.update(graph.graph)
+    for n, attr in graph.nodes(data=True):
+        copy.add_node(graph_export.export_value(n)[1], **attr)
+    for u, v, key, attr in utils.graph_edges(graph, keys=True, data=True):
+        if self_loops is False and u == v:
+            continue
+        attr = {k: value if type(value) in graph_export.graphml_types
+                else graph_export.export_value(value)[1]
+                for k, value in attr.items()}
+        attr["msg"] = graph_export.export_value(attr["msg"])[1]
+        copy.add_edge(graph_export.export_value(u)[1],
+                      graph_export.export_value(v)[1], key=key, **attr)
+
+    return copy
+
+
+def read_back(filename, reader):
+    """
+    Read an exported graph, with its nodes and edges in a sorted order.
+    """
+
+    graph = reader(filename)
+    return (graph.graph, sorted(graph.nodes(data=True)),
+            sorted((u, v, k, sorted(d.items()))
+                   for u, v, k, d in graph.edges(keys=True, data=True)))
+
+
+@pytest.mark.parametrize("self_loops", [True, False])
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_write_graphml_like_networkx(tmp_path, self_loops, suffix):
+    graph = sample_graph()
+    streamed = str(tmp_path / ("streamed.graphml" + suffix))
+    expected = str(tmp_path / "networkx.graphml")
+
+    # The streamed GraphML is read like the one written by NetworkX
+    graph_export.write_graphml(graph, streamed, self_loops=self_loops)
+    nx.write_graphml(exported_copy(graph, self_loops), expected)
+
+    def reader(filename):
+        return nx.read_graphml(filename, force_multigraph=True)
+
+    assert read_back(streamed, reader) == read_back(expected, reader)
+    assert len(read_back(streamed, reader)[2]) == (4 if self_loops else 3)
+
+
+def test_write_gexf_like_networkx(tmp_path):
+    graph = sample_graph()
+    streamed = str(tmp_path / "streamed.gexf")
+    graph_export.write_gexf(graph, streamed)
+
+    # The users with their labels, and the edges with their weights
+    read = nx.read_gexf(streamed)
+    assert sorted(read.nodes(data="label")) == [
+        ("3", "3"), ("alice", "Alice <a&b>"), ("bob \"b\"", "Bob")]
+    assert read.nodes["alice"]["score"] == 1.5
+    assert sorted((u, v, d["weight"], d["type"], d["merged"])
+                  for u, v, d in read.edges(data=True)) == [
+        ("3", "alice", 1, "fork", True),
+        ("alice", "alice", 1, "commit", False),
+        ("alice", "bob \"b\"", 2, "commit", True),
+        ("bob \"b\"", "alice", 1, "star", False)]
+
+
+def test_save_compact_graph(tmp_path):
+    interactions = random_interactions(100)
+    plain = add_interactions(nx.MultiDiGraph(), interactions)
+    compact = add_interactions(
+        utils.compact_graph(nx.MultiDiGraph()), interactions)
+
+    # The interactions in the edge store are written too, with their
+    # dates as strings
+    sna.save_graph(compact, str(tmp_path / "compact.graphml"), True)
+    sna.save_graph(plain, str(tmp_path / "plain.graphml"), True)
+
+    def reader(filename):
+        return nx.read_graphml(filename, force_multigraph=True)
+
+    assert read_back(str(tmp_path / "compact.graphml"), reader) == \
+        read_back(str(tmp_path / "plain.graphml"), reader)
+    assert len(reader(str(tmp_path / "compact.graphml")).edges()) == 100
+    assert compact.number_of_edges() == 0
@@ -0,0 +1,142 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import os
+import shutil
+import subprocess
+
+import networkx as nx
+import pytest
+
+from platform_analysis import hg
+from platform_analysis import github_analysis
+
+
+# The hg command is an optional dependency
+pytestmark = pytest.mark.skipif(
+    shutil.which("hg") is None, reason="hg is not installed")
+
+
+def commit(repository, author, date, files, message):
+    """
+    Commit a line to each of the files of a repository, as author at date.
+    """
+
+    for each_file in files:
+        with open(os.path.join(repository, each_file), "a") as f:
+            f.write(author + "\n")
+    subprocess.check_output(
+        ["hg", "commit", "--quiet", "--addremove", "-u",
+         "%s <%s@x>" % (author, author), "-d", date, "-m", message],
+        cwd=repository)
+
+
+def make_repository(path):
+    """
+    Create an hg repository with a few authors sharing a few files, and a
+    renamed file.
+    """
+
+    os.makedirs(path)
+    subprocess.check_output(["hg", "init", "--quiet"], cwd=path)
+    commit(path, "alice", "2020-01-01 10:00 +0000", ["a", "b"], "first")
+    commit(path, "bob", "2020-01-02 10:00 +0200", ["a"], "second")
+    subprocess.check_output(["hg", "mv", "--quiet", "a", "e"], cwd=path)
+    commit(path, "carol", "2020-01-03 10:00 -0500", ["e", "b"], "rename")
+    commit(path, "alice", "2020-01-04 10:00 +0000", ["e"], "fourth")
+
+    return path
+
+
+def commits_of(path):
+    """
+    Return the commits of the whole xml log of an hg repository, parsed at
+    once, from the newest to the oldest one.
+    """
+
+    entries = hg.get_log(path)["log"]["logentry"]
+    if not isinstance(entries, list):
+        entries = [entries]
+
+    return [(e["@node"], e["@revision"], e["author"]["#text"],
+             e["author"]["@email"], e["date"], e["msg"]["#text"])
+            for e in entries]
+
+
+def interactions(graph):
+    """
+    Return the interactions of a graph, once each.
+    """
+
+    return set(
+        (u, v, data["node"], data["start"])
+        for u, v, data in graph.edges(data=True))
+
+
+def test_streamed_log(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+
+    # The streamed log has the commits of the whole log
+    commits = list(hg.iter_log(source))
+    assert [(c["@node"], c["@revision"], c["author"]["#text"],
+             c["author"]["@email"], c["date"], c["msg"])
+            for c in commits] == commits_of(source)
+
+    # With the files changed by each commit as git actions
+    assert [c["files"] for c in commits] == [
+        [{"@action": "M", "#text": "e"}],
+        [{"@action": "R", "#text": "e", "@copyfrom-path": "a"},
+         {"@action": "M", "#text": "b"}],
+        [{"@action": "M", "#text": "a"}],
+        [{"@action": "A", "#text": "a"}, {"@action": "A", "#text": "b"}]]
+
+
+def test_files_log(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+
+    # The renamed file has the history of its previous name
+    files_log = hg.get_files_log(source)["log"]["logentry"]
+    assert {f: [c["author"]["#text"] for c in files_log[f]]
+            for f in files_log} == {
+        "e": ["alice", "carol", "bob", "alice"],
+        "a": ["carol", "bob", "alice"],
+        "b": ["carol", "alice"]}
+
+    # Or only the commits of a revision range
+    files_log = hg.get_files_log(source, revisions="1:2")["log"]["logentry"]
+    assert {f: [c["author"]["#text"] for c in files_log[f]]
+            for f in files_log} == {
+        "e": ["carol", "bob"], "a": ["carol", "bob"], "b": ["carol"]}
+
+
+def test_local_analysis_like_files_history(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+
+    # The commits analysed while the log is read connect the same
+    # committers as the history of each file
+    streamed = hg.hg_local_repo_analysis(
+        source, nx.MultiDiGraph(), session=github_analysis.GitHubSession())
+    files_log = hg.get_files_log(source)["log"]["logentry"]
+    history = hg.hg_repo_analysis(
+        files_log, nx.MultiDiGraph(),
+        session=github_analysis.GitHubSession())
+    assert interactions(streamed) == interactions(history)
+    assert sorted(set((u, v) for u, v in streamed.edges())) == [
+        ("alice", "alice"), ("alice", "bob"), ("alice", "carol"),
+        ("bob", "alice"), ("bob", "carol"), ("carol", "alice")]
+
+
+def test_local_analysis_of_revisions(tmp_path):
+    source = make_repository(str(tmp_path / "source"))
+
+    # Only the commits of the range are connected
+    graph = hg.hg_local_repo_analysis(
+        source, nx.MultiDiGraph(), session=github_analysis.GitHubSession(),
+        revisions="1:2")
+    assert sorted((u, v) for u, v in graph.edges()) == [("bob", "carol")]
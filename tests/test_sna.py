@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import datetime
+
+import networkx as nx
+import pytest
+
+from platform_analysis import sna
+from platform_analysis import utils
+
+from test_utils import add_interactions, random_interactions
+
+
+def offset(hours):
+    return datetime.timezone(datetime.timedelta(hours=hours))
+
+
+def sample_graph():
+    """
+    Return a graph with users, and interactions with starts in different
+    UTC offsets, naive, None or missing.
+    """
+
+    graph = nx.MultiDiGraph(name="sample")
+    graph.add_node("alice", committer="Yes", email="alice@example.com")
+    graph.add_node("bob", committer="No", email=None)
+    starts = [
+        datetime.datetime(2020, 1, 1, 10, 0, tzinfo=offset(2)),
+        datetime.datetime(2020, 1, 2, 10, 0, 0, 123456, tzinfo=offset(-5)),
+        datetime.datetime(2020, 1, 3, 10, 0, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2020, 1, 4, 10, 0),
+        None]
+    for key, start in enumerate(starts):
+        graph.add_edge("alice", "bob", key=key, type="commit", start=start,
+                       node="n%d" % key, endopen=2026)
+    graph.add_edge("bob", "alice", key="star", type="star")
+
+    return graph
+
+
+def ordered(edges):
+    return sorted(edges, key=lambda edge: tuple(str(i) for i in edge[:3]))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_graph_columns_round_trip(tmp_path, mmap):
+    graph = sample_graph()
+    sna.save_graph_columns(graph, str(tmp_path / "graph"))
+    loaded = sna.load_graph_columns(str(tmp_path / "graph"), mmap=mmap)
+
+    # The same graph, users and interactions
+    assert loaded.graph["name"] == "sample"
+    assert dict(loaded.nodes(data=True)) == dict(graph.nodes(data=True))
+    loaded_edges = ordered(utils.graph_edges(loaded, keys=True, data=True))
+    assert loaded_edges == ordered(graph.edges(keys=True, data=True))
+
+    # The starts keep their UTC offset, or stay naive
+    for u, v, key, data in loaded_edges:
+        start = graph[u][v][key].get("start")
+        if start is not None:
+            assert data["start"].utcoffset() == start.utcoffset()
+
+    # And the loaded graph grows like the original one
+    utils.add_interaction(loaded, "bob", "alice", key=9, type="commit",
+                          start=datetime.datetime(2021, 1, 1))
+    graph.add_edge("bob", "alice", key=9, type="commit",
+                   start=datetime.datetime(2021, 1, 1))
+    assert ordered(utils.graph_edges(loaded, keys=True, data=True)) == \
+        ordered(graph.edges(keys=True, data=True))
+
+
+def test_compact_and_aggregated_round_trip(tmp_path):
+    interactions = random_interactions(200)
+    compact = add_interactions(
+        utils.compact_graph(nx.MultiDiGraph()), interactions)
+    aggregated = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph(), timestamps=True),
+        interactions)
+
+    for name, graph in [("compact", compact), ("aggregated", aggregated)]:
+        sna.save_graph_columns(graph, str(tmp_path / name))
+        loaded = sna.load_graph_columns(str(tmp_path / name))
+        assert ordered(utils.graph_edges(loaded, keys=True, data=True)) == \
+            ordered(utils.graph_edges(graph, keys=True, data=True))
+        assert loaded.graph.get("aggregate") == \
+            graph.graph.get("aggregate")
+
+
+def window_graph(interactions, start, end):
+    """
+    Build the weighted DiGraph of the interactions between start and end.
+    """
+
+    graph = nx.DiGraph()
+    for u, v, attributes in interactions:
+        if start <= attributes["start"] < end:
+            if graph.has_edge(u, v):
+                graph[u][v]["weight"] += 1
+            else:
+                graph.add_edge(u, v, weight=1)
+
+    return graph
+
+
+@pytest.mark.parametrize("freq,periods", [("D", 1), ("W", 2), ("MS", 1)])
+def test_snapshots_like_window_graphs(freq, periods):
+    interactions = random_interactions(300)
+    graph = add_interactions(nx.MultiDiGraph(), interactions)
+    metrics = ("nodes", "edges", "interactions", "degree", "density",
+               "clustering")
+
+    # Each snapshot has the metrics of the graph of its window
+    snapshots = sna.network_snapshots(
+        graph, freq=freq, periods=periods, metrics=metrics)
+    if periods == 1:
+        assert sum(s["interactions"] for s in snapshots) == 300
+    for snapshot in snapshots:
+        expected = window_graph(
+            interactions, snapshot["start"], snapshot["end"])
+        assert snapshot["nodes"] == expected.number_of_nodes()
+        assert snapshot["edges"] == expected.number_of_edges()
+        assert snapshot["interactions"] == int(expected.size("weight"))
+        assert snapshot["degree"] == dict(expected.degree(weight="weight"))
+        assert snapshot["density"] == pytest.approx(nx.density(expected))
+        assert snapshot["clustering"] == pytest.approx(
+            nx.clustering(expected))
+
+    # The same snapshots from a pool of processes, and from the compact
+    # and aggregated graphs of the same interactions
+    assert sna.network_snapshots(
+        graph, freq=freq, periods=periods, metrics=metrics,
+        max_workers=2) == snapshots
+    compact = add_interactions(
+        utils.compact_graph(nx.MultiDiGraph()), interactions)
+    assert sna.network_snapshots(
+        compact, freq=freq, periods=periods, metrics=metrics) == snapshots
+    aggregated = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph(), timestamps=True),
+        interactions)
+    assert sna.network_snapshots(
+        aggregated, freq=freq, periods=periods, metrics=metrics) == snapshots
+
+
+def test_snapshots_of_aggregated_graph_without_timestamps():
+    aggregated = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph()), random_interactions(10))
+
+    # The starts of the interactions of the weighted edges are unknown
+    with pytest.raises(ValueError):
+        sna.network_snapshots(aggregated)
@@ -0,0 +1,168 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import os
+import shutil
+import subprocess
+
+import networkx as nx
+import pytest
+import xmltodict
+
+from platform_analysis import svn
+from platform_analysis import utils
+from platform_analysis import github_analysis
+
+
+# The log of a svn repository with a few authors sharing a few files, and
+# a renamed file, from svn log --xml -v
+recorded_path = os.path.join(
+    os.path.dirname(__file__), "fixtures", "svn_log.xml")
+
+# The svn commands are needed to create and read the repositories
+needs_svn = pytest.mark.skipif(
+    shutil.which("svn") is None or shutil.which("svnadmin") is None,
+    reason="svn is not installed")
+
+
+def commits_of(log):
+    """
+    Return the commits of a whole xml log of svn, parsed at once.
+    """
+
+    entries = log["log"]["logentry"]
+    if not isinstance(entries, list):
+        entries = [entries]
+
+    return [(e["@revision"], e.get("author", ""), e["date"], e["msg"])
+            for e in entries]
+
+
+def interactions(graph):
+    """
+    Return the interactions of a graph, once each.
+    """
+
+    return set(
+        (u, v, data["node"], data["start"])
+        for u, v, data in graph.edges(data=True))
+
+
+def test_streamed_recorded_log(tmp_path):
+    # The streamed log has the commits of the whole log
+    commits = list(utils.iter_xml_log(
+        ["cat", recorded_path], str(tmp_path), svn.parse_log_entry))
+    with open(recorded_path, "rb") as recorded_file:
+        log = xmltodict.parse(recorded_file)
+    assert [(c["@revision"], c["author"]["#text"], c["date"], c["msg"])
+            for c in commits] == commits_of(log)
+
+    # With the files changed by each commit as git actions
+    assert [c["files"] for c in commits] == [
+        [{"@action": "M", "#text": "/trunk/e"}],
+        [{"@action": "M", "#text": "/trunk/b"},
+         {"@action": "R", "#text": "/trunk/e",
+          "@copyfrom-path": "/trunk/a"}],
+        [{"@action": "M", "#text": "/trunk/a"}],
+        [{"@action": "A", "#text": "/trunk/a"},
+         {"@action": "A", "#text": "/trunk/b"}]]
+
+    # The streamed commits connect the same committers as the history of
+    # each file
+    streamed = utils.commits_analysis(
+        reversed(commits), nx.MultiDiGraph(), github_analysis.GitHubSession())
+    files_log = utils.build_files_history(commits)
+    history = svn.svn_repo_analysis(
+        files_log, nx.MultiDiGraph(),
+        session=github_analysis.GitHubSession())
+    assert interactions(streamed) == interactions(history)
+
+
+def commit(working_copy, author, files, message):
+    """
+    Commit a line to each of the files of a working copy, as author.
+    """
+
+    for each_file in files:
+        each_path = os.path.join(working_copy, each_file)
+        new_file = not os.path.exists(each_path)
+        with open(each_path, "a") as f:
+            f.write(author + "\n")
+        if new_file:
+            subprocess.check_output(
+                ["svn", "add", "--quiet", each_file], cwd=working_copy)
+    subprocess.check_output(
+        ["svn", "commit", "--quiet", "--username", author, "-m", message],
+        cwd=working_copy)
+    subprocess.check_output(["svn", "update", "--quiet"], cwd=working_copy)
+
+
+def make_working_copy(path):
+    """
+    Create a svn repository with a few authors sharing a few files, and a
+    renamed file, and return its working copy.
+    """
+
+    repository = os.path.join(path, "repository")
+    working_copy = os.path.join(path, "working_copy")
+    subprocess.check_output(["svnadmin", "create", repository])
+    subprocess.check_output(
+        ["svn", "checkout", "--quiet", "file://" + repository,
+         working_copy])
+    commit(working_copy, "alice", ["a", "b"], "first")
+    commit(working_copy, "bob", ["a"], "second")
+    subprocess.check_output(
+        ["svn", "move", "--quiet", "a", "e"], cwd=working_copy)
+    commit(working_copy, "carol", ["e", "b"], "rename")
+    commit(working_copy, "alice", ["e"], "fourth")
+
+    return working_copy
+
+
+@needs_svn
+def test_streamed_log(tmp_path):
+    working_copy = make_working_copy(str(tmp_path))
+
+    # The streamed log has the commits of the whole log
+    commits = list(svn.iter_log(working_copy))
+    assert [(c["@revision"], c["author"]["#text"], c["date"], c["msg"])
+            for c in commits] == commits_of(svn.get_log(working_copy))
+    assert [c["author"]["#text"] for c in commits] == \
+        ["alice", "carol", "bob", "alice"]
+
+    # And in order, even for a revision range
+    assert [c["@revision"] for c in svn.iter_log_in_order(working_copy)] \
+        == ["1", "2", "3", "4"]
+    assert [c["@revision"] for c in svn.iter_log_in_order(
+        working_copy, "3:2", reverse=True)] == ["3", "2"]
+
+
+@needs_svn
+def test_local_analysis_like_files_history(tmp_path):
+    working_copy = make_working_copy(str(tmp_path))
+
+    # The commits analysed while the log is read connect the same
+    # committers as the history of each file
+    streamed = svn.svn_local_repo_analysis(
+        working_copy, nx.MultiDiGraph(),
+        session=github_analysis.GitHubSession())
+    files_log = svn.get_files_log(working_copy)["log"]["logentry"]
+    history = svn.svn_repo_analysis(
+        files_log, nx.MultiDiGraph(),
+        session=github_analysis.GitHubSession())
+    assert interactions(streamed) == interactions(history)
+    assert sorted(set((u, v) for u, v in streamed.edges())) == [
+        ("alice", "alice"), ("alice", "bob"), ("alice", "carol"),
+        ("bob", "alice"), ("bob", "carol"), ("carol", "alice")]
+
+    # Or only the commits of a revision range
+    graph = svn.svn_local_repo_analysis(
+        working_copy, nx.MultiDiGraph(),
+        session=github_analysis.GitHubSession(), revisions="2:3")
+    assert sorted((u, v) for u, v in graph.edges()) == [("bob", "carol")]
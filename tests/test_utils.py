@@ -0,0 +1,89 @@
+# -*- encoding: utf-8 -*-
+#
+# Social Network Analysis of Git, Hg, SVN, GitHub, BitBucket repositories
+#
+# Author: Massimo Menichinelli
+# Homepage: http://www.openp2pdesign.org
+# License: LGPL v.3
+#
+
+import datetime
+import random
+from collections import Counter
+
+import networkx as nx
+
+from platform_analysis import utils
+
+
+def random_interactions(count, seed=0):
+    """
+    Return count random interactions among a few users, as the source,
+    target and attributes of each one.
+    """
+
+    generator = random.Random(seed)
+    first_date = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        (generator.choice("abcd"), generator.choice("abcd"), {
+            "type": generator.choice(["commit", "issue comment"]),
+            "start": first_date + datetime.timedelta(
+                hours=generator.randrange(1000)),
+            "endopen": 2026})
+        for i in range(count)]
+
+
+def add_interactions(graph, interactions):
+    for key, (source, target, attributes) in enumerate(interactions):
+        utils.add_interaction(graph, source, target, key=key, **attributes)
+
+    return graph
+
+
+def test_aggregated_weights():
+    interactions = random_interactions(500)
+    plain = add_interactions(nx.MultiDiGraph(), interactions)
+    aggregated = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph(), timestamps=True),
+        interactions)
+
+    # One weighted edge for each source, target and type, weighted by the
+    # count of its interactions, from the first start to the last one
+    starts = {}
+    for u, v, data in plain.edges(data=True):
+        starts.setdefault((u, v, data["type"]), []).append(data["start"])
+    assert len(plain.edges()) == 500
+    assert len(aggregated.edges()) == len(starts)
+    for u, v, key, data in aggregated.edges(keys=True, data=True):
+        edge_starts = starts[(u, v, key)]
+        assert data["weight"] == len(edge_starts)
+        assert data["start"] == min(edge_starts)
+        assert data["last"] == max(edge_starts)
+        assert sorted(data["timestamps"]) == sorted(
+            s.timestamp() for s in edge_starts)
+
+
+def test_merge_aggregated_graphs():
+    interactions = random_interactions(300)
+
+    # Merging the weighted edges of two halves gives the weighted edges of
+    # the whole
+    first = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph(), timestamps=True),
+        interactions[:150])
+    second = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph(), timestamps=True),
+        interactions[150:])
+    whole = add_interactions(
+        utils.aggregate_graph(nx.MultiDiGraph(), timestamps=True),
+        interactions)
+    merged = utils.merge_graph(second, first)
+    assert Counter({(u, v, k): d["weight"]
+                    for u, v, k, d in merged.edges(keys=True, data=True)}) \
+        == Counter({(u, v, k): d["weight"]
+                    for u, v, k, d in whole.edges(keys=True, data=True)})
+    for u, v, key, data in merged.edges(keys=True, data=True):
+        assert data["start"] == whole[u][v][key]["start"]
+        assert data["last"] == whole[u][v][key]["last"]
+        assert sorted(data["timestamps"]) == \
+            sorted(whole[u][v][key]["timestamps"])